@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                                PYMPF                                     ##
+##                                                                          ##
+##              Copyright (C) 2020,      Florian Schanda                    ##
+##                                                                          ##
+##  This file is part of PyMPF.                                             ##
+##                                                                          ##
+##  PyMPF is free software: you can redistribute it and/or modify           ##
+##  it under the terms of the GNU General Public License as published by    ##
+##  the Free Software Foundation, either version 3 of the License, or       ##
+##  (at your option) any later version.                                     ##
+##                                                                          ##
+##  PyMPF is distributed in the hope that it will be useful,                ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with PyMPF. If not, see <http://www.gnu.org/licenses/>.           ##
+##                                                                          ##
+##############################################################################
+
+# Benchmark suite for PyMPF. This times every operation in FP_OPS
+# over a number of formats, classes of operands, and all rounding
+# modes. Results are written as JSON, and can be compared against a
+# previous run to find regressions:
+#
+#    ./bench.py --output baseline.json
+#    (hack hack hack)
+#    ./bench.py --output new.json --compare baseline.json
+#
+# Everything is deterministic (given the seed) and runs offline.
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+
+import mpf_version
+from mpf.floats import *
+from mpf.rationals import Rational
+from mpf.bitvector import BitVector
+
+FORMATS = {
+    "Float16"  : (5, 11),
+    "Float32"  : (8, 24),
+    "Float64"  : (11, 53),
+    "Float128" : (15, 113),
+    "Wide_EB"  : (18, 24),   # wide exponent
+    "Wide_SB"  : (11, 256),
+}
+
+# Target formats for fp.cast, so that we have both widening and
+# narrowing conversions
+CAST_TARGET = {
+    "Float16"  : "Float32",
+    "Float32"  : "Float64",
+    "Float64"  : "Float32",
+    "Float128" : "Float64",
+    "Wide_EB"  : "Float32",
+    "Wide_SB"  : "Float64",
+}
+
+OPERAND_CLASSES = ("normal", "subnormal", "boundary", "exponent_gap")
+
+BV_WIDTH = 64
+
+##############################################################################
+# Operands
+##############################################################################
+
+def random_normal(rng, eb, sb, low_exp=None, high_exp=None):
+    rv = MPF(eb, sb)
+    low_exp  = 1 if low_exp is None else low_exp
+    high_exp = 2 ** rv.w - 2 if high_exp is None else high_exp
+    rv.pack(rng.randint(0, 1),
+            rng.randint(low_exp, high_exp),
+            rng.randint(0, 2 ** rv.t - 1))
+    return rv
+
+def random_subnormal(rng, eb, sb):
+    rv = MPF(eb, sb)
+    rv.pack(rng.randint(0, 1), 0, rng.randint(1, 2 ** rv.t - 1))
+    return rv
+
+def random_boundary(rng, eb, sb):
+    rv = MPF(eb, sb)
+    kind = rng.choice(("max_normal", "min_normal", "min_subnormal",
+                       "max_subnormal", "one", "after_one", "zero"))
+    sign = rng.randint(0, 1)
+    if kind == "max_normal":
+        rv.pack(sign, 2 ** rv.w - 2, 2 ** rv.t - 1)
+    elif kind == "min_normal":
+        rv.pack(sign, 1, 0)
+    elif kind == "min_subnormal":
+        rv.pack(sign, 0, 1)
+    elif kind == "max_subnormal":
+        rv.pack(sign, 0, 2 ** rv.t - 1)
+    elif kind == "one":
+        rv.pack(sign, rv.bias, 0)
+    elif kind == "after_one":
+        rv.pack(sign, rv.bias, 1)
+    else:
+        rv.set_zero(sign)
+    return rv
+
+def random_operands(rng, eb, sb, operand_class, arity):
+    """Random float operands of the given class"""
+    if operand_class == "normal":
+        return [random_normal(rng, eb, sb) for _ in range(arity)]
+    elif operand_class == "subnormal":
+        return [random_subnormal(rng, eb, sb) for _ in range(arity)]
+    elif operand_class == "boundary":
+        return [random_boundary(rng, eb, sb) for _ in range(arity)]
+    else:
+        assert operand_class == "exponent_gap"
+        # Alternate between the largest and smallest binades
+        max_exp = 2 ** (eb - 1) * 2 - 2
+        rv = []
+        for i in range(arity):
+            if i % 2 == 0:
+                rv.append(random_normal(rng, eb, sb, max_exp - 2, max_exp))
+            else:
+                rv.append(random_normal(rng, eb, sb, 1, 3))
+        return rv
+
+def arguments(rng, op, eb, sb, operand_class):
+    """Arguments (excluding the rounding mode) for *op*"""
+    floats = random_operands(rng, eb, sb, operand_class, op.arity)
+    if op.args_type == TYP_FLOAT:
+        return floats
+    elif op.args_type == TYP_REAL:
+        return [floats[0].to_rational() + Rational(1, 3)
+                if floats[0].isFinite()
+                else Rational(1, 3)]
+    elif op.args_type == TYP_INT:
+        return [rng.randint(-2 ** BV_WIDTH, 2 ** BV_WIDTH)]
+    else:
+        assert op.args_type == TYP_BV
+        return [BitVector(BV_WIDTH, rng.randint(0, 2 ** BV_WIDTH - 1))]
+
+def sample(rng, op_name, fmt, operand_class):
+    """All arguments (excluding the rounding mode) for *op_name*"""
+    op = FP_OPS[op_name]
+    eb, sb = FORMATS[fmt]
+    args = arguments(rng, op, eb, sb, operand_class)
+    if op_name == "fp.from.binary":
+        args = [eb, sb, BitVector(eb + sb, rng.getrandbits(eb + sb))]
+    elif op_name == "fp.cast":
+        args = list(FORMATS[CAST_TARGET[fmt]]) + args
+    elif op.precision_arg:
+        args = [eb, sb] + args
+    elif op.result_type == TYP_BV:
+        args = args + [BV_WIDTH]
+    return args
+
+##############################################################################
+# Running
+##############################################################################
+
+def benchmark(op_name, fmt, operand_class, rm, options):
+    """Time one combination, returns ns per operation"""
+    op = FP_OPS[op_name]
+    if not op.rm_arg:
+        rm = None
+
+    # Seed from the name of the benchmark, so that results do not
+    # depend on which other benchmarks are selected.
+    seed = "%u:%s:%s:%s:%s" % (options.seed, op_name, fmt, operand_class, rm)
+
+    best = None
+    for _ in range(options.repeat):
+        # New (but equal) operands for each repeat, so that cached
+        # values such as MPF.to_rational do not carry over from the
+        # previous repeat.
+        rng = random.Random(seed)
+        samples = [sample(rng, op_name, fmt, operand_class)
+                   for _ in range(options.samples)]
+
+        start = time.perf_counter()
+        for args in samples:
+            try:
+                op.evaluate(rm, *args)
+            except Unspecified:
+                pass
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return int(best * 1e9 / len(samples))
+
+def run(options):
+    results = {}
+    for fmt in options.formats:
+        for op_name in options.ops:
+            op = FP_OPS[op_name]
+            # Operations without a rounding mode are listed with "-"
+            rms = MPF.ROUNDING_MODES if op.rm_arg else (None,)
+            for operand_class in options.classes:
+                for rm in rms:
+                    key = " ".join((fmt, op_name, operand_class, rm or "-"))
+                    ns = benchmark(op_name, fmt, operand_class, rm, options)
+                    results[key] = {"ns_per_op" : ns,
+                                    "samples"   : options.samples}
+                    if options.verbose:
+                        print("%-60s %12u ns" % (key, ns))
+    return {
+        "meta" : {
+            "pympf"    : mpf_version.version,
+            "python"   : platform.python_version(),
+            "platform" : platform.platform(),
+            "seed"     : options.seed,
+            "samples"  : options.samples,
+            "repeat"   : options.repeat,
+        },
+        "results" : results,
+    }
+
+def compare(current, baseline, threshold):
+    """Report changes against a baseline; returns list of regressions"""
+    regressions = []
+    for key in sorted(current["results"]):
+        if key not in baseline["results"]:
+            continue
+        new = current["results"][key]["ns_per_op"]
+        old = baseline["results"][key]["ns_per_op"]
+        ratio = float(new) / max(old, 1)
+        if ratio > threshold:
+            regressions.append(key)
+            print("REGRESSION  %-60s %12u -> %12u ns (x%.2f)" %
+                  (key, old, new, ratio))
+        elif ratio < 1.0 / threshold:
+            print("improvement %-60s %12u -> %12u ns (x%.2f)" %
+                  (key, old, new, ratio))
+    return regressions
+
+def main():
+    ap = argparse.ArgumentParser(
+        description="Benchmark PyMPF operations")
+    ap.add_argument("--output",
+                    help="Write results (JSON) to this file")
+    ap.add_argument("--compare",
+                    metavar="BASELINE",
+                    help="Compare results against a previous output")
+    ap.add_argument("--threshold",
+                    type=float,
+                    default=1.25,
+                    help=("Slow-down factor reported as a regression"
+                          " (default 1.25)"))
+    ap.add_argument("--formats",
+                    nargs="+",
+                    choices=sorted(FORMATS),
+                    default=sorted(FORMATS))
+    ap.add_argument("--ops",
+                    nargs="+",
+                    choices=sorted(FP_OPS),
+                    default=sorted(FP_OPS))
+    ap.add_argument("--classes",
+                    nargs="+",
+                    choices=OPERAND_CLASSES,
+                    default=list(OPERAND_CLASSES))
+    ap.add_argument("--samples",
+                    type=int,
+                    default=20,
+                    help="Operands per benchmark (default 20)")
+    ap.add_argument("--repeat",
+                    type=int,
+                    default=3,
+                    help="Repetitions, the fastest is kept (default 3)")
+    ap.add_argument("--seed",
+                    type=int,
+                    default=42)
+    ap.add_argument("--verbose",
+                    action="store_true")
+    options = ap.parse_args()
+
+    current = run(options)
+
+    if options.output:
+        with open(options.output, "w") as fd:
+            json.dump(current, fd, indent=2, sort_keys=True)
+            fd.write("\n")
+    elif not options.verbose:
+        json.dump(current, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+
+    if options.compare:
+        with open(options.compare, "r") as fd:
+            baseline = json.load(fd)
+        if compare(current, baseline, options.threshold):
+            return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
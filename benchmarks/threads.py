@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                                PYMPF                                     ##
+##                                                                          ##
+##              Copyright (C) 2020,      Florian Schanda                    ##
+##                                                                          ##
+##  This file is part of PyMPF.                                             ##
+##                                                                          ##
+##  PyMPF is free software: you can redistribute it and/or modify           ##
+##  it under the terms of the GNU General Public License as published by    ##
+##  the Free Software Foundation, either version 3 of the License, or       ##
+##  (at your option) any later version.                                     ##
+##                                                                          ##
+##  PyMPF is distributed in the hope that it will be useful,                ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with PyMPF. If not, see <http://www.gnu.org/licenses/>.           ##
+##                                                                          ##
+##############################################################################
+
+
+# Thread-safety check for PyMPF. All operations (including the
+# elementary functions) are evaluated on the same operand objects
+# from several threads at once, and we check that:
+#
+#    * every result matches a sequential run on separate objects,
+#    * no operand has been modified, and
+#    * the instrumentation saw every call.
+#
+#    ./threads.py --threads 8
+#
+# The switch interval is made tiny so that threads are interleaved
+# even on builds with a GIL. The exit status is 1 on any failure.
+
+import os
+import sys
+import random
+import argparse
+import concurrent.futures
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+
+from mpf.floats import *
+from mpf import elementary
+from mpf import instrumentation
+
+from bench import FORMATS, OPERAND_CLASSES, sample
+
+OPS = dict(FP_OPS)
+OPS.update(elementary.ELEMENTARY_OPS)
+
+# For sin and cos the argument reduction is slow for large
+# exponents, so the elementary functions are only checked on these
+ELEMENTARY_CLASSES = ("normal", "subnormal", "boundary")
+
+def identity(value):
+    """Something we can compare with ==, for results and operands"""
+    if isinstance(value, MPF):
+        return value.key()
+    return repr(value)
+
+def cases(options):
+    """List of (op_name, rm, args), with new operand objects each call"""
+    rng = random.Random(options.seed)
+    rv = []
+    for fmt in options.formats:
+        for op_name in sorted(OPS):
+            op = OPS[op_name]
+            rms = MPF.ROUNDING_MODES if op.rm_arg else (None,)
+            if op_name in elementary.ELEMENTARY_OPS:
+                classes = ELEMENTARY_CLASSES
+            else:
+                classes = OPERAND_CLASSES
+            for operand_class in classes:
+                if op_name in elementary.ELEMENTARY_OPS:
+                    # sample only knows the signatures in FP_OPS
+                    args = [sample(rng, "fp.add", fmt, operand_class)[0]
+                            for _ in range(op.arity)]
+                else:
+                    args = sample(rng, op_name, fmt, operand_class)
+                for rm in rms:
+                    rv.append((op_name, rm, args))
+    return rv
+
+def evaluate(case):
+    op_name, rm, args = case
+    try:
+        return identity(OPS[op_name].evaluate(rm, *args))
+    except Unspecified:
+        return "unspecified"
+
+def calls():
+    """Number of calls per instrumented function"""
+    return {key : info["count"]
+            for key, info in instrumentation.snapshot()["latency"].items()}
+
+def check(options):
+    """Returns the number of failures"""
+    instrumentation.enable()
+
+    # Reference results, on objects the threads never see
+    instrumentation.reset()
+    expected = [evaluate(case) for case in cases(options)]
+    expected_calls = calls()
+
+    shared = cases(options)
+    operands = [[identity(arg) for arg in args]
+                for _, _, args in shared]
+
+    # Each thread evaluates all cases, in its own order, starting
+    # with no constants cached
+    elementary.clear_cache()
+    instrumentation.reset()
+
+    def work(thread):
+        order = list(range(len(shared)))
+        random.Random(thread).shuffle(order)
+        return [(i, evaluate(shared[i])) for i in order]
+
+    with concurrent.futures.ThreadPoolExecutor(options.threads) as pool:
+        outcomes = list(pool.map(work, range(options.threads)))
+
+    failures = 0
+    for outcome in outcomes:
+        for i, result in outcome:
+            if result != expected[i]:
+                failures += 1
+                op_name, rm, args = shared[i]
+                print("wrong result %s %s %s: %s (expected %s)" %
+                      (op_name, rm, " ".join(map(str, args)),
+                       result, expected[i]))
+    for i, (op_name, rm, args) in enumerate(shared):
+        if [identity(arg) for arg in args] != operands[i]:
+            failures += 1
+            print("operand modified by %s %s" % (op_name, rm))
+    actual_calls = calls()
+    for key in sorted(set(expected_calls) | set(actual_calls)):
+        if actual_calls.get(key, 0) != \
+           expected_calls.get(key, 0) * options.threads:
+            failures += 1
+            print("instrumentation for %s saw %u calls (expected %u)" %
+                  (key,
+                   actual_calls.get(key, 0),
+                   expected_calls.get(key, 0) * options.threads))
+
+    print("%u cases in %u threads: %u failures" % (len(shared),
+                                                   options.threads,
+                                                   failures))
+    return failures
+
+def main():
+    ap = argparse.ArgumentParser(
+        description="Check PyMPF operations under threads")
+    ap.add_argument("--threads",
+                    type=int,
+                    default=8)
+    ap.add_argument("--formats",
+                    nargs="+",
+                    choices=sorted(FORMATS),
+                    default=["Float16", "Float32", "Float64"])
+    ap.add_argument("--seed",
+                    type=int,
+                    default=0)
+    ap.add_argument("--switch-interval",
+                    type=float,
+                    default=1e-6,
+                    help="See sys.setswitchinterval (default 1e-6)")
+    options = ap.parse_args()
+    if options.threads < 2:
+        ap.error("--threads must be at least 2")
+
+    sys.setswitchinterval(options.switch_interval)
+    return 1 if check(options) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
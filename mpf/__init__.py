@@ -1,3 +1,8 @@
 #!/usr/bin/env python3
 
-__all__ = ["floats", "rationals", "bitvector"]
+__all__ = ["floats", "rationals", "bitvector", "preimage",
+           "interval_f", "instrumentation",
+           "differential", "smtlib", "arrays",
+           "generator", "exhaustive", "corpus",
+           "database", "elementary", "trace", "batch",
+           "server"]
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                                PYMPF                                     ##
+##                                                                          ##
+##              Copyright (C) 2020,      Florian Schanda                    ##
+##                                                                          ##
+##  This file is part of PyMPF.                                             ##
+##                                                                          ##
+##  PyMPF is free software: you can redistribute it and/or modify           ##
+##  it under the terms of the GNU General Public License as published by    ##
+##  the Free Software Foundation, either version 3 of the License, or       ##
+##  (at your option) any later version.                                     ##
+##                                                                          ##
+##  PyMPF is distributed in the hope that it will be useful,                ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with PyMPF. If not, see <http://www.gnu.org/licenses/>.           ##
+##                                                                          ##
+##############################################################################
+
+"""python3 -m mpf runs the batch evaluator, see :mod:`mpf.batch`"""
+
+import sys
+
+from .batch import main
+
+sys.exit(main())
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                                PYMPF                                     ##
+##                                                                          ##
+##              Copyright (C) 2020,      Florian Schanda                    ##
+##                                                                          ##
+##  This file is part of PyMPF.                                             ##
+##                                                                          ##
+##  PyMPF is free software: you can redistribute it and/or modify           ##
+##  it under the terms of the GNU General Public License as published by    ##
+##  the Free Software Foundation, either version 3 of the License, or       ##
+##  (at your option) any later version.                                     ##
+##                                                                          ##
+##  PyMPF is distributed in the hope that it will be useful,                ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with PyMPF. If not, see <http://www.gnu.org/licenses/>.           ##
+##                                                                          ##
+##############################################################################
+
+"""
+This module provides :class:`MPF_Array`, a compact array of floats of
+one precision stored as bit patterns, with bulk operations that work
+on the bit patterns directly (instead of creating an MPF for each
+element):
+
+>>> a = MPF_Array(8, 24, [0x3f800000, 0x80000000, 0x7f800000])
+>>> a.sorted().to_list()
+[2147483648, 1065353216, 2139095040]
+>>> a.ordinals()
+[1065353216, 0, 2139095040]
+
+If NumPy is installed it is used for formats of up to 64 bits.
+"""
+
+import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .floats import MPF
+
+def _typecode(k):
+    # The smallest array type that can hold k bits, or None if we
+    # need to fall back to a list.
+    for code in ("B", "H", "I", "L", "Q"):
+        if array.array(code).itemsize * 8 >= k:
+            return code
+    return None
+
+def total_order_key(k, bits):
+    """Key for IEEE-754 totalOrder of the bit pattern of a k-bit float
+
+    See :func:`mpf.floats.MPF.total_order_key`.
+    """
+    if bits >> (k - 1):
+        return bits ^ ((1 << k) - 1)
+    else:
+        return bits | (1 << (k - 1))
+
+def ordinal(k, bits):
+    """Ordinal of the bit pattern of a k-bit float
+
+    See :func:`mpf.floats.MPF.ordinal`. NaNs are not checked for.
+    """
+    rv = bits & ((1 << (k - 1)) - 1)
+    if bits >> (k - 1):
+        return -rv
+    else:
+        return rv
+
+def view(eb, sb, patterns):
+    """Return an MPF_Array using *patterns* without copying
+
+    *patterns* can be any sequence of ints, e.g. a memoryview. The
+    array is read-only if *patterns* is.
+    """
+    rv = MPF_Array(eb, sb)
+    rv.patterns = patterns
+    return rv
+
+class MPF_Array:
+    """Array of floats with *eb* exponent and *sb* significand bits
+
+    *values* is an iterable of bit patterns (ints) or MPFs. Indexing
+    gives an MPF (or an MPF_Array for slices).
+    """
+    def __init__(self, eb, sb, values=()):
+        assert MPF.MIN_EB <= eb <= MPF.MAX_EB
+        assert sb >= MPF.MIN_SB
+        self.eb = eb
+        self.sb = sb
+        self.k  = eb + sb
+
+        code = _typecode(self.k)
+        if code is None:
+            self.patterns = []
+        else:
+            self.patterns = array.array(code)
+        self.extend(values)
+
+    def __repr__(self):
+        return "MPF_Array(%u, %u, %u elements)" % (self.eb,
+                                                   self.sb,
+                                                   len(self))
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.new_array(self.patterns[index])
+        return MPF(self.eb, self.sb, self.patterns[index])
+
+    def __iter__(self):
+        for bits in self.patterns:
+            yield MPF(self.eb, self.sb, bits)
+
+    def new_array(self, values=()):
+        """Create a new array of the same precision"""
+        return MPF_Array(self.eb, self.sb, values)
+
+    def append(self, value):
+        """Append an MPF or bit pattern"""
+        if isinstance(value, MPF):
+            assert value.w == self.eb and value.p == self.sb
+            value = value.bv
+        assert 0 <= value < 2 ** self.k
+        self.patterns.append(value)
+
+    def extend(self, values):
+        """Append MPFs or bit patterns"""
+        if isinstance(values, MPF_Array):
+            assert values.eb == self.eb and values.sb == self.sb
+            self.patterns.extend(values.patterns)
+        else:
+            for value in values:
+                self.append(value)
+
+    def to_list(self):
+        """Return the bit patterns as a list of ints"""
+        return list(self.patterns)
+
+    def _numpy(self):
+        # The patterns as a numpy uint64 array, or None if not
+        # possible.
+        if numpy is None or self.k > 64:
+            return None
+        return numpy.array(self.patterns, dtype=numpy.uint64)
+
+    def unique(self, canonical_nan=False):
+        """Return a new array without duplicates
+
+        Elements are compared by bit pattern (see
+        :func:`mpf.floats.MPF.key`), and the first occurrence is
+        kept. If *canonical_nan* is set, only the first NaN is kept.
+        """
+        t         = self.sb - 1
+        inf       = ((1 << self.eb) - 1) << t
+        magnitude = (1 << (self.k - 1)) - 1
+        nan       = (1 << self.k) - 1
+
+        seen = set()
+        rv   = self.new_array()
+        for bits in self.patterns:
+            key = bits
+            if canonical_nan and bits & magnitude > inf:
+                key = nan
+            if key not in seen:
+                seen.add(key)
+                rv.patterns.append(bits)
+        return rv
+
+    ######################################################################
+    # Ordering
+
+    def total_order_keys(self):
+        """Return the totalOrder key of each element"""
+        return [total_order_key(self.k, bits) for bits in self.patterns]
+
+    def argsort(self):
+        """Indices that would sort the array in totalOrder
+
+        The sort is stable.
+        """
+        values = self._numpy()
+        if values is not None:
+            sign_bit = numpy.uint64(1 << (self.k - 1))
+            mask     = numpy.uint64((1 << self.k) - 1)
+            keys     = values ^ numpy.where(values & sign_bit,
+                                            mask,
+                                            sign_bit)
+            return [int(i) for i in numpy.argsort(keys, kind="stable")]
+
+        k = self.k
+        return sorted(range(len(self.patterns)),
+                      key=lambda i: total_order_key(k, self.patterns[i]))
+
+    def sorted(self):
+        """Return a new array sorted in totalOrder
+
+        -NaN < -oo < ... < -0 < +0 < ... < +oo < +NaN
+        """
+        k = self.k
+        return self.new_array(sorted(self.patterns,
+                                     key=lambda b: total_order_key(k, b)))
+
+    def sort(self):
+        """Sort in place in totalOrder"""
+        self.patterns = self.sorted().patterns
+
+    def ranks(self):
+        """Position of each element in totalOrder
+
+        Equal elements get the same (the lowest) rank.
+        """
+        order = self.argsort()
+        rv    = [0] * len(order)
+        prev  = None
+        rank  = 0
+        for position, i in enumerate(order):
+            bits = self.patterns[i]
+            if bits != prev:
+                rank = position
+                prev = bits
+            rv[i] = rank
+        return rv
+
+    ######################################################################
+    # Ordinals
+
+    def ordinals(self):
+        """Return the ordinal of each element
+
+        See :func:`mpf.floats.MPF.ordinal`. Raises AssertionError if
+        there are any NaNs.
+        """
+        assert not self.has_nan()
+        k = self.k
+        return [ordinal(k, bits) for bits in self.patterns]
+
+    def has_nan(self):
+        """Test if any element is NaN"""
+        t   = self.sb - 1
+        inf = ((1 << self.eb) - 1) << t
+        magnitude = (1 << (self.k - 1)) - 1
+        return any(bits & magnitude > inf for bits in self.patterns)
+
+    def ulp_distances(self, other):
+        """Return the distance in ulps between corresponding elements
+
+        See :func:`mpf.floats.ulp_distance`. Both arrays must have the
+        same precision and length, and must not contain NaN.
+        """
+        assert self.eb == other.eb and self.sb == other.sb
+        assert len(self) == len(other)
+
+        if self.k <= 62:
+            left  = self._numpy()
+            right = other._numpy()
+        else:
+            left  = None
+            right = None
+        if left is not None:
+            assert not self.has_nan() and not other.has_nan()
+            sign_bit  = numpy.uint64(1 << (self.k - 1))
+            magnitude = numpy.uint64((1 << (self.k - 1)) - 1)
+            ord_l = numpy.where(left & sign_bit,
+                                -(left & magnitude).astype(numpy.int64),
+                                (left & magnitude).astype(numpy.int64))
+            ord_r = numpy.where(right & sign_bit,
+                                -(right & magnitude).astype(numpy.int64),
+                                (right & magnitude).astype(numpy.int64))
+            return [int(d) for d in numpy.abs(ord_l - ord_r)]
+
+        return [abs(l - r) for l, r in zip(self.ordinals(),
+                                          other.ordinals())]
@@ -0,0 +1,596 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                                PYMPF                                     ##
+##                                                                          ##
+##              Copyright (C) 2020,      Florian Schanda                    ##
+##                                                                          ##
+##  This file is part of PyMPF.                                             ##
+##                                                                          ##
+##  PyMPF is free software: you can redistribute it and/or modify           ##
+##  it under the terms of the GNU General Public License as published by    ##
+##  the Free Software Foundation, either version 3 of the License, or       ##
+##  (at your option) any later version.                                     ##
+##                                                                          ##
+##  PyMPF is distributed in the hope that it will be useful,                ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with PyMPF. If not, see <http://www.gnu.org/licenses/>.           ##
+##                                                                          ##
+##############################################################################
+
+
+"""
+This module evaluates a stream of operation records, so that tools
+written in other languages can use PyMPF as a long-running process
+instead of starting Python for each query. It is what runs for:
+
+    $ python3 -m mpf < queries.jsonl > results.jsonl
+    $ python3 -m mpf --processes 8 queries.csv
+
+Each record gives the operation (a key of :data:`mpf.floats.FP_OPS`
+or :data:`mpf.elementary.ELEMENTARY_OPS`), the rounding mode (empty
+for operations without one, otherwise RNE, RNA, RTP, RTN, RTZ or
+their long SMT-LIB names), the float format *eb* and *sb*, and the
+operands. As JSON lines:
+
+    {"op": "fp.add", "rm": "RNE", "eb": 8, "sb": 24,
+     "args": ["#x3f800000", "0x1p-3"]}
+
+and as CSV (without a header):
+
+    fp.add,RNE,8,24,#x3f800000,0x1p-3
+
+For conversions to float *eb* and *sb* give the result format. Float
+operands can be bit patterns (#x... or #b... of width eb + sb, or a
+JSON integer), exact C99 hexadecimal floats (see
+:func:`mpf.floats.MPF.from_hex_string`) or any SMT-LIB constant term
+(e.g. (fp #b0 #b01111111 #b00000000000000000000000) or (_ +zero 8
+24)). The operand of fp.cast must be an SMT-LIB term, since its
+format differs from the result. Integer and real operands are
+decimals or SMT-LIB terms, and bitvector operands are #x... or #b...
+literals. fp.to.ubv and fp.to.sbv take the width as an extra operand.
+
+Each record is written back in the same format with its result
+appended: a "result" field for JSON (other fields, e.g. an "id", are
+kept) and an extra column for CSV. Float results are bit patterns by
+default (see --literals), other results SMT-LIB literals, and
+results that SMT-LIB leaves unspecified are "unspecified". Invalid
+records get an "error" field (or the column "error" followed by the
+message) instead, and processing continues. This includes records
+that fail unexpectedly, and with several processes the records being
+evaluated by a worker process that dies.
+
+The size of records, operands and formats is limited (see
+:data:`MAX_RECORD`, :data:`MAX_WIDTH` and :data:`MAX_EXPONENT`), as
+is the format for the operations whose cost grows with the exponent
+range or precision: fp.to.real, fp.to.int and the elementary
+functions (see :data:`MAX_EXACT_EB` and :data:`MAX_ELEMENTARY_SB`).
+Within these limits each record takes at most a few seconds.
+
+Results are written in input order as soon as they are known, and
+each is flushed immediately when running in a single process, so
+the evaluator can be driven interactively through a pipe.
+"""
+
+import re
+import io
+import sys
+import csv
+import json
+import argparse
+import functools
+import collections
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+
+from .floats import *
+from .elementary import ELEMENTARY_OPS
+from . import smtlib
+
+class Batch_Error(Exception):
+    pass
+
+OPS = dict(FP_OPS)
+OPS.update(ELEMENTARY_OPS)
+
+LITERALS = ("bits", "hex", "smtlib")
+
+DECIMAL = re.compile(r"([+-]?)([0-9]+)(\.[0-9]*)?(?:[eE]([+-]?[0-9]+))?")
+
+# Limits on the size of records, operands and formats, so that a
+# single record takes at most a few seconds and a bounded amount of
+# memory. Records are at most MAX_RECORD characters, bitvector widths
+# and significands at most MAX_WIDTH bits, and decimal exponents at
+# most MAX_EXPONENT.
+MAX_RECORD   = 4 * 10 ** 5
+MAX_WIDTH    = 2 ** 16
+MAX_EXPONENT = 10 ** 5
+
+# Some operations cost much more than the size of the format suggests:
+# the results of fp.to.real and fp.to.int have up to 2^(eb - 1) bits,
+# fp.sin and fp.cos need pi to about as many bits, and the elementary
+# functions work at several times the precision sb.
+MAX_EXACT_EB      = 18
+EXACT_OPS         = frozenset(["fp.to.real", "fp.to.int"])
+MAX_ELEMENTARY_SB = 2 ** 12
+
+def allow_long_integers():
+    """Lift the limit on converting long integers to and from decimal
+
+    Results such as fp.to.real of the largest binary128 have more than
+    the 4300 digits Python allows by default. The limits above bound
+    the size of the integers we convert. This is called by
+    :func:`main` and in each worker process.
+    """
+    if hasattr(sys, "set_int_max_str_digits"):
+        sys.set_int_max_str_digits(0)
+
+##############################################################################
+# Operands
+##############################################################################
+
+def _smtlib_value(text):
+    try:
+        return smtlib.evaluate_term(text)
+    except smtlib.Parse_Error as err:
+        raise Batch_Error("cannot parse %s: %s" % (text, err))
+    except KeyError as err:
+        raise Batch_Error("%s is not a constant (%s is free)" % (text, err))
+    except (AssertionError, ValueError):
+        raise Batch_Error("cannot evaluate %s" % text)
+
+def _bitvector(literal):
+    # The BitVector for #x... or #b..., or None
+    match = re.fullmatch(r"#x([0-9a-fA-F]+)|#b([01]+)", literal)
+    if match is None:
+        return None
+    elif match.group(1):
+        return BitVector(4 * len(match.group(1)), int(match.group(1), 16))
+    else:
+        return BitVector(len(match.group(2)), int(match.group(2), 2))
+
+def parse_float(eb, sb, literal):
+    """Return the MPF for an operand literal
+
+    If *eb* is None the literal must be an SMT-LIB term, which may
+    have any format.
+    """
+    if eb is not None:
+        if isinstance(literal, int):
+            if not 0 <= literal < 2 ** (eb + sb):
+                raise Batch_Error("bit pattern %u out of range" % literal)
+            return MPF(eb, sb, literal)
+        elif not isinstance(literal, str):
+            raise Batch_Error("invalid float %r" % (literal,))
+        elif literal.startswith("#"):
+            value = _bitvector(literal)
+            if value is None or value.width != eb + sb:
+                raise Batch_Error("%s is not a bit pattern of width %u" %
+                                  (literal, eb + sb))
+            return MPF(eb, sb, value.bv)
+        elif not literal.lstrip("+-").startswith("("):
+            low  = MPF(eb, sb)
+            high = MPF(eb, sb)
+            try:
+                low.from_hex_string(RM_RTN, literal)
+                high.from_hex_string(RM_RTP, literal)
+            except ValueError as err:
+                raise Batch_Error(str(err))
+            if low.bv != high.bv:
+                raise Batch_Error("%s is not exact in (%u, %u)" %
+                                  (literal, eb, sb))
+            return low
+    elif not isinstance(literal, str):
+        raise Batch_Error("invalid float %r" % (literal,))
+
+    value = _smtlib_value(literal)
+    if not isinstance(value, MPF):
+        raise Batch_Error("%s is not a float" % literal)
+    if eb is not None and (value.w, value.p) != (eb, sb):
+        raise Batch_Error("%s is not a float of format (%u, %u)" %
+                          (literal, eb, sb))
+    return value
+
+def parse_int(literal):
+    """Return the int for an operand literal"""
+    if isinstance(literal, bool):
+        raise Batch_Error("%s is not an integer" % literal)
+    elif isinstance(literal, int):
+        return literal
+    elif re.fullmatch(r"[+-]?[0-9]+", str(literal)):
+        return int(literal)
+    value = _smtlib_value(str(literal))
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise Batch_Error("%s is not an integer" % literal)
+    return value
+
+def parse_real(literal):
+    """Return the Rational for an operand literal"""
+    if isinstance(literal, int):
+        return Rational(literal)
+    match = DECIMAL.fullmatch(str(literal))
+    if match:
+        exponent = match.group(4)
+        if exponent is not None and abs(int(exponent)) > MAX_EXPONENT:
+            raise Batch_Error("exponent of %s is too large" % literal)
+        return q_from_decimal_fragments(*match.groups())
+    value = _smtlib_value(str(literal))
+    if isinstance(value, int) and not isinstance(value, bool):
+        return Rational(value)
+    elif not isinstance(value, Rational):
+        raise Batch_Error("%s is not a real" % literal)
+    return value
+
+def parse_bv(literal):
+    """Return the BitVector for an operand literal"""
+    value = None
+    if isinstance(literal, str):
+        value = _bitvector(literal)
+    if value is None:
+        raise Batch_Error("%s is not a bitvector literal" % (literal,))
+    return value
+
+##############################################################################
+# Results
+##############################################################################
+
+def format_result(value, literals="bits"):
+    """Return the literal for a result
+
+    *literals* is one of :data:`LITERALS` and selects how floats are
+    written: as bit patterns (#x... if the width is a multiple of 4),
+    C99 hexadecimal floats, or SMT-LIB fp literals.
+    """
+    if isinstance(value, MPF):
+        if literals == "bits":
+            return str(BitVector(value.k, value.bv))
+        elif literals == "hex":
+            return value.to_hex_string()
+        else:
+            assert literals == "smtlib"
+            return value.smtlib_literal()
+    elif isinstance(value, bool):
+        return "true" if value else "false"
+    elif isinstance(value, int):
+        if value < 0:
+            return "(- %u)" % -value
+        else:
+            return "%u" % value
+    elif isinstance(value, Rational):
+        return value.to_smtlib()
+    else:
+        assert isinstance(value, BitVector)
+        return value.smtlib_literal()
+
+##############################################################################
+# Records
+##############################################################################
+
+def _integer_field(value):
+    # An integral JSON number or a decimal string, or None
+    if isinstance(value, bool):
+        return None
+    elif isinstance(value, int):
+        return value
+    elif isinstance(value, float) and value.is_integer():
+        return int(value)
+    elif isinstance(value, str) and re.fullmatch(r"[0-9]+", value):
+        return int(value)
+    else:
+        return None
+
+def _format(eb, sb):
+    eb_value = _integer_field(eb)
+    sb_value = _integer_field(sb)
+    if eb_value is None or sb_value is None:
+        raise Batch_Error("invalid format (%s, %s)" % (eb, sb))
+    if not (MPF.MIN_EB <= eb_value <= MPF.MAX_EB and
+            MPF.MIN_SB <= sb_value <= MAX_WIDTH):
+        raise Batch_Error("unsupported format (%u, %u)" % (eb_value,
+                                                           sb_value))
+    return eb_value, sb_value
+
+def evaluate_record(op_name, rm_name, eb, sb, args, literals="bits"):
+    """Evaluate one record and return the result literal
+
+    Raises :class:`Batch_Error` if the record is invalid.
+    """
+    op = OPS.get(op_name, None)
+    if op is None:
+        raise Batch_Error("unknown operation %s" % op_name)
+    eb, sb = _format(eb, sb)
+    if op_name in EXACT_OPS or op_name in ELEMENTARY_OPS:
+        if eb > MAX_EXACT_EB:
+            raise Batch_Error("%s is limited to eb <= %u" % (op_name,
+                                                             MAX_EXACT_EB))
+    if op_name in ELEMENTARY_OPS and sb > MAX_ELEMENTARY_SB:
+        raise Batch_Error("%s is limited to sb <= %u" % (op_name,
+                                                         MAX_ELEMENTARY_SB))
+
+    if op.rm_arg:
+        rm = smtlib.RM_NAMES.get(rm_name, None)
+        if rm is None:
+            raise Batch_Error("%s needs a rounding mode" % op_name)
+    elif rm_name:
+        raise Batch_Error("%s has no rounding mode" % op_name)
+    else:
+        rm = None
+
+    arity = op.arity
+    if op.result_type == TYP_BV:
+        # The width of the result
+        arity += 1
+    if len(args) != arity:
+        raise Batch_Error("%s takes %u operands, not %u" %
+                          (op_name, arity, len(args)))
+
+    if op.args_type == TYP_FLOAT:
+        if op.precision_arg:
+            values = [parse_float(None, None, arg) for arg in args]
+        else:
+            values = [parse_float(eb, sb, arg) for arg in args[:op.arity]]
+    elif op.args_type == TYP_INT:
+        values = [parse_int(arg) for arg in args]
+    elif op.args_type == TYP_REAL:
+        values = [parse_real(arg) for arg in args]
+    else:
+        assert op.args_type == TYP_BV
+        values = [parse_bv(arg) for arg in args]
+    if op.result_type == TYP_BV:
+        width = parse_int(args[-1])
+        if not 1 <= width <= MAX_WIDTH:
+            raise Batch_Error("invalid width %d" % width)
+        values.append(width)
+    if op.precision_arg:
+        values = [eb, sb] + values
+
+    try:
+        return format_result(op.evaluate(rm, *values), literals)
+    except Unspecified:
+        return "unspecified"
+
+def _error(err):
+    # The message for an exception raised by evaluate_record
+    if isinstance(err, Batch_Error):
+        return str(err)
+    else:
+        return "internal error: %s: %s" % (type(err).__name__, err)
+
+_TOO_LONG = "record longer than %u characters" % MAX_RECORD
+
+def process_json(line, literals="bits"):
+    """Evaluate a JSON record
+
+    Returns a tuple (output line, ok).
+    """
+    if len(line) > MAX_RECORD:
+        return json.dumps({"error" : _TOO_LONG}), False
+    try:
+        record = json.loads(line)
+    except ValueError as err:
+        record = None
+        error  = "invalid JSON: %s" % err
+    else:
+        error  = "record is not an object"
+    if not isinstance(record, dict):
+        return json.dumps({"input" : line.rstrip("\n"),
+                           "error" : error}), False
+
+    try:
+        args = record.get("args", [])
+        if not isinstance(args, list):
+            raise Batch_Error("args is not a list")
+        record["result"] = evaluate_record(record.get("op", None),
+                                           record.get("rm", None),
+                                           record.get("eb", None),
+                                           record.get("sb", None),
+                                           args,
+                                           literals)
+        ok = True
+    except Exception as err: # pylint: disable=broad-except
+        record["error"] = _error(err)
+        ok = False
+    return json.dumps(record), ok
+
+def process_csv(line, literals="bits"):
+    """Evaluate a CSV record
+
+    Returns a tuple (output line, ok).
+    """
+    if len(line) > MAX_RECORD:
+        return "error,%s" % _TOO_LONG, False
+    row = next(csv.reader([line]), [])
+    try:
+        if len(row) < 4:
+            raise Batch_Error("expected op, rm, eb, sb and operands")
+        result = evaluate_record(row[0],
+                                 row[1],
+                                 row[2],
+                                 row[3],
+                                 row[4:],
+                                 literals)
+        row.append(result)
+        ok = True
+    except Exception as err: # pylint: disable=broad-except
+        row += ["error", _error(err)]
+        ok = False
+
+    fd = io.StringIO()
+    csv.writer(fd, lineterminator="").writerow(row)
+    return fd.getvalue(), ok
+
+PROCESS = {
+    "jsonl" : process_json,
+    "csv"   : process_csv,
+}
+
+def _skip(line):
+    # Blank lines and comments produce no output
+    text = line.strip()
+    return not text or text.startswith("#")
+
+##############################################################################
+# Streams
+##############################################################################
+
+def _process_chunk(fn, lines):
+    return [fn(line) for line in lines]
+
+def _failed(input_format, line, message):
+    # The output line for a record we could not evaluate
+    if input_format == "jsonl":
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        if not isinstance(record, dict):
+            record = {"input" : line.rstrip("\n")}
+        record["error"] = message
+        return json.dumps(record)
+    else:
+        row = next(csv.reader([line]), []) + ["error", message]
+        fd  = io.StringIO()
+        csv.writer(fd, lineterminator="").writerow(row)
+        return fd.getvalue()
+
+def _chunks(lines, chunk_size):
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def run(fd_in, fd_out, input_format="jsonl", literals="bits",
+        processes=1, chunk_size=64):
+    """Evaluate all records read from *fd_in*, writing to *fd_out*
+
+    With more than one process records are evaluated by a pool, in
+    chunks of *chunk_size*, and at most a few chunks per process are
+    read ahead. If a worker process dies (e.g. killed when out of
+    memory) the records in flight get an error, and a new pool
+    evaluates the rest. Returns the number of invalid records.
+    """
+    assert input_format in PROCESS
+    assert literals in LITERALS
+    assert processes >= 1 and chunk_size >= 1
+    fn     = functools.partial(PROCESS[input_format], literals=literals)
+    lines  = (line for line in fd_in if not _skip(line))
+    errors = 0
+
+    if processes == 1:
+        for line in lines:
+            output, ok = fn(line)
+            fd_out.write(output + "\n")
+            fd_out.flush()
+            errors += not ok
+        return errors
+
+    def new_pool():
+        return concurrent.futures.ProcessPoolExecutor(
+            processes,
+            initializer=allow_long_integers)
+
+    pool    = new_pool()
+    pending = collections.deque()
+
+    def collect():
+        nonlocal pool
+        chunk, executor, future = pending.popleft()
+        try:
+            results = future.result()
+        except BrokenProcessPool:
+            results = [(_failed(input_format, line,
+                                "internal error: worker process died"),
+                        False)
+                       for line in chunk]
+            if executor is pool:
+                pool.shutdown(wait=False)
+                pool = new_pool()
+        for output, ok in results:
+            fd_out.write(output + "\n")
+        return sum(not ok for _, ok in results)
+
+    try:
+        for chunk in _chunks(lines, chunk_size):
+            try:
+                future = pool.submit(_process_chunk, fn, chunk)
+            except BrokenProcessPool:
+                pool.shutdown(wait=False)
+                pool   = new_pool()
+                future = pool.submit(_process_chunk, fn, chunk)
+            pending.append((chunk, pool, future))
+            if len(pending) >= 4 * processes:
+                errors += collect()
+        while pending:
+            errors += collect()
+    finally:
+        pool.shutdown()
+    fd_out.flush()
+    return errors
+
+def main():
+    ap = argparse.ArgumentParser(
+        description="Evaluate a stream of floating-point operations")
+    ap.add_argument("input",
+                    nargs="?",
+                    default=None,
+                    help="Input file (default stdin)")
+    ap.add_argument("--output",
+                    default=None,
+                    help="Output file (default stdout)")
+    ap.add_argument("--input-format",
+                    choices=sorted(PROCESS),
+                    default=None,
+                    help=("Record format (default csv for .csv files,"
+                          " jsonl otherwise)"))
+    ap.add_argument("--literals",
+                    choices=LITERALS,
+                    default="bits",
+                    help="How to write float results (default bits)")
+    ap.add_argument("--processes",
+                    type=int,
+                    default=1)
+    ap.add_argument("--chunk-size",
+                    type=int,
+                    default=64)
+    options = ap.parse_args()
+
+    if options.processes < 1:
+        ap.error("--processes must be at least 1")
+    if options.chunk_size < 1:
+        ap.error("--chunk-size must be at least 1")
+    allow_long_integers()
+
+    input_format = options.input_format
+    if input_format is None:
+        if options.input and options.input.endswith(".csv"):
+            input_format = "csv"
+        else:
+            input_format = "jsonl"
+
+    fd_in  = sys.stdin
+    fd_out = sys.stdout
+    try:
+        if options.input:
+            fd_in = open(options.input, "r")
+        if options.output:
+            fd_out = open(options.output, "w")
+        errors = run(fd_in, fd_out, input_format, options.literals,
+                     options.processes, options.chunk_size)
+    finally:
+        if fd_in is not sys.stdin:
+            fd_in.close()
+        if fd_out is not sys.stdout:
+            fd_out.close()
+
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -23,74 +23,319 @@
 ##                                                                          ##
 ##############################################################################
 
+"""
+This module implements bitvectors of arbitrary width, including all
+of the operations of the SMT-LIB FixedSizeBitVectors theory. The
+value is stored as a single (unsigned) Python integer.
+"""
+
 import random
 
 class BitVector:
-    def __init__(self, width):
+    """Bitvector of the given *width*
+
+    By default the bitvector is all zeros, however *value* can be
+    used to set the initial (unsigned) value.
+    """
+    def __init__(self, width, value=0):
+        assert width >= 1
         self.width = width
-        self.bv = [0] * width
         self.min_unsigned = 0
-        self.max_unsigned = 2 ** width - 1
-        self.min_signed = - (2 ** (width - 1))
-        self.max_signed = 2 ** (width - 1) - 1
+        self.max_unsigned = (1 << width) - 1
+        self.min_signed = - (1 << (width - 1))
+        self.max_signed = (1 << (width - 1)) - 1
+
+        assert self.min_unsigned <= value <= self.max_unsigned
+        self.bv = value
 
     def __str__(self):
         return self.smtlib_literal()
 
+    def __repr__(self):
+        return "BitVector(%u, 0x%x)" % (self.width, self.bv)
+
+    def new_bv(self, value=0):
+        """Create a new bitvector of the same width"""
+        return BitVector(self.width, value)
+
     ######################################################################
     # Setters
 
     def from_unsigned_int(self, value):
         assert self.min_unsigned <= value <= self.max_unsigned
-
-        for i in range(self.width):
-            self.bv[self.width - 1 - i] = 1 if (2 ** i) & value else 0
+        self.bv = value
 
     def from_signed_int(self, value):
         assert self.min_signed <= value <= self.max_signed
-
-        if value < 0:
-            self.from_unsigned_int(self.max_unsigned + value + 1)
-        else:
-            self.from_unsigned_int(value)
-
+        self.bv = value & self.max_unsigned
 
     ######################################################################
     # Conversion
 
     def to_unsigned_int(self):
-        as_ubv = 0
-        for bit in self.bv:
-            as_ubv *= 2
-            as_ubv |= bit
-        return as_ubv
+        return self.bv
 
     def to_signed_int(self):
-        as_ubv = self.to_unsigned_int()
-        if as_ubv <= self.max_signed:
-            return as_ubv
+        if self.bv <= self.max_signed:
+            return self.bv
         else:
-            return -self.max_unsigned + as_ubv - 1
+            return self.bv - (1 << self.width)
 
     ######################################################################
     # SMTLIB support
 
     def smtlib_sort(self):
-        return "(_ BitVec %u)" % len(self.bv)
+        return "(_ BitVec %u)" % self.width
 
     def smtlib_literals(self):
         choices = []
 
         # Obvious binary
-        choices.append("#b%s" % "".join(map(str, self.bv)))
+        choices.append(("#b{0:0%ub}" % self.width).format(self.bv))
 
-        if len(self.bv) % 4 == 0:
-            pass
+        # Hex, if the width permits
+        if self.width % 4 == 0:
+            choices.append("#x%0*X" % (self.width // 4, self.bv))
 
         return choices
 
     def smtlib_literal(self):
         return self.smtlib_literals()[-1]
 
-    def smtlib_random_literal(self):
-        return random.choice(self.smtlib_literals())
+    def smtlib_random_literal(self, rng=None):
+        return (rng or random).choice(self.smtlib_literals())
+
+##############################################################################
+# SMTLIB Operations
+##############################################################################
+
+# Most operations follow the FixedSizeBitVectors theory and the
+# QF_BV logic of SMT-LIB. All of them return a new bitvector (or bool
+# for predicates) and leave their arguments unchanged.
+
+def _same_width(left, right):
+    assert left.width == right.width
+
+def bv_concat(left, right):
+    """Concatenation, with *left* providing the most significant bits"""
+    return BitVector(left.width + right.width,
+                     (left.bv << right.width) | right.bv)
+
+def bv_extract(i, j, op):
+    """((_ extract i j) op), i.e. bits i down to j (inclusive)"""
+    assert op.width > i >= j >= 0
+    width = i - j + 1
+    return BitVector(width, (op.bv >> j) & ((1 << width) - 1))
+
+def bv_repeat(i, op):
+    """((_ repeat i) op)"""
+    assert i >= 1
+    rv = op.bv
+    for _ in range(i - 1):
+        rv = (rv << op.width) | op.bv
+    return BitVector(op.width * i, rv)
+
+def bv_zero_extend(i, op):
+    """((_ zero_extend i) op)"""
+    assert i >= 0
+    return BitVector(op.width + i, op.bv)
+
+def bv_sign_extend(i, op):
+    """((_ sign_extend i) op)"""
+    assert i >= 0
+    rv = BitVector(op.width + i)
+    rv.from_signed_int(op.to_signed_int())
+    return rv
+
+def bv_rotate_left(i, op):
+    """((_ rotate_left i) op)"""
+    assert i >= 0
+    i = i % op.width
+    return op.new_bv(((op.bv << i) | (op.bv >> (op.width - i))) &
+                     op.max_unsigned)
+
+def bv_rotate_right(i, op):
+    """((_ rotate_right i) op)"""
+    assert i >= 0
+    return bv_rotate_left(op.width - (i % op.width), op)
+
+def bv_not(op):
+    """Bitwise negation"""
+    return op.new_bv(op.bv ^ op.max_unsigned)
+
+def bv_and(left, right):
+    """Bitwise and"""
+    _same_width(left, right)
+    return left.new_bv(left.bv & right.bv)
+
+def bv_or(left, right):
+    """Bitwise or"""
+    _same_width(left, right)
+    return left.new_bv(left.bv | right.bv)
+
+def bv_xor(left, right):
+    """Bitwise exclusive or"""
+    _same_width(left, right)
+    return left.new_bv(left.bv ^ right.bv)
+
+def bv_nand(left, right):
+    """Bitwise nand"""
+    return bv_not(bv_and(left, right))
+
+def bv_nor(left, right):
+    """Bitwise nor"""
+    return bv_not(bv_or(left, right))
+
+def bv_xnor(left, right):
+    """Bitwise exclusive nor"""
+    return bv_not(bv_xor(left, right))
+
+def bv_comp(left, right):
+    """Equality as a bitvector of width 1"""
+    _same_width(left, right)
+    return BitVector(1, 1 if left.bv == right.bv else 0)
+
+def bv_neg(op):
+    """Two's complement negation"""
+    return op.new_bv((-op.bv) & op.max_unsigned)
+
+def bv_add(left, right):
+    """Addition (modulo 2^width)"""
+    _same_width(left, right)
+    return left.new_bv((left.bv + right.bv) & left.max_unsigned)
+
+def bv_sub(left, right):
+    """Substraction (modulo 2^width)"""
+    _same_width(left, right)
+    return left.new_bv((left.bv - right.bv) & left.max_unsigned)
+
+def bv_mul(left, right):
+    """Multiplication (modulo 2^width)"""
+    _same_width(left, right)
+    return left.new_bv((left.bv * right.bv) & left.max_unsigned)
+
+def bv_udiv(left, right):
+    """Unsigned division
+
+    Division by zero gives all ones.
+    """
+    _same_width(left, right)
+    if right.bv == 0:
+        return left.new_bv(left.max_unsigned)
+    return left.new_bv(left.bv // right.bv)
+
+def bv_urem(left, right):
+    """Unsigned remainder
+
+    Remainder by zero gives *left*.
+    """
+    _same_width(left, right)
+    if right.bv == 0:
+        return left.new_bv(left.bv)
+    return left.new_bv(left.bv % right.bv)
+
+def bv_sdiv(left, right):
+    """Signed division (rounding towards zero)"""
+    _same_width(left, right)
+    msb_l = left.bv >> (left.width - 1)
+    msb_r = right.bv >> (right.width - 1)
+    if not msb_l and not msb_r:
+        return bv_udiv(left, right)
+    elif msb_l and not msb_r:
+        return bv_neg(bv_udiv(bv_neg(left), right))
+    elif not msb_l and msb_r:
+        return bv_neg(bv_udiv(left, bv_neg(right)))
+    else:
+        return bv_udiv(bv_neg(left), bv_neg(right))
+
+def bv_srem(left, right):
+    """Signed remainder (sign follows the dividend)"""
+    _same_width(left, right)
+    msb_l = left.bv >> (left.width - 1)
+    msb_r = right.bv >> (right.width - 1)
+    if not msb_l and not msb_r:
+        return bv_urem(left, right)
+    elif msb_l and not msb_r:
+        return bv_neg(bv_urem(bv_neg(left), right))
+    elif not msb_l and msb_r:
+        return bv_urem(left, bv_neg(right))
+    else:
+        return bv_neg(bv_urem(bv_neg(left), bv_neg(right)))
+
+def bv_smod(left, right):
+    """Signed remainder (sign follows the divisor)"""
+    _same_width(left, right)
+    msb_l = left.bv >> (left.width - 1)
+    msb_r = right.bv >> (right.width - 1)
+    abs_l = bv_neg(left) if msb_l else left
+    abs_r = bv_neg(right) if msb_r else right
+    u = bv_urem(abs_l, abs_r)
+    if u.bv == 0 or (not msb_l and not msb_r):
+        return u
+    elif msb_l and not msb_r:
+        return bv_add(bv_neg(u), right)
+    elif not msb_l and msb_r:
+        return bv_add(u, right)
+    else:
+        return bv_neg(u)
+
+def bv_shl(left, right):
+    """Shift left"""
+    _same_width(left, right)
+    if right.bv >= left.width:
+        return left.new_bv(0)
+    return left.new_bv((left.bv << right.bv) & left.max_unsigned)
+
+def bv_lshr(left, right):
+    """Logical shift right"""
+    _same_width(left, right)
+    if right.bv >= left.width:
+        return left.new_bv(0)
+    return left.new_bv(left.bv >> right.bv)
+
+def bv_ashr(left, right):
+    """Arithmetic shift right"""
+    _same_width(left, right)
+    rv = left.new_bv()
+    rv.from_signed_int(left.to_signed_int() >> min(right.bv, left.width))
+    return rv
+
+def bv_ult(left, right):
+    """Unsigned less than"""
+    _same_width(left, right)
+    return left.bv < right.bv
+
+def bv_ule(left, right):
+    """Unsigned less than or equal"""
+    _same_width(left, right)
+    return left.bv <= right.bv
+
+def bv_ugt(left, right):
+    """Unsigned greater than"""
+    _same_width(left, right)
+    return left.bv > right.bv
+
+def bv_uge(left, right):
+    """Unsigned greater than or equal"""
+    _same_width(left, right)
+    return left.bv >= right.bv
+
+def bv_slt(left, right):
+    """Signed less than"""
+    _same_width(left, right)
+    return left.to_signed_int() < right.to_signed_int()
+
+def bv_sle(left, right):
+    """Signed less than or equal"""
+    _same_width(left, right)
+    return left.to_signed_int() <= right.to_signed_int()
+
+def bv_sgt(left, right):
+    """Signed greater than"""
+    _same_width(left, right)
+    return left.to_signed_int() > right.to_signed_int()
+
+def bv_sge(left, right):
+    """Signed greater than or equal"""
+    _same_width(left, right)
+    return left.to_signed_int() >= right.to_signed_int()
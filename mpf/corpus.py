@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                                PYMPF                                     ##
+##                                                                          ##
+##              Copyright (C) 2020,      Florian Schanda                    ##
+##                                                                          ##
+##  This file is part of PyMPF.                                             ##
+##                                                                          ##
+##  PyMPF is free software: you can redistribute it and/or modify           ##
+##  it under the terms of the GNU General Public License as published by    ##
+##  the Free Software Foundation, either version 3 of the License, or       ##
+##  (at your option) any later version.                                     ##
+##                                                                          ##
+##  PyMPF is distributed in the hope that it will be useful,                ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with PyMPF. If not, see <http://www.gnu.org/licenses/>.           ##
+##                                                                          ##
+##############################################################################
+
+
+"""
+This module reads and writes corpora of floats and test vectors in a
+compact binary format. Readers memory-map the file, and give access
+to the operands and results as :class:`.MPF_Array` views without
+parsing or copying:
+
+>>> with Corpus_Writer("add.vec", 8, 24, "fp.add", RM_RNE) as w:
+...     w.write((x, y), fp_add(RM_RNE, x, y))
+>>> with Corpus_Reader("add.vec") as r:
+...     xs = r.column(0)
+...     bad = list(r.replay())
+
+The file consists of a header followed by fixed-size records. All
+integers are little-endian. The header is:
+
+======  ======  =====================================================
+offset  size    contents
+======  ======  =====================================================
+0       8       magic "PYMPFVEC"
+8       2       format version (1)
+10      2       size of the header (a multiple of 8)
+12      4       eb
+16      4       sb
+20      1       arity (number of operands)
+21      1       result: 0 = none, 1 = float, 2 = boolean
+22      1       rounding mode: 0 = none, 1 to 5 = RNE, RNA, RTP, RTN,
+                RTZ
+23      1       length n of the operation name
+24      n       operation name (ASCII), padded with zeros
+======  ======  =====================================================
+
+Each record is *arity* operands followed by the result (if any), each
+a field of the same width: 1, 2, 4 or 8 bytes for formats of up to
+64 bits, and otherwise the smallest multiple of 8 bytes that can hold
+a bit pattern. Operands and float results are stored as bit patterns,
+boolean results as 0 or 1. A corpus of plain values has no operation
+name, an arity of 1 and no result.
+
+The number of records follows from the file size. An incomplete
+trailing record (for example from a writer that was killed) is
+ignored.
+"""
+
+import os
+import sys
+import mmap
+import struct
+
+from .floats import *
+from .arrays import view
+
+MAGIC   = b"PYMPFVEC"
+VERSION = 1
+
+# magic, version, header size, eb, sb, arity, result, rm, name length
+HEADER = struct.Struct("<8sHHIIBBBB")
+
+RESULT_NONE  = 0
+RESULT_FLOAT = 1
+RESULT_BOOL  = 2
+
+class Corpus_Error(Exception):
+    pass
+
+def field_width(k):
+    """Number of bytes used for a bit pattern of a k-bit float"""
+    for width in (1, 2, 4, 8):
+        if width * 8 >= k:
+            return width
+    return (k + 63) // 64 * 8
+
+def supported_operations():
+    """Operations that test vectors can be stored for
+
+    These take floats of one format (and possibly a rounding mode)
+    and return a float of the same format or a boolean.
+    """
+    return sorted(op_name
+                  for op_name, op in FP_OPS.items()
+                  if op.args_type == TYP_FLOAT and
+                  not op.precision_arg and
+                  op.result_type in (TYP_FLOAT, TYP_BOOL))
+
+class Corpus_Writer:
+    """Writes a corpus to *filename*
+
+    If *op_name* (see :func:`supported_operations`) is given, this
+    writes test vectors for that operation under rounding mode *rm*
+    (which must be None for operations without a rounding
+    mode). Otherwise this writes plain values of the format.
+
+    Records are buffered, and written in chunks of about
+    *buffer_size* bytes.
+    """
+    def __init__(self, filename, eb, sb, op_name=None, rm=None,
+                 buffer_size=2 ** 20):
+        assert MPF.MIN_EB <= eb <= MPF.MAX_EB
+        assert sb >= MPF.MIN_SB
+        self.eb     = eb
+        self.sb     = sb
+        self.width  = field_width(eb + sb)
+        self.buffer = bytearray()
+        self.buffer_size = buffer_size
+
+        if op_name is None:
+            assert rm is None
+            self.arity  = 1
+            self.result = RESULT_NONE
+        else:
+            assert op_name in supported_operations()
+            op = FP_OPS[op_name]
+            if op.rm_arg:
+                assert rm in MPF.ROUNDING_MODES
+            else:
+                assert rm is None
+            self.arity = op.arity
+            if op.result_type == TYP_FLOAT:
+                self.result = RESULT_FLOAT
+            else:
+                self.result = RESULT_BOOL
+
+        name = (op_name or "").encode("ascii")
+        size = (HEADER.size + len(name) + 7) // 8 * 8
+        if rm is None:
+            rm_code = 0
+        else:
+            rm_code = MPF.ROUNDING_MODES.index(rm) + 1
+        header = HEADER.pack(MAGIC, VERSION, size, eb, sb,
+                             self.arity, self.result, rm_code, len(name))
+
+        self.fd = open(filename, "wb")
+        self.fd.write((header + name).ljust(size, b"\0"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _field(self, value):
+        if isinstance(value, MPF):
+            assert value.w == self.eb and value.p == self.sb
+            value = value.bv
+        self.buffer += value.to_bytes(self.width, "little")
+
+    def write(self, operands, result=None):
+        """Write one record
+
+        *operands* is a tuple of MPFs or bit patterns (a 1-tuple for
+        plain values). *result* is an MPF or bit pattern, or a bool
+        for predicates.
+        """
+        assert len(operands) == self.arity
+        for operand in operands:
+            self._field(operand)
+        if self.result == RESULT_NONE:
+            assert result is None
+        elif self.result == RESULT_BOOL:
+            assert isinstance(result, bool)
+            self._field(int(result))
+        else:
+            assert result is not None
+            self._field(result)
+
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def extend(self, records):
+        """Write (operands, result) pairs"""
+        for operands, result in records:
+            self.write(operands, result)
+
+    def flush(self):
+        self.fd.write(self.buffer)
+        self.fd.flush()
+        self.buffer = bytearray()
+
+    def close(self):
+        if not self.fd.closed:
+            self.flush()
+            self.fd.close()
+
+class Corpus_Reader:
+    """Memory-mapped reader for a corpus in *filename*
+
+    Raises Corpus_Error if the file is not a corpus.
+    """
+    def __init__(self, filename):
+        self.fd = open(filename, "rb")
+        try:
+            self._map()
+        except Exception:
+            self.fd.close()
+            raise
+
+    def _map(self):
+        size = os.fstat(self.fd.fileno()).st_size
+        if size < HEADER.size:
+            raise Corpus_Error("%s: file too short" % self.fd.name)
+        self.mm = mmap.mmap(self.fd.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, header_size, self.eb, self.sb, self.arity,
+         self.result, rm_code, name_length) = HEADER.unpack_from(self.mm)
+        if magic != MAGIC:
+            raise Corpus_Error("%s: not a corpus" % self.fd.name)
+        if version != VERSION:
+            raise Corpus_Error("%s: unsupported version %u" %
+                               (self.fd.name, version))
+        if header_size < HEADER.size + name_length or \
+           rm_code > len(MPF.ROUNDING_MODES) or \
+           self.result not in (RESULT_NONE, RESULT_FLOAT, RESULT_BOOL):
+            raise Corpus_Error("%s: corrupt header" % self.fd.name)
+
+        name = self.mm[HEADER.size:HEADER.size + name_length]
+        self.op_name = name.decode("ascii") or None
+        if self.op_name is not None and \
+           self.op_name not in supported_operations():
+            raise Corpus_Error("%s: unknown operation %s" %
+                               (self.fd.name, self.op_name))
+        if rm_code == 0:
+            self.rm = None
+        else:
+            self.rm = MPF.ROUNDING_MODES[rm_code - 1]
+
+        self.k      = self.eb + self.sb
+        self.width  = field_width(self.k)
+        self.fields = self.arity + (self.result != RESULT_NONE)
+        self.record_size = self.fields * self.width
+        self.count  = (size - header_size) // self.record_size
+        self.start  = header_size
+
+        # If the fields are native integers we can use a memoryview
+        # of the file as a flat sequence of bit patterns.
+        end = self.start + self.count * self.record_size
+        if self.width <= 8 and sys.byteorder == "little":
+            self.flat = memoryview(self.mm)[self.start:end].cast(
+                {1: "B", 2: "H", 4: "I", 8: "Q"}[self.width])
+        else:
+            self.flat = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        if self.flat is not None:
+            self.flat.release()
+            self.flat = None
+        try:
+            self.mm.close()
+        except BufferError:
+            # Views returned by column are still in use; the mapping
+            # is closed once they are gone.
+            pass
+        self.fd.close()
+
+    def _column(self, index):
+        if self.flat is not None:
+            return self.flat[index::self.fields]
+        offset = self.start + index * self.width
+        return [int.from_bytes(self.mm[pos:pos + self.width], "little")
+                for pos in range(offset,
+                                 self.start + self.count * self.record_size,
+                                 self.record_size)]
+
+    def column(self, index):
+        """Return the operands at *index* as an :class:`.MPF_Array`
+
+        For formats of up to 64 bits this is a read-only view of the
+        file.
+        """
+        assert 0 <= index < self.arity
+        return view(self.eb, self.sb, self._column(index))
+
+    def operands(self):
+        """Return a list of all operand columns, see :func:`column`"""
+        return [self.column(index) for index in range(self.arity)]
+
+    def results(self):
+        """Return the results
+
+        These are an :class:`.MPF_Array` for float results, or a
+        sequence of 0 and 1 for boolean results.
+        """
+        assert self.result != RESULT_NONE
+        if self.result == RESULT_FLOAT:
+            return view(self.eb, self.sb, self._column(self.arity))
+        else:
+            return self._column(self.arity)
+
+    def records(self):
+        """Yield each record as a tuple of ints"""
+        if self.flat is not None:
+            flat   = self.flat
+            fields = self.fields
+            for pos in range(0, self.count * fields, fields):
+                yield tuple(flat[pos:pos + fields])
+        else:
+            columns = [self._column(index) for index in range(self.fields)]
+            for record in zip(*columns):
+                yield record
+
+    def replay(self):
+        """Yield the index of each test vector PyMPF disagrees with
+
+        Results are compared with SMT-LIB equality, i.e. all NaNs
+        are equal. Where SMT-LIB leaves the result unspecified (for
+        example fp.min of +0 and -0) any stored result is accepted.
+        """
+        assert self.op_name is not None
+        op = FP_OPS[self.op_name]
+        for index, record in enumerate(self.records()):
+            args     = [MPF(self.eb, self.sb, bits)
+                        for bits in record[:self.arity]]
+            expected = record[self.arity]
+            try:
+                result = op.evaluate(self.rm, *args)
+            except Unspecified:
+                continue
+            if self.result == RESULT_BOOL:
+                if bool(result) != bool(expected):
+                    yield index
+            elif not smtlib_eq(result, MPF(self.eb, self.sb, expected)):
+                yield index
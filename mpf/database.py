@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                                PYMPF                                     ##
+##                                                                          ##
+##              Copyright (C) 2020,      Florian Schanda                    ##
+##                                                                          ##
+##  This file is part of PyMPF.                                             ##
+##                                                                          ##
+##  PyMPF is free software: you can redistribute it and/or modify           ##
+##  it under the terms of the GNU General Public License as published by    ##
+##  the Free Software Foundation, either version 3 of the License, or       ##
+##  (at your option) any later version.                                     ##
+##                                                                          ##
+##  PyMPF is distributed in the hope that it will be useful,                ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with PyMPF. If not, see <http://www.gnu.org/licenses/>.           ##
+##                                                                          ##
+##############################################################################
+
+
+"""
+This module provides a database of test vectors, stored with
+sqlite. Vectors are indexed by format, operation, rounding mode and
+the class (zero, subnormal, normal, infinity or nan) of the operands
+and result, so that targeted regression sets can be selected without
+scanning everything:
+
+>>> with Vector_Database("vectors.db") as db:
+...     db.insert_many(8, 24, "fp.div", RM_RTZ, vectors)
+...     for v in db.select(8, 24, "fp.div", RM_RTZ,
+...                        result_class="subnormal"):
+...         print(v)
+
+A vector is stored only once. Operands and results are compared by
+their bit patterns, except that all NaNs are the same (see
+:func:`mpf.floats.MPF.key`), so inserting the same vectors again (for
+example from another run) does nothing. Vectors with the same
+operands but different results are all kept: either SMT-LIB leaves
+the result unspecified (for example fp.min of +0 and -0), or one of
+them is wrong, which :func:`Vector.check` will find.
+
+Vectors can be moved to and from the binary format of
+:mod:`mpf.corpus` with :func:`Vector_Database.import_corpus` and
+:func:`Vector_Database.export_corpus`.
+"""
+
+import sqlite3
+
+from .floats import *
+from .corpus import Corpus_Writer, supported_operations
+
+CLASSES = ("zero", "subnormal", "normal", "infinity", "nan")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS vectors (
+    id       INTEGER PRIMARY KEY,
+    eb       INTEGER NOT NULL,
+    sb       INTEGER NOT NULL,
+    op       TEXT NOT NULL,
+    rm       TEXT NOT NULL,
+    operands TEXT NOT NULL,
+    result   TEXT NOT NULL,
+    class_0  TEXT NOT NULL,
+    class_1  TEXT,
+    class_2  TEXT,
+    result_class TEXT NOT NULL,
+    UNIQUE (eb, sb, op, rm, operands, result)
+);
+CREATE INDEX IF NOT EXISTS vectors_by_result
+    ON vectors (eb, sb, op, rm, result_class);
+CREATE INDEX IF NOT EXISTS vectors_by_operands
+    ON vectors (eb, sb, op, rm, class_0, class_1, class_2);
+"""
+
+def classify(eb, sb, bits):
+    """Return the class (one of :data:`CLASSES`) of a bit pattern"""
+    t = sb - 1
+    E = (bits >> t) & (2 ** eb - 1)
+    T = bits & ((1 << t) - 1)
+    if E == 0:
+        return "zero" if T == 0 else "subnormal"
+    elif E == 2 ** eb - 1:
+        return "infinity" if T == 0 else "nan"
+    else:
+        return "normal"
+
+def _canonical(eb, sb, bits):
+    if classify(eb, sb, bits) == "nan":
+        return (1 << (eb + sb)) - 1
+    return bits
+
+class Vector:
+    """A test vector from a :class:`Vector_Database`
+
+    *operands* are bit patterns, *result* is a bit pattern or a
+    bool. *rm* is None for operations without a rounding mode.
+    """
+    def __init__(self, ident, eb, sb, op_name, rm, operands, result):
+        self.ident    = ident
+        self.eb       = eb
+        self.sb       = sb
+        self.op_name  = op_name
+        self.rm       = rm
+        self.operands = operands
+        self.result   = result
+
+    def __str__(self):
+        return "%s %s %s = %s" % (
+            self.op_name,
+            self.rm or "",
+            " ".join(str(MPF(self.eb, self.sb, op))
+                     for op in self.operands),
+            (str(self.result).lower()
+             if isinstance(self.result, bool)
+             else str(MPF(self.eb, self.sb, self.result))))
+
+    def check(self):
+        """Test if PyMPF agrees with this vector
+
+        Results are compared with SMT-LIB equality. Where SMT-LIB
+        leaves the result unspecified any result is accepted.
+        """
+        args = [MPF(self.eb, self.sb, op) for op in self.operands]
+        try:
+            result = FP_OPS[self.op_name].evaluate(self.rm, *args)
+        except Unspecified:
+            return True
+        if isinstance(self.result, bool):
+            return bool(result) == self.result
+        return smtlib_eq(result, MPF(self.eb, self.sb, self.result))
+
+class Vector_Database:
+    """Test vectors stored in the sqlite database *filename*
+
+    The file is created if it does not exist.
+    """
+    def __init__(self, filename):
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def _row(self, eb, sb, op_name, rm, operands, result):
+        patterns = []
+        for operand in operands:
+            if isinstance(operand, MPF):
+                assert operand.w == eb and operand.p == sb
+                operand = operand.bv
+            patterns.append(_canonical(eb, sb, operand))
+        classes = [classify(eb, sb, bits) for bits in patterns]
+        classes += [None] * (3 - len(classes))
+
+        if isinstance(result, bool):
+            result_text  = "true" if result else "false"
+            result_class = result_text
+        else:
+            if isinstance(result, MPF):
+                assert result.w == eb and result.p == sb
+                result = result.bv
+            result_text  = "%x" % _canonical(eb, sb, result)
+            result_class = classify(eb, sb, result)
+
+        return (eb, sb, op_name, rm or "",
+                " ".join("%x" % bits for bits in patterns),
+                result_text,
+                classes[0], classes[1], classes[2],
+                result_class)
+
+    def insert_many(self, eb, sb, op_name, rm, vectors):
+        """Insert (operands, result) pairs in one transaction
+
+        Operands and float results are MPFs or bit patterns, and
+        results of predicates are bools. Returns the number of new
+        vectors.
+        """
+        assert op_name in supported_operations()
+        op = FP_OPS[op_name]
+        if op.rm_arg:
+            assert rm in MPF.ROUNDING_MODES
+        else:
+            assert rm is None
+
+        def rows():
+            for operands, result in vectors:
+                assert len(operands) == op.arity
+                yield self._row(eb, sb, op_name, rm, operands, result)
+
+        before = self.connection.total_changes
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO vectors"
+                " (eb, sb, op, rm, operands, result,"
+                "  class_0, class_1, class_2, result_class)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows())
+        return self.connection.total_changes - before
+
+    def insert(self, eb, sb, op_name, rm, operands, result):
+        """Insert one vector, returns True if it is new"""
+        return self.insert_many(eb, sb, op_name, rm,
+                                [(operands, result)]) == 1
+
+    def import_corpus(self, reader):
+        """Insert all test vectors of a :class:`.Corpus_Reader`"""
+        assert reader.op_name is not None
+        boolean = FP_OPS[reader.op_name].result_type == TYP_BOOL
+        arity   = reader.arity
+        return self.insert_many(
+            reader.eb, reader.sb, reader.op_name, reader.rm,
+            ((record[:arity],
+              bool(record[arity]) if boolean else record[arity])
+             for record in reader.records()))
+
+    def _where(self, eb, sb, op_name, rm, operand_classes, result_class,
+               after):
+        clauses = ["id > ?"]
+        params  = [after]
+        for column, value in (("eb", eb),
+                              ("sb", sb),
+                              ("op", op_name),
+                              ("rm", rm),
+                              ("result_class", result_class)):
+            if value is not None:
+                clauses.append("%s = ?" % column)
+                params.append(value)
+        if operand_classes is not None:
+            for index, cls in enumerate(operand_classes):
+                if cls is not None:
+                    clauses.append("class_%u = ?" % index)
+                    params.append(cls)
+        return " AND ".join(clauses), params
+
+    def count(self, eb=None, sb=None, op_name=None, rm=None,
+              operand_classes=None, result_class=None):
+        """Number of vectors matching, see :func:`select`"""
+        where, params = self._where(eb, sb, op_name, rm, operand_classes,
+                                    result_class, 0)
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM vectors WHERE " + where,
+            params).fetchone()[0]
+
+    def select(self, eb=None, sb=None, op_name=None, rm=None,
+               operand_classes=None, result_class=None, after=0,
+               limit=None):
+        """Yield matching vectors as :class:`Vector`
+
+        Each argument that is not None restricts the vectors
+        returned. *operand_classes* is a sequence with a class (or
+        None for any class) for each operand, and *result_class* is a
+        class or "true" or "false" for predicates.
+
+        Vectors are returned in the order they were inserted, and
+        only those after the vector with the given *after* ident, so
+        that a long scan can be resumed from the last vector seen.
+        """
+        where, params = self._where(eb, sb, op_name, rm, operand_classes,
+                                    result_class, after)
+        query = ("SELECT id, eb, sb, op, rm, operands, result"
+                 " FROM vectors WHERE " + where + " ORDER BY id")
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        cursor = self.connection.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(1000)
+            if not rows:
+                break
+            for ident, eb, sb, op_name, rm, operands, result in rows:
+                if result in ("true", "false"):
+                    result = result == "true"
+                else:
+                    result = int(result, 16)
+                yield Vector(ident, eb, sb, op_name, rm or None,
+                             tuple(int(op, 16) for op in operands.split()),
+                             result)
+
+    def export_corpus(self, filename, eb, sb, op_name, rm,
+                      operand_classes=None, result_class=None):
+        """Write matching vectors to a corpus file
+
+        See :mod:`mpf.corpus` and :func:`select`. Returns the number
+        of vectors written.
+        """
+        count = 0
+        with Corpus_Writer(filename, eb, sb, op_name, rm) as writer:
+            for vector in self.select(eb, sb, op_name, rm or "",
+                                      operand_classes, result_class):
+                writer.write(vector.operands, vector.result)
+                count += 1
+        return count
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                                PYMPF                                     ##
+##                                                                          ##
+##              Copyright (C) 2020,      Florian Schanda                    ##
+##                                                                          ##
+##  This file is part of PyMPF.                                             ##
+##                                                                          ##
+##  PyMPF is free software: you can redistribute it and/or modify           ##
+##  it under the terms of the GNU General Public License as published by    ##
+##  the Free Software Foundation, either version 3 of the License, or       ##
+##  (at your option) any later version.                                     ##
+##                                                                          ##
+##  PyMPF is distributed in the hope that it will be useful,                ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with PyMPF. If not, see <http://www.gnu.org/licenses/>.           ##
+##                                                                          ##
+##############################################################################
+
+"""
+This module implements differential testing of PyMPF against the
+native (hardware) implementation of binary16, binary32 and binary64
+under RNE. It can be used to validate either side against the other.
+
+Operands are generated in bulk as bit-patterns. The native side is
+evaluated with NumPy (vectorised) if it is installed, and otherwise
+with Python floats and the struct module. For binary16 and binary32
+we compute in binary64 and round the result; this is correct for
+add, sub, mul, div and sqrt since binary64 has more than 2p + 2 bits
+of precision. The PyMPF side is evaluated in batches, optionally
+using several processes.
+
+Results are compared using SMT-LIB equality (see
+:func:`mpf.floats.smtlib_eq`), i.e. all NaNs are equal, and only
+disagreements are reported:
+
+>>> for d in differential("fp.add", "Float32", count=10000):
+...     print(d)
+
+It can also be run from the command line:
+
+    $ python3 -m mpf.differential --format Float16 --ops fp.add fp.mul
+
+which prints one JSON object per disagreement.
+"""
+
+import sys
+import json
+import math
+import random
+import struct
+import argparse
+import collections
+import multiprocessing
+import concurrent.futures
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .floats import *
+
+# name : (eb, sb, struct format for the float, struct format for bits,
+#         numpy float type name, numpy integer type name)
+NATIVE_FORMATS = {
+    "Float16" : (5, 11, "<e", "<H", "float16", "uint16"),
+    "Float32" : (8, 24, "<f", "<I", "float32", "uint32"),
+    "Float64" : (11, 53, "<d", "<Q", "float64", "uint64"),
+}
+
+def _native_round_to_integral(x):
+    if math.isinf(x) or math.isnan(x):
+        return x
+    return math.copysign(float(round(x)), x)
+
+# Operations we can compare. Values are the native implementation
+# on Python floats, and the NumPy function (or None if there is no
+# suitable vectorised implementation).
+NATIVE_OPS = {
+    "fp.add"             : (lambda x, y: x + y,        "add"),
+    "fp.sub"             : (lambda x, y: x - y,        "subtract"),
+    "fp.mul"             : (lambda x, y: x * y,        "multiply"),
+    "fp.div"             : (lambda x, y: _native_div(x, y), "divide"),
+    "fp.sqrt"            : (lambda x: _native_sqrt(x), "sqrt"),
+    "fp.roundToIntegral" : (_native_round_to_integral, "rint"),
+    "fp.eq"              : (lambda x, y: x == y,       "equal"),
+    "fp.lt"              : (lambda x, y: x < y,        "less"),
+    "fp.gt"              : (lambda x, y: x > y,        "greater"),
+    "fp.leq"             : (lambda x, y: x <= y,       "less_equal"),
+    "fp.geq"             : (lambda x, y: x >= y,       "greater_equal"),
+}
+if hasattr(math, "remainder"):
+    NATIVE_OPS["fp.rem"] = (lambda x, y: _native_rem(x, y), None)
+if hasattr(math, "fma"):
+    NATIVE_OPS["fp.fma"] = (lambda x, y, z: _native_fma(x, y, z), None)
+
+# fp.fma can only be done natively in binary64, as computing it in
+# binary64 and then rounding is not correct for the smaller formats.
+BINARY64_ONLY = frozenset(["fp.fma"])
+
+def _native_div(x, y):
+    if y == 0:
+        if x == 0 or math.isnan(x):
+            return float("nan")
+        return math.copysign(float("inf"), x) * math.copysign(1.0, y)
+    return x / y
+
+def _native_sqrt(x):
+    if math.isnan(x) or (x < 0):
+        return float("nan")
+    return math.sqrt(x)
+
+def _native_rem(x, y):
+    if math.isnan(x) or math.isnan(y) or math.isinf(x) or y == 0:
+        return float("nan")
+    elif math.isinf(y):
+        return x
+    return math.remainder(x, y)
+
+def _native_fma(x, y, z):
+    try:
+        return math.fma(x, y, z)
+    except ValueError:
+        return float("nan")
+
+def supported_operations(fmt):
+    """Operations that can be compared for the given native format"""
+    return sorted(op_name
+                  for op_name in NATIVE_OPS
+                  if fmt == "Float64" or op_name not in BINARY64_ONLY)
+
+class Disagreement:
+    """A case where PyMPF and the native implementation differ
+
+    *operands* is a tuple of bit-patterns, *native* and *pympf* are
+    the results (bit-patterns, or bools for predicates).
+    """
+    def __init__(self, op_name, fmt, operands, native, pympf):
+        self.op_name  = op_name
+        self.fmt      = fmt
+        self.operands = operands
+        self.native   = native
+        self.pympf    = pympf
+
+    def __str__(self):
+        eb, sb = NATIVE_FORMATS[self.fmt][:2]
+        return "%s RNE %s: native=%s pympf=%s" % (
+            self.op_name,
+            " ".join(str(MPF(eb, sb, op)) for op in self.operands),
+            self._describe(self.native),
+            self._describe(self.pympf))
+
+    def _describe(self, result):
+        if isinstance(result, bool):
+            return str(result).lower()
+        eb, sb = NATIVE_FORMATS[self.fmt][:2]
+        return str(MPF(eb, sb, result))
+
+    def to_json(self):
+        return {"op"       : self.op_name,
+                "format"   : self.fmt,
+                "rm"       : RM_RNE,
+                "operands" : ["0x%x" % op for op in self.operands],
+                "native"   : (self.native
+                              if isinstance(self.native, bool)
+                              else "0x%x" % self.native),
+                "pympf"    : (self.pympf
+                              if isinstance(self.pympf, bool)
+                              else "0x%x" % self.pympf)}
+
+##############################################################################
+# Operand generation
+##############################################################################
+
+def generate_operands(rng, fmt, arity, count):
+    """Generate *count* tuples of *arity* random bit-patterns
+
+    Patterns are uniformly distributed, except that a quarter are
+    special (zeros, infinities, NaN, subnormals, or values close to
+    1) as these are otherwise rare.
+    """
+    eb, sb = NATIVE_FORMATS[fmt][:2]
+    k = eb + sb
+    t = sb - 1
+    exp_mask = (2 ** eb - 1) << t
+    specials = [0,                         # +0
+                1,                         # smallest subnormal
+                (1 << t) - 1,              # largest subnormal
+                1 << t,                    # smallest normal
+                exp_mask - 1,              # largest normal
+                exp_mask,                  # +oo
+                exp_mask | 1,              # NaN
+                (2 ** (eb - 1) - 1) << t]  # 1.0
+
+    def one():
+        if rng.random() < 0.25:
+            bits = rng.choice(specials)
+            if rng.random() < 0.5:
+                bits ^= rng.getrandbits(2)
+            return (bits | (rng.getrandbits(1) << (k - 1))) % (2 ** k)
+        return rng.getrandbits(k)
+
+    return [tuple(one() for _ in range(arity)) for _ in range(count)]
+
+##############################################################################
+# Evaluation
+##############################################################################
+
+def _is_nan(fmt, bits):
+    eb, sb = NATIVE_FORMATS[fmt][:2]
+    t = sb - 1
+    return ((bits >> t) & (2 ** eb - 1)) == 2 ** eb - 1 and \
+        bits & ((1 << t) - 1) != 0
+
+def _to_float(fmt, bits):
+    _, _, float_fmt, bits_fmt, _, _ = NATIVE_FORMATS[fmt]
+    return struct.unpack(float_fmt, struct.pack(bits_fmt, bits))[0]
+
+def _from_float(fmt, value):
+    _, _, float_fmt, bits_fmt, _, _ = NATIVE_FORMATS[fmt]
+    try:
+        packed = struct.pack(float_fmt, value)
+    except OverflowError:
+        # The struct module refuses values that round to infinity
+        packed = struct.pack(float_fmt, math.copysign(float("inf"),
+                                                      value))
+    return struct.unpack(bits_fmt, packed)[0]
+
+def evaluate_native(op_name, fmt, operands):
+    """Evaluate natively, returns a list of results
+
+    Results are bit-patterns (or bools for predicates).
+    """
+    fn, numpy_fn = NATIVE_OPS[op_name]
+    predicate = FP_OPS[op_name].result_type == TYP_BOOL
+
+    if numpy is not None and numpy_fn is not None and len(operands) > 0:
+        return _evaluate_numpy(numpy_fn, fmt, operands, predicate)
+
+    rv = []
+    for args in operands:
+        result = fn(*[_to_float(fmt, arg) for arg in args])
+        if predicate:
+            rv.append(bool(result))
+        else:
+            rv.append(_from_float(fmt, result))
+    return rv
+
+def _evaluate_numpy(numpy_fn, fmt, operands, predicate):
+    _, _, _, _, float_type, int_type = NATIVE_FORMATS[fmt]
+    arity = len(operands[0])
+    columns = [numpy.array([args[i] for args in operands],
+                           dtype=int_type).view(float_type)
+               for i in range(arity)]
+    with numpy.errstate(all="ignore"):
+        result = getattr(numpy, numpy_fn)(*columns)
+    if predicate:
+        return [bool(x) for x in result]
+    else:
+        return [int(x) for x in result.astype(float_type).view(int_type)]
+
+def evaluate_pympf(op_name, fmt, operands):
+    """Evaluate with PyMPF, returns a list of results
+
+    Results are bit-patterns (or bools for predicates).
+    """
+    eb, sb = NATIVE_FORMATS[fmt][:2]
+    op = FP_OPS[op_name]
+    rm = RM_RNE if op.rm_arg else None
+    rv = []
+    for args in operands:
+        result = op.evaluate(rm, *[MPF(eb, sb, arg) for arg in args])
+        if isinstance(result, MPF):
+            rv.append(result.bv)
+        else:
+            rv.append(bool(result))
+    return rv
+
+def compare_batch(op_name, fmt, operands, native, pympf):
+    """Yields a Disagreement for each result that differs"""
+    for args, n_result, p_result in zip(operands, native, pympf):
+        if n_result == p_result:
+            continue
+        elif not isinstance(n_result, bool) and \
+             _is_nan(fmt, n_result) and _is_nan(fmt, p_result):
+            continue
+        yield Disagreement(op_name, fmt, args, n_result, p_result)
+
+def differential(op_name, fmt, count, seed=0, batch_size=10000,
+                 processes=1, threads=1):
+    """Compare PyMPF and native results on random operands
+
+    Generates *count* random operand tuples in batches of
+    *batch_size*, and yields a :class:`Disagreement` for each case
+    where PyMPF and the native implementation differ. If
+    *processes* or *threads* is larger than 1 then PyMPF batches are
+    evaluated in parallel in that many processes or threads. Threads
+    avoid pickling the batches, but only run in parallel on
+    free-threaded builds of Python.
+    """
+    assert fmt in NATIVE_FORMATS
+    assert op_name in supported_operations(fmt)
+
+    rng = random.Random("%s:%s:%u" % (op_name, fmt, seed))
+    arity = FP_OPS[op_name].arity
+
+    def batches():
+        remaining = count
+        while remaining > 0:
+            size = min(batch_size, remaining)
+            yield generate_operands(rng, fmt, arity, size)
+            remaining -= size
+
+    # Batches are generated as they are needed, with a few per worker
+    # in flight, so that memory does not grow with count.
+    assert processes == 1 or threads == 1
+    if processes > 1:
+        pool = multiprocessing.Pool(processes)
+        submit = lambda batch: pool.apply_async(
+            evaluate_pympf, (op_name, fmt, batch)).get
+        results = _in_order(submit, batches(), 2 * processes)
+    elif threads > 1:
+        pool = concurrent.futures.ThreadPoolExecutor(threads)
+        submit = lambda batch: pool.submit(
+            evaluate_pympf, op_name, fmt, batch).result
+        results = _in_order(submit, batches(), 2 * threads)
+    else:
+        pool = None
+        results = ((batch, evaluate_pympf(op_name, fmt, batch))
+                   for batch in batches())
+
+    try:
+        for batch, pympf in results:
+            native = evaluate_native(op_name, fmt, batch)
+            for disagreement in compare_batch(op_name, fmt, batch,
+                                              native, pympf):
+                yield disagreement
+    finally:
+        if isinstance(pool, concurrent.futures.ThreadPoolExecutor):
+            pool.shutdown(wait=False)
+        elif pool is not None:
+            pool.terminate()
+
+def _in_order(submit, batches, window):
+    # Yields (batch, results) in order. submit(batch) starts the
+    # evaluation and returns a function waiting for its results; at
+    # most window batches are evaluated at the same time.
+    pending = collections.deque()
+    for batch in batches:
+        pending.append((batch, submit(batch)))
+        if len(pending) >= window:
+            batch, wait = pending.popleft()
+            yield batch, wait()
+    while pending:
+        batch, wait = pending.popleft()
+        yield batch, wait()
+
+def main():
+    ap = argparse.ArgumentParser(
+        description=("Differential testing of PyMPF against native"
+                     " floating-point (RNE only)"))
+    ap.add_argument("--format",
+                    choices=sorted(NATIVE_FORMATS),
+                    default="Float32")
+    ap.add_argument("--ops",
+                    nargs="+",
+                    default=None,
+                    help="Operations to test (default all supported)")
+    ap.add_argument("--count",
+                    type=int,
+                    default=100000)
+    ap.add_argument("--batch-size",
+                    type=int,
+                    default=10000)
+    ap.add_argument("--processes",
+                    type=int,
+                    default=1)
+    ap.add_argument("--threads",
+                    type=int,
+                    default=1)
+    ap.add_argument("--seed",
+                    type=int,
+                    default=0)
+    options = ap.parse_args()
+
+    op_names = options.ops or supported_operations(options.format)
+    for op_name in op_names:
+        if op_name not in supported_operations(options.format):
+            ap.error("%s is not supported for %s" % (op_name,
+                                                     options.format))
+    if options.processes > 1 and options.threads > 1:
+        ap.error("cannot use both --processes and --threads")
+
+    disagreements = 0
+    for op_name in op_names:
+        for disagreement in differential(op_name,
+                                         options.format,
+                                         options.count,
+                                         options.seed,
+                                         options.batch_size,
+                                         options.processes,
+                                         options.threads):
+            disagreements += 1
+            sys.stdout.write(json.dumps(disagreement.to_json()) + "\n")
+            sys.stdout.flush()
+
+    return 1 if disagreements else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,740 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                                PYMPF                                     ##
+##                                                                          ##
+##              Copyright (C) 2020,      Florian Schanda                    ##
+##                                                                          ##
+##  This file is part of PyMPF.                                             ##
+##                                                                          ##
+##  PyMPF is free software: you can redistribute it and/or modify           ##
+##  it under the terms of the GNU General Public License as published by    ##
+##  the Free Software Foundation, either version 3 of the License, or       ##
+##  (at your option) any later version.                                     ##
+##                                                                          ##
+##  PyMPF is distributed in the hope that it will be useful,                ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with PyMPF. If not, see <http://www.gnu.org/licenses/>.           ##
+##                                                                          ##
+##############################################################################
+
+
+"""
+This module implements correctly rounded elementary functions for
+all precisions and rounding modes:
+
+>>> fp_exp(RM_RNA, x)
+>>> fp_pow(RM_RTZ, x, y)
+
+Functions are evaluated with interval arithmetic on fixed-point
+integers: a real number is enclosed by integers (lo, hi) such that
+:math:`lo * 2^{-W} \\le v \\le hi * 2^{-W}`, where every operation
+rounds outwards. The result is correctly rounded if both ends of the
+enclosure round to the same float (as rounding is monotonic).
+Otherwise the working precision W is doubled and we try again (this
+is Ziv's strategy).
+
+This only terminates if the precise result is not exactly a float
+or the midpoint between two floats. Except for the special cases
+(e.g. exp(0) or log(1)) the results of exp, log, sin, cos and atan
+of a non-zero float are transcendental, and log2 is irrational
+unless the argument is a power of two. For pow all results that are
+dyadic rationals are computed exactly instead.
+
+The constants ln(2) and pi are cached at the highest precision
+requested so far. The cache is shared by all threads and guarded by
+a lock.
+
+Note that for sin and cos the argument reduction needs pi to about
+as many bits as the exponent of the argument, so this gets slow for
+very large exponents.
+"""
+
+import threading
+
+from .floats import *
+from .floats import _isqrt
+from . import instrumentation
+
+##############################################################################
+# Interval arithmetic on fixed-point integers
+##############################################################################
+
+# In this section a and b are intervals (lo, hi) of integers scaled
+# by 2^W.
+
+def _fixed(sign, m, e, W):
+    # The interval for (-1)^sign * m * 2^e
+    if e + W >= 0:
+        lo = hi = m << (e + W)
+    else:
+        lo = m >> -(e + W)
+        hi = -((-m) >> -(e + W))
+    if sign:
+        return (-hi, -lo)
+    else:
+        return (lo, hi)
+
+def _shift(a, s):
+    # Divide by 2^s (or multiply for negative s)
+    if s >= 0:
+        return (a[0] >> s, -((-a[1]) >> s))
+    else:
+        return (a[0] << -s, a[1] << -s)
+
+def _add(a, b):
+    return (a[0] + b[0], a[1] + b[1])
+
+def _sub(a, b):
+    return (a[0] - b[1], a[1] - b[0])
+
+def _neg(a):
+    return (-a[1], -a[0])
+
+def _scale(a, n):
+    # Multiply by the integer n
+    if n >= 0:
+        return (a[0] * n, a[1] * n)
+    else:
+        return (a[1] * n, a[0] * n)
+
+def _widen(a, n):
+    return (a[0] - n, a[1] + n)
+
+def _magnitude(a):
+    return max(abs(a[0]), abs(a[1]))
+
+def _mul(a, b, W):
+    products = (a[0] * b[0], a[0] * b[1], a[1] * b[0], a[1] * b[1])
+    return _shift((min(products), max(products)), W)
+
+def _sqr(a, W):
+    if a[0] <= 0 <= a[1]:
+        return _shift((0, _magnitude(a) ** 2), W)
+    return _mul(a, a, W)
+
+def _div_int(a, n):
+    # Divide by the integer n > 0
+    return (a[0] // n, -((-a[1]) // n))
+
+def _div(a, b, W):
+    # Divide by an interval that is strictly positive
+    assert b[0] > 0
+    lo = min((x << W) // y for x in a for y in b)
+    hi = max(-((-x << W) // y) for x in a for y in b)
+    return (lo, hi)
+
+def _sqrt(a, W):
+    assert a[0] >= 0
+    hi = _isqrt(a[1] << W)
+    if hi * hi < a[1] << W:
+        hi += 1
+    return (_isqrt(a[0] << W), hi)
+
+##############################################################################
+# Constants
+##############################################################################
+
+def _atan_inv(n, W):
+    # atan(1/n) for an integer n >= 2. Each term is floor(2^W / ((2k
+    # + 1) * n^(2k + 1))), so has an error less than 1. The series
+    # alternates, so the tail is less than the first term left out.
+    power = (1 << W) // n
+    total = 0
+    k     = 0
+    while power:
+        term = power // (2 * k + 1)
+        if k % 2:
+            total -= term
+        else:
+            total += term
+        power //= n * n
+        k      += 1
+    return (total - k - 1, total + k + 1)
+
+def _atanh_inv(n, W):
+    # atanh(1/n) for an integer n >= 2, as _atan_inv. All terms are
+    # positive, and the tail is less than 4/3.
+    power = (1 << W) // n
+    total = 0
+    k     = 0
+    while power:
+        total  += power // (2 * k + 1)
+        power //= n * n
+        k      += 1
+    return (total, total + k + 2)
+
+def _compute_ln2(W):
+    # ln(2) = 2 * atanh(1/3)
+    return _scale(_atanh_inv(3, W), 2)
+
+def _compute_pi(W):
+    # Machin's formula: pi = 16 * atan(1/5) - 4 * atan(1/239)
+    return _sub(_scale(_atan_inv(5, W), 16),
+                _scale(_atan_inv(239, W), 4))
+
+_CONSTANT_FUNCTIONS = {
+    "ln2" : _compute_ln2,
+    "pi"  : _compute_pi,
+}
+
+# name -> (W, interval). Entries are only replaced while holding
+# the lock, so that two threads cannot replace a more precise value
+# with a less precise one, or compute the same constant twice.
+_CONSTANTS      = {}
+_CONSTANTS_LOCK = threading.Lock()
+
+def _constant(name, W):
+    cached = _CONSTANTS.get(name, None)
+    if cached is None or cached[0] < W:
+        with _CONSTANTS_LOCK:
+            cached = _CONSTANTS.get(name, None)
+            if cached is None or cached[0] < W:
+                if instrumentation.ENABLED:
+                    instrumentation.count("elementary.constants")
+                # A few more bits than needed, so that we do not
+                # recompute for small increases of W.
+                precision = W + 64
+                cached = (precision, _CONSTANT_FUNCTIONS[name](precision))
+                _CONSTANTS[name] = cached
+    precision, value = cached
+    return _shift(value, precision - W)
+
+def clear_cache():
+    """Forget the cached constants (ln 2 and pi)
+
+    They are recomputed, at the precision needed, on next use.
+    """
+    with _CONSTANTS_LOCK:
+        _CONSTANTS.clear()
+
+##############################################################################
+# Series
+##############################################################################
+
+# In the series below we stop once a term is at most 1 (i.e. 2^-W),
+# at which point the remaining terms add up to at most 1 as well.
+
+def _exp_series(r, W):
+    # exp(r) for |r| <= 1
+    assert _magnitude(r) <= 1 << W
+    term  = (1 << W, 1 << W)
+    total = term
+    n     = 0
+    while _magnitude(term) > 1:
+        n     += 1
+        term   = _div_int(_mul(term, r, W), n)
+        total  = _add(total, term)
+    return _widen(total, 2)
+
+def _sin_series(r, W):
+    # sin(r) for |r| <= 1
+    assert _magnitude(r) <= 1 << W
+    r2    = _sqr(r, W)
+    term  = r
+    total = r
+    k     = 0
+    while _magnitude(term) > 1:
+        k     += 1
+        term   = _neg(_div_int(_mul(term, r2, W), (2 * k) * (2 * k + 1)))
+        total  = _add(total, term)
+    return _widen(total, 2)
+
+def _cos_series(r, W):
+    # cos(r) for |r| <= 1
+    assert _magnitude(r) <= 1 << W
+    r2    = _sqr(r, W)
+    term  = (1 << W, 1 << W)
+    total = term
+    k     = 0
+    while _magnitude(term) > 1:
+        k     += 1
+        term   = _neg(_div_int(_mul(term, r2, W), (2 * k - 1) * (2 * k)))
+        total  = _add(total, term)
+    return _widen(total, 2)
+
+def _atan_series(z, W):
+    # atan(z) for |z| <= 1/2
+    assert 2 * _magnitude(z) <= 1 << W
+    z2    = _sqr(z, W)
+    power = z
+    total = z
+    k     = 0
+    while _magnitude(power) > 1:
+        k     += 1
+        power  = _neg(_mul(power, z2, W))
+        total  = _add(total, _div_int(power, 2 * k + 1))
+    return _widen(total, 2)
+
+def _atanh_series(z, W):
+    # atanh(z) for |z| <= 1/2
+    assert 2 * _magnitude(z) <= 1 << W
+    z2    = _sqr(z, W)
+    power = z
+    total = z
+    k     = 0
+    while _magnitude(power) > 1:
+        k     += 1
+        power  = _mul(power, z2, W)
+        total  = _add(total, _div_int(power, 2 * k + 1))
+    return _widen(total, 2)
+
+##############################################################################
+# Enclosures
+##############################################################################
+
+def _greater_than_one(m, e):
+    # Test if m * 2^e > 1, where 2^(n - 1) <= m * 2^e < 2^n
+    n = m.bit_length() + e
+    return n > 1 or (n == 1 and m & (m - 1) != 0)
+
+def _exp_interval(x, W):
+    # Returns (a, k) such that exp(x) is in a * 2^(k - W)
+    ln2 = _constant("ln2", W)
+    mid = (x[0] + x[1]) // 2
+    k   = (2 * mid + ln2[0]) // (2 * ln2[0])
+
+    # r = x - k * ln(2), with ln(2) precise enough for |k|
+    extra = abs(k).bit_length() + 2
+    r = _sub(x, _shift(_scale(_constant("ln2", W + extra), k), extra))
+    return _exp_series(r, W), k
+
+def _log_interval(m, e, W):
+    # ln(m * 2^e) for m > 0. We write the number as y * 2^E with
+    # 3/4 <= y < 3/2, and compute ln(y) = 2 * atanh((y - 1) / (y +
+    # 1)).
+    n = m.bit_length()
+    if 4 * m >= 3 << n:
+        d = 1 << n
+        E = e + n
+    else:
+        d = 1 << (n - 1)
+        E = e + n - 1
+    z = _div(((m - d) << W, (m - d) << W), ((m + d) << W, (m + d) << W), W)
+    log_y = _scale(_atanh_series(z, W), 2)
+
+    extra = abs(E).bit_length() + 2
+    return _add(log_y,
+                _shift(_scale(_constant("ln2", W + extra), E), extra))
+
+def _log2_interval(m, e, W):
+    # log2(m * 2^e) for m > 0, as _log_interval
+    n = m.bit_length()
+    if 4 * m >= 3 << n:
+        d = 1 << n
+        E = e + n
+    else:
+        d = 1 << (n - 1)
+        E = e + n - 1
+    z = _div(((m - d) << W, (m - d) << W), ((m + d) << W, (m + d) << W), W)
+    log_y = _scale(_atanh_series(z, W), 2)
+    return _add(_div(log_y, _constant("ln2", W), W), (E << W, E << W))
+
+def _sin_cos_interval(x, W, cosine):
+    # sin(x) or cos(x). We reduce x to r = x - k * pi/2 with |r| <=
+    # pi/4 (roughly) and then use the series for sin(r) or cos(r).
+    mid   = (x[0] + x[1]) // 2
+    extra = max(0, abs(mid).bit_length() - W) + 4
+    pi    = _constant("pi", W + extra)
+    k     = ((4 * mid << extra) + pi[0]) // (2 * pi[0])
+    r     = _sub(x, _shift(_scale(pi, k), extra + 1))
+
+    quadrant = (k + 1 if cosine else k) % 4
+    if quadrant == 0:
+        return _sin_series(r, W)
+    elif quadrant == 1:
+        return _cos_series(r, W)
+    elif quadrant == 2:
+        return _neg(_sin_series(r, W))
+    else:
+        return _neg(_cos_series(r, W))
+
+def _atan_interval(sign, m, e, W):
+    # atan((-1)^sign * m * 2^e) for m > 0
+    one = (1 << W, 1 << W)
+    big = _greater_than_one(m, e)
+    if big:
+        # atan(x) = pi/2 - atan(1/x), where 1/x = 2^-e / m
+        if W - e >= 0:
+            x = (1 << (W - e)) // m
+            x = (x, x + 1)
+        else:
+            x = (0, 1)
+    else:
+        x = _fixed(0, m, e, W)
+
+    # atan(x) = 2 * atan(x / (1 + sqrt(1 + x^2))), three times gives
+    # |x| <= tan(pi/32) < 0.1
+    for _ in range(3):
+        x = _div(x, _add(one, _sqrt(_add(one, _sqr(x, W)), W)), W)
+    rv = _scale(_atan_series(x, W), 8)
+
+    if big:
+        rv = _sub(_shift(_constant("pi", W), 1), rv)
+    if sign:
+        rv = _neg(rv)
+    return rv
+
+##############################################################################
+# Rounding
+##############################################################################
+
+# Initial working precision
+def _initial_precision(sb):
+    return 2 * sb + 24
+
+def _round_interval(rm, eb, sb, a, e):
+    # Round both ends of a * 2^e, returns the result if they agree
+    # and None otherwise.
+    lo = MPF(eb, sb)
+    lo.from_dyadic(rm, int(a[0] < 0), abs(a[0]), e)
+    hi = MPF(eb, sb)
+    hi.from_dyadic(rm, int(a[1] < 0), abs(a[1]), e)
+    if lo.bv == hi.bv:
+        return lo
+    return None
+
+def _ziv(rm, eb, sb, enclosure):
+    # enclosure(W) returns (a, e) such that the result is in a *
+    # 2^e, with a precision of roughly W bits.
+    W = _initial_precision(sb)
+    while True:
+        a, e = enclosure(W)
+        rv = _round_interval(rm, eb, sb, a, e)
+        if rv is not None:
+            return rv
+        if instrumentation.ENABLED:
+            instrumentation.count("elementary.retries")
+        W *= 2
+
+def _nearly(rm, op, sign, m, e):
+    # The result is strictly between (m - 1) * 2^e and m * 2^e,
+    # i.e. just below m * 2^e in magnitude.
+    rv = op.new_mpf()
+    rv.from_dyadic(rm, sign, (m << (op.p + 3)) - 1, e - (op.p + 3), True)
+    return rv
+
+def _barely(rm, op, sign, m, e):
+    # The result is strictly between m * 2^e and (m + 1) * 2^e, i.e.
+    # just above m * 2^e in magnitude.
+    rv = op.new_mpf()
+    rv.from_dyadic(rm, sign, m << (op.p + 3), e - (op.p + 3), True)
+    return rv
+
+def _tiny(op, m, e):
+    # Test if 0 < |x| < 2^-(p + 2) for x = m * 2^e
+    return m.bit_length() + e <= -(op.p + 2)
+
+def _overflow(rm, op, sign):
+    rv = op.new_mpf()
+    rv.from_dyadic(rm, sign, 1, op.emax + 1)
+    return rv
+
+def _underflow(rm, op, sign):
+    # A non-zero result much smaller than the smallest subnormal
+    rv = op.new_mpf()
+    rv.from_dyadic(rm, sign, 1 << (op.p + 2), op.emin - 3 * op.p - 8, True)
+    return rv
+
+##############################################################################
+# Elementary functions
+##############################################################################
+
+def fp_exp(rm, op):
+    """Correctly rounded :math:`e^{op}`"""
+    if instrumentation.ACTIVE and instrumentation.outermost(fp_exp):
+        return instrumentation.timed_call(fp_exp, rm, op)
+    assert rm in MPF.ROUNDING_MODES
+    if op.isNaN():
+        return op.new_mpf()
+    elif op.isInfinite():
+        rv = op.new_mpf()
+        if op.isNegative():
+            rv.set_zero(0)
+        return rv
+    elif op.isZero():
+        rv = op.new_mpf()
+        rv.from_int(rm, 1)
+        return rv
+
+    S, m, e = op.to_dyadic()
+    if _tiny(op, m, e):
+        # 1 - |x| < exp(x) < 1 + 2|x|
+        if S:
+            return _nearly(rm, op, 0, 1, 0)
+        else:
+            return _barely(rm, op, 0, 1, 0)
+    elif m.bit_length() + e > (op.emax + op.p + 8).bit_length():
+        # |x| > emax + p + 8, so exp(x) > 2^(emax + 2) or exp(x) <
+        # 2^-(emax + p + 8)
+        if S:
+            return _underflow(rm, op, 0)
+        else:
+            return _overflow(rm, op, 0)
+
+    def enclosure(W):
+        a, k = _exp_interval(_fixed(S, m, e, W), W)
+        return a, k - W
+    return _ziv(rm, op.w, op.p, enclosure)
+
+def fp_log(rm, op):
+    """Correctly rounded natural logarithm"""
+    if instrumentation.ACTIVE and instrumentation.outermost(fp_log):
+        return instrumentation.timed_call(fp_log, rm, op)
+    assert rm in MPF.ROUNDING_MODES
+    rv = op.new_mpf()
+    if op.isNaN():
+        pass
+    elif op.isZero():
+        rv.set_infinite(1)
+    elif op.isNegative():
+        rv.set_nan()
+    elif op.isInfinite():
+        pass
+    else:
+        _, m, e = op.to_dyadic()
+        if m & (m - 1) == 0 and m.bit_length() + e == 1:
+            # log(1) = +0
+            rv.set_zero(0)
+        else:
+            rv = _ziv(rm, op.w, op.p,
+                      lambda W: (_log_interval(m, e, W), -W))
+    return rv
+
+def fp_log2(rm, op):
+    """Correctly rounded base 2 logarithm"""
+    if instrumentation.ACTIVE and instrumentation.outermost(fp_log2):
+        return instrumentation.timed_call(fp_log2, rm, op)
+    assert rm in MPF.ROUNDING_MODES
+    rv = op.new_mpf()
+    if op.isNaN():
+        pass
+    elif op.isZero():
+        rv.set_infinite(1)
+    elif op.isNegative():
+        rv.set_nan()
+    elif op.isInfinite():
+        pass
+    else:
+        _, m, e = op.to_dyadic()
+        if m & (m - 1) == 0:
+            # Powers of two are exact
+            rv.from_int(rm, e + m.bit_length() - 1)
+        else:
+            rv = _ziv(rm, op.w, op.p,
+                      lambda W: (_log2_interval(m, e, W), -W))
+    return rv
+
+def fp_sin(rm, op):
+    """Correctly rounded sine"""
+    if instrumentation.ACTIVE and instrumentation.outermost(fp_sin):
+        return instrumentation.timed_call(fp_sin, rm, op)
+    assert rm in MPF.ROUNDING_MODES
+    if op.isNaN() or op.isInfinite():
+        rv = op.new_mpf()
+        rv.set_nan()
+        return rv
+    elif op.isZero():
+        return op.new_mpf()
+
+    S, m, e = op.to_dyadic()
+    if _tiny(op, m, e):
+        # |x| - |x|^3 / 6 < |sin(x)| < |x|
+        return _nearly(rm, op, S, m, e)
+    return _ziv(rm, op.w, op.p,
+                lambda W: (_sin_cos_interval(_fixed(S, m, e, W), W, False),
+                           -W))
+
+def fp_cos(rm, op):
+    """Correctly rounded cosine"""
+    if instrumentation.ACTIVE and instrumentation.outermost(fp_cos):
+        return instrumentation.timed_call(fp_cos, rm, op)
+    assert rm in MPF.ROUNDING_MODES
+    if op.isNaN() or op.isInfinite():
+        rv = op.new_mpf()
+        rv.set_nan()
+        return rv
+    elif op.isZero():
+        rv = op.new_mpf()
+        rv.from_int(rm, 1)
+        return rv
+
+    S, m, e = op.to_dyadic()
+    if _tiny(op, m, e):
+        # 1 - x^2 / 2 < cos(x) < 1
+        return _nearly(rm, op, 0, 1, 0)
+    return _ziv(rm, op.w, op.p,
+                lambda W: (_sin_cos_interval(_fixed(S, m, e, W), W, True),
+                           -W))
+
+def fp_atan(rm, op):
+    """Correctly rounded arc tangent"""
+    if instrumentation.ACTIVE and instrumentation.outermost(fp_atan):
+        return instrumentation.timed_call(fp_atan, rm, op)
+    assert rm in MPF.ROUNDING_MODES
+    if op.isNaN() or op.isZero():
+        return op.new_mpf()
+    elif op.isInfinite():
+        # +-pi/2
+        S = int(op.isNegative())
+        return _ziv(rm, op.w, op.p,
+                    lambda W: (_scale(_constant("pi", W), 1 - 2 * S),
+                               -W - 1))
+
+    S, m, e = op.to_dyadic()
+    if _tiny(op, m, e):
+        # |x| - |x|^3 / 3 < |atan(x)| < |x|
+        return _nearly(rm, op, S, m, e)
+    return _ziv(rm, op.w, op.p,
+                lambda W: (_atan_interval(S, m, e, W), -W))
+
+def _odd_part(m, e):
+    # Returns (m', e') with m' odd and m' * 2^e' = m * 2^e
+    tz = (m & -m).bit_length() - 1
+    return m >> tz, e + tz
+
+def _pow_exact(x, y):
+    # Returns (sign, m, e) if x^y is exactly a float or the midpoint
+    # of two floats, and None if it is certainly not. Both x and y
+    # are finite and non-zero, and x is not negative unless y is an
+    # integer.
+    Sx, mx, ex = x.to_dyadic()
+    Sy, my, ey = y.to_dyadic()
+    mx, ex = _odd_part(mx, ex)
+    my, ey = _odd_part(my, ey)
+
+    if ey < 0:
+        # y = my / 2^k, so we need x to be a perfect 2^k-th power. If
+        # x is not an integer power of two this needs x >= 3^(2^k).
+        k = -ey
+        if mx > 1 and (k > mx.bit_length() or 1 << k > mx.bit_length()):
+            return None
+        elif mx == 1 and k > ex.bit_length():
+            return None
+        for _ in range(k):
+            root = _isqrt(mx)
+            if root * root != mx or ex % 2:
+                return None
+            mx  = root
+            ex //= 2
+        n = my
+    else:
+        n = my << ey
+
+    sign = Sx & n
+    if mx == 1:
+        return (sign, 1, ex * n * (-1 if Sy else 1))
+    elif Sy:
+        # 1 / mx^n is not a dyadic rational
+        return None
+    elif n > x.p + 1:
+        # mx^n is odd and has more than p + 1 bits
+        return None
+    else:
+        return (sign, mx ** n, ex * n)
+
+def fp_pow(rm, x, y):
+    """Correctly rounded :math:`x^y` (pow from IEEE-754 9.2)"""
+    if instrumentation.ACTIVE and instrumentation.outermost(fp_pow):
+        return instrumentation.timed_call(fp_pow, rm, x, y)
+    assert rm in MPF.ROUNDING_MODES
+    assert x.compatible(y)
+    rv = x.new_mpf()
+
+    one = x.new_mpf()
+    one.from_int(rm, 1)
+    if y.isZero() or smtlib_eq(x, one):
+        return one
+    elif x.isNaN() or y.isNaN():
+        rv.set_nan()
+        return rv
+
+    y_integral = y.isIntegral()
+    if y_integral and y.isFinite():
+        _, my, ey = y.to_dyadic()
+        y_odd = ey <= 0 and (my >> -ey) & 1 == 1
+    else:
+        y_odd = False
+
+    if y.isInfinite():
+        magnitude = abs(x)
+        if smtlib_eq(magnitude, one):
+            # pow(-1, +-oo) = 1
+            return one
+        elif (magnitude < one) == y.isPositive():
+            rv.set_zero(0)
+        else:
+            rv.set_infinite(0)
+    elif x.isZero() or x.isInfinite():
+        # The sign is kept for odd integers
+        sign = int(x.isNegative() and y_odd)
+        if x.isZero() == y.isPositive():
+            rv.set_zero(sign)
+        else:
+            rv.set_infinite(sign)
+    elif x.isNegative() and not y_integral:
+        rv.set_nan()
+    elif smtlib_eq(abs(x), one):
+        # pow(-1, y) for integral y
+        if y_odd:
+            rv = -one
+        else:
+            rv = one
+    else:
+        rv = _pow_finite(rm, x, y, y_odd)
+    return rv
+
+def _pow_finite(rm, x, y, y_odd):
+    _, mx, ex = x.to_dyadic()
+    Sy, my, ey = y.to_dyadic()
+    sign = int(x.isNegative() and y_odd)
+
+    # |log|x|| >= 2^-(p + 1), so if |y| is large enough then |y *
+    # log|x|| > emax + p + 8, and the result certainly overflows or
+    # underflows. (Such y are even integers.)
+    if my.bit_length() + ey > x.p + 1 + (x.emax + x.p + 8).bit_length():
+        if _greater_than_one(mx, ex) == (Sy == 0):
+            return _overflow(rm, x, sign)
+        else:
+            return _underflow(rm, x, sign)
+
+    exact = _pow_exact(x, y)
+    if exact is not None:
+        rv = x.new_mpf()
+        rv.from_dyadic(rm, *exact)
+        return rv
+
+    def enclosure(W):
+        # y * log|x| with an error of roughly 2^-W
+        extra = max(0, my.bit_length() + ey) + 2
+        t = _shift(_scale(_log_interval(mx, ex, W + extra),
+                          -my if Sy else my),
+                   extra - ey)
+        if t[0] >= (x.emax + 2) << W:
+            # Overflow, see fp_exp
+            a, e = (1, 1), x.emax + 2
+        elif t[1] <= -((x.emax + x.p + 8) << W):
+            # Underflow, any value this small rounds the same way
+            a, e = (1, 1), x.emin - 3 * x.p - 8
+        else:
+            a, k = _exp_interval(t, W)
+            e = k - W
+        if sign:
+            a = _neg(a)
+        return a, e
+    return _ziv(rm, x.w, x.p, enclosure)
+
+# The functions in this module by name, see :data:`mpf.floats.FP_OPS`
+ELEMENTARY_OPS = {
+    "fp.exp"  : Floating_Point_Operation("fp.exp", 1, evaluator=fp_exp),
+    "fp.log"  : Floating_Point_Operation("fp.log", 1, evaluator=fp_log),
+    "fp.log2" : Floating_Point_Operation("fp.log2", 1, evaluator=fp_log2),
+    "fp.pow"  : Floating_Point_Operation("fp.pow", 2, evaluator=fp_pow),
+    "fp.sin"  : Floating_Point_Operation("fp.sin", 1, evaluator=fp_sin),
+    "fp.cos"  : Floating_Point_Operation("fp.cos", 1, evaluator=fp_cos),
+    "fp.atan" : Floating_Point_Operation("fp.atan", 1, evaluator=fp_atan),
+}
@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                                PYMPF                                     ##
+##                                                                          ##
+##              Copyright (C) 2020,      Florian Schanda                    ##
+##                                                                          ##
+##  This file is part of PyMPF.                                             ##
+##                                                                          ##
+##  PyMPF is free software: you can redistribute it and/or modify           ##
+##  it under the terms of the GNU General Public License as published by    ##
+##  the Free Software Foundation, either version 3 of the License, or       ##
+##  (at your option) any later version.                                     ##
+##                                                                          ##
+##  PyMPF is distributed in the hope that it will be useful,                ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with PyMPF. If not, see <http://www.gnu.org/licenses/>.           ##
+##                                                                          ##
+##############################################################################
+
+
+"""
+This module exhaustively evaluates operations on small formats, i.e.
+for every operand (or every pair or triple of operands) and every
+rounding mode.
+
+The cases of an operation are numbered with the rounding mode as the
+most significant digit followed by the bit patterns of the operands,
+so that a range of case numbers is walked by stepping the last
+operand through consecutive bit patterns. This space is split into a
+fixed number of shards, and each shard is a contiguous range of
+cases. The shards of a run depend only on the operation, format and
+number of shards, so they can be spread over processes or machines.
+
+Each shard periodically writes a checkpoint (a small JSON file) so
+that a killed run can be restarted and continues where it stopped:
+
+>>> summary = run_shard(Shard("fp.add", 5, 11, shard=3, shards=64),
+...                     directory="checkpoints",
+...                     check="native")
+
+Results are folded into a digest that does not depend on the number
+of shards, so two runs (e.g. before and after a change) can be
+compared. Cases for which the optional check fails are written to a
+JSON lines file next to the checkpoint.
+
+It can also be run from the command line:
+
+    $ python3 -m mpf.exhaustive --eb 5 --sb 11 --ops fp.add \\
+          --shards 64 --processes 8 --directory checkpoints
+
+which prints a JSON summary for each operation.
+"""
+
+import os
+import sys
+import json
+import time
+import struct
+import hashlib
+import argparse
+import multiprocessing
+
+from .floats import *
+from . import differential
+
+# Cases are processed (and folded into the digest) in blocks of this
+# many cases. Blocks are aligned to multiples of BLOCK in the whole
+# case space, and shard boundaries are always on a block boundary.
+BLOCK = 4096
+
+# Formats up to this width create one MPF per bit pattern up front,
+# instead of one per case.
+CACHE_BITS = 16
+
+# Seconds between checkpoints
+CHECKPOINT_INTERVAL = 60
+
+def supported_operations():
+    """Operations that can be enumerated
+
+    These are the operations that only take floats of one format
+    (and possibly a rounding mode).
+    """
+    return sorted(op_name
+                  for op_name, op in FP_OPS.items()
+                  if op.args_type == TYP_FLOAT and
+                  not op.precision_arg and
+                  op.result_type != TYP_BV)
+
+def _encode_result(result):
+    if isinstance(result, MPF):
+        return "%x" % result.bv
+    elif isinstance(result, bool):
+        return "true" if result else "false"
+    elif result is None:
+        return "unspecified"
+    else:
+        return str(result)
+
+##############################################################################
+# Checks
+##############################################################################
+
+def check_native(op_name, cases):
+    """Compare against the native implementation
+
+    Only checks binary16, binary32 and binary64 under RNE (see
+    :mod:`mpf.differential`); all other cases pass. All cases are
+    evaluated natively in one batch.
+    """
+    if not cases:
+        return []
+    args = cases[0][1]
+    fmt  = None
+    for name, info in differential.NATIVE_FORMATS.items():
+        if info[:2] == (args[0].w, args[0].p):
+            fmt = name
+    if fmt is None or op_name not in differential.supported_operations(fmt):
+        return [True] * len(cases)
+
+    checked  = [i for i, (rm, _, result) in enumerate(cases)
+                if rm in (None, RM_RNE) and result is not None]
+    if not checked:
+        return [True] * len(cases)
+    operands = [tuple(arg.bv for arg in cases[i][1]) for i in checked]
+    pympf    = [cases[i][2].bv if isinstance(cases[i][2], MPF)
+                else bool(cases[i][2])
+                for i in checked]
+    native   = differential.evaluate_native(op_name, fmt, operands)
+
+    # The operands of the cases checked are all different, as they
+    # have the same rounding mode
+    wrong = set(disagreement.operands
+                for disagreement in differential.compare_batch(
+                    op_name, fmt, operands, native, pympf))
+    rv = [True] * len(cases)
+    for i, bits in zip(checked, operands):
+        if bits in wrong:
+            rv[i] = False
+    return rv
+
+# Checks by name, so that they can be given to other processes. A
+# check is called with the operation name and a list of cases (rounding
+# mode, arguments and result, which is None if unspecified), and
+# returns a list with True for each case whose result is acceptable.
+CHECKS = {
+    "none"   : None,
+    "native" : check_native,
+}
+
+##############################################################################
+# Shards
+##############################################################################
+
+class Shard:
+    """Shard *shard* (of *shards*) of the cases of an operation
+
+    The operation *op_name* is evaluated on floats with *eb* and
+    *sb* bits, and under all rounding modes in *rms* (by default all
+    of them; ignored for operations without a rounding mode).
+    """
+    def __init__(self, op_name, eb, sb, shard=0, shards=1, rms=None):
+        assert op_name in supported_operations()
+        assert 0 <= shard < shards
+        self.op_name = op_name
+        self.op      = FP_OPS[op_name]
+        self.eb      = eb
+        self.sb      = sb
+        self.k       = eb + sb
+        self.shard   = shard
+        self.shards  = shards
+
+        if not self.op.rm_arg:
+            self.rms = (None,)
+        elif rms is None:
+            self.rms = MPF.ROUNDING_MODES
+        else:
+            assert all(rm in MPF.ROUNDING_MODES for rm in rms)
+            self.rms = tuple(rms)
+
+        self.radix = 2 ** self.k
+        self.total = len(self.rms) * self.radix ** self.op.arity
+
+        blocks  = (self.total + BLOCK - 1) // BLOCK
+        self.lo = min(self.total, blocks * shard // shards * BLOCK)
+        self.hi = min(self.total, blocks * (shard + 1) // shards * BLOCK)
+
+    def __str__(self):
+        return "%s-%u-%u-%uof%u" % (self.op_name,
+                                     self.eb,
+                                     self.sb,
+                                     self.shard,
+                                     self.shards)
+
+    def decode(self, index):
+        """Return the rounding mode and operand bit patterns of a case"""
+        assert 0 <= index < self.total
+        operands = []
+        for _ in range(self.op.arity):
+            index, bits = divmod(index, self.radix)
+            operands.append(bits)
+        return self.rms[index], tuple(reversed(operands))
+
+    def walk(self, start, stop, values=None):
+        """Yield (rm, args) for the cases from *start* to *stop*
+
+        The last argument steps through consecutive bit patterns,
+        and only when it wraps around are the other arguments
+        decoded again. *values* can be a list of MPFs, one for each
+        bit pattern, to avoid creating new MPFs.
+        """
+        assert self.lo <= start <= stop <= self.hi
+        index = start
+        while index < stop:
+            rm, operands = self.decode(index)
+            if values is None:
+                head = [MPF(self.eb, self.sb, bits)
+                        for bits in operands[:-1]]
+            else:
+                head = [values[bits] for bits in operands[:-1]]
+
+            first = operands[-1]
+            last  = min(self.radix, first + stop - index)
+            if values is None:
+                tail = (MPF(self.eb, self.sb, bits)
+                        for bits in range(first, last))
+            else:
+                tail = values[first:last]
+            for arg in tail:
+                yield rm, head + [arg]
+            index += last - first
+
+    def checkpoint_name(self, directory):
+        return os.path.join(directory, str(self) + ".json")
+
+    def failures_name(self, directory):
+        return os.path.join(directory, str(self) + ".failures.jsonl")
+
+    def initial_state(self):
+        return {"op"       : self.op_name,
+                "eb"       : self.eb,
+                "sb"       : self.sb,
+                "rms"      : list(self.rms),
+                "shard"    : self.shard,
+                "shards"   : self.shards,
+                "lo"       : self.lo,
+                "hi"       : self.hi,
+                "next"     : self.lo,
+                "failures" : 0,
+                "offset"   : 0,
+                "digest"   : "0" * 64,
+                "time"     : 0.0}
+
+##############################################################################
+# Running
+##############################################################################
+
+def _write_checkpoint(filename, state):
+    # Write to a temporary file and rename, so that a checkpoint is
+    # never partially written.
+    tmp = filename + ".tmp"
+    with open(tmp, "w") as fd:
+        json.dump(state, fd, indent=2, sort_keys=True)
+        fd.write("\n")
+        fd.flush()
+        os.fsync(fd.fileno())
+    os.replace(tmp, filename)
+
+def _load_checkpoint(shard, directory):
+    state = shard.initial_state()
+    if directory is None:
+        return state
+
+    filename = shard.checkpoint_name(directory)
+    if os.path.exists(filename):
+        with open(filename, "r") as fd:
+            saved = json.load(fd)
+        for key in ("op", "eb", "sb", "rms", "shard", "shards", "lo", "hi"):
+            if saved[key] != state[key]:
+                raise ValueError("checkpoint %s is for a different run" %
+                                 filename)
+        state = saved
+
+    # Failures written after the last checkpoint will be found again
+    failures = shard.failures_name(directory)
+    if os.path.exists(failures):
+        with open(failures, "r+b") as fd:
+            fd.truncate(state["offset"])
+    return state
+
+def _values(eb, sb):
+    if eb + sb > CACHE_BITS:
+        return None
+    return [MPF(eb, sb, bits) for bits in range(2 ** (eb + sb))]
+
+def run_shard(shard, directory=None, check="none",
+              interval=CHECKPOINT_INTERVAL):
+    """Evaluate all cases of a :class:`Shard`
+
+    If *directory* is given, checkpoints are written there every
+    *interval* seconds and when done, and an existing checkpoint is
+    resumed. Cases where the *check* (a key of :data:`CHECKS`) fails
+    are written to a JSON lines file in *directory*.
+
+    Returns the final state (as in the checkpoint), which includes
+    the number of failures and the digest of all results.
+    """
+    check_fn = CHECKS[check]
+    state    = _load_checkpoint(shard, directory)
+    if state["next"] >= shard.hi:
+        return state
+
+    if directory is None:
+        failures = None
+    else:
+        failures = open(shard.failures_name(directory), "a")
+
+    op        = shard.op
+    op_name   = shard.op_name
+    values    = _values(shard.eb, shard.sb)
+    digest    = int(state["digest"], 16)
+    last_save = time.time()
+    elapsed   = state["time"]
+
+    try:
+        index = state["next"]
+        while index < shard.hi:
+            stop    = min(shard.hi, index + BLOCK)
+            results = [struct.pack("<Q", index)]
+            cases   = []
+            for rm, args in shard.walk(index, stop, values):
+                try:
+                    result = op.evaluate(rm, *args)
+                except Unspecified:
+                    result = None
+                results.append(_encode_result(result).encode())
+                if check_fn is not None:
+                    cases.append((rm, args, result))
+
+            # Cases are checked a block at a time
+            if check_fn is not None:
+                for (rm, args, result), ok in zip(cases,
+                                                  check_fn(op_name, cases)):
+                    if ok:
+                        continue
+                    state["failures"] += 1
+                    if failures is not None:
+                        failures.write(json.dumps({
+                            "op"       : op_name,
+                            "rm"       : rm,
+                            "operands" : ["0x%x" % arg.bv for arg in args],
+                            "result"   : _encode_result(result)}) + "\n")
+
+            # The digest is the xor of the hashes of all blocks, so
+            # it does not depend on the order of blocks (or shards).
+            block = hashlib.sha256(b"\n".join(results)).hexdigest()
+            digest ^= int(block, 16)
+            index = stop
+
+            now = time.time()
+            if directory is not None and \
+               (now - last_save >= interval or index >= shard.hi):
+                failures.flush()
+                os.fsync(failures.fileno())
+                state["next"]   = index
+                state["offset"] = failures.tell()
+                state["digest"] = "%064x" % digest
+                state["time"]   = elapsed + now - last_save
+                elapsed         = state["time"]
+                last_save       = now
+                _write_checkpoint(shard.checkpoint_name(directory), state)
+    finally:
+        if failures is not None:
+            failures.close()
+
+    state["next"]   = index
+    state["digest"] = "%064x" % digest
+    return state
+
+def _run_shard_job(job):
+    op_name, eb, sb, rms, shard, shards, directory, check, interval = job
+    return run_shard(Shard(op_name, eb, sb, shard, shards, rms),
+                     directory,
+                     check,
+                     interval)
+
+def exhaustive(op_name, eb, sb, rms=None, shards=1, only=None,
+               processes=1, directory=None, check="none",
+               interval=CHECKPOINT_INTERVAL):
+    """Run (or resume) all shards of an operation
+
+    Runs the shards in *only* (by default all *shards*), using
+    *processes* processes. See :func:`run_shard` for the other
+    parameters. Returns a summary dict with the number of cases,
+    failures and the combined digest of the shards that were run.
+    """
+    if only is None:
+        only = range(shards)
+    jobs = [(op_name, eb, sb, rms, shard, shards, directory, check,
+             interval)
+            for shard in only]
+
+    if processes > 1:
+        pool    = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(_run_shard_job, jobs)
+    else:
+        pool    = None
+        results = map(_run_shard_job, jobs)
+
+    summary = {"op"       : op_name,
+               "eb"       : eb,
+               "sb"       : sb,
+               "shards"   : shards,
+               "run"      : len(jobs),
+               "cases"    : 0,
+               "failures" : 0,
+               "digest"   : 0}
+    try:
+        for state in results:
+            summary["cases"]    += state["next"] - state["lo"]
+            summary["failures"] += state["failures"]
+            summary["digest"]   ^= int(state["digest"], 16)
+            summary["rms"]       = state["rms"]
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    summary["digest"] = "%064x" % summary["digest"]
+    return summary
+
+def main():
+    ap = argparse.ArgumentParser(
+        description="Exhaustive evaluation of operations on small formats")
+    ap.add_argument("--eb",
+                    type=int,
+                    default=5)
+    ap.add_argument("--sb",
+                    type=int,
+                    default=11)
+    ap.add_argument("--ops",
+                    nargs="+",
+                    default=None,
+                    help="Operations (default all supported)")
+    ap.add_argument("--rms",
+                    nargs="+",
+                    choices=MPF.ROUNDING_MODES,
+                    default=None,
+                    help="Rounding modes (default all)")
+    ap.add_argument("--shards",
+                    type=int,
+                    default=1)
+    ap.add_argument("--only",
+                    type=int,
+                    nargs="+",
+                    default=None,
+                    help="Run only these shards (default all)")
+    ap.add_argument("--processes",
+                    type=int,
+                    default=1)
+    ap.add_argument("--directory",
+                    default=None,
+                    help="Directory for checkpoints and failures")
+    ap.add_argument("--check",
+                    choices=sorted(CHECKS),
+                    default="none")
+    ap.add_argument("--interval",
+                    type=float,
+                    default=CHECKPOINT_INTERVAL,
+                    help="Seconds between checkpoints")
+    options = ap.parse_args()
+
+    op_names = options.ops or supported_operations()
+    for op_name in op_names:
+        if op_name not in supported_operations():
+            ap.error("%s is not supported" % op_name)
+    for shard in options.only or []:
+        if not 0 <= shard < options.shards:
+            ap.error("shard %u does not exist" % shard)
+    if options.directory is not None:
+        os.makedirs(options.directory, exist_ok=True)
+
+    failures = 0
+    for op_name in op_names:
+        summary = exhaustive(op_name,
+                             options.eb,
+                             options.sb,
+                             options.rms,
+                             options.shards,
+                             options.only,
+                             options.processes,
+                             options.directory,
+                             options.check,
+                             options.interval)
+        failures += summary["failures"]
+        sys.stdout.write(json.dumps(summary, sort_keys=True) + "\n")
+        sys.stdout.flush()
+
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -26,10 +26,11 @@
 
 """
 This module implements IEEE floats using bitvectors as the in-memory
-format, but rationals (plus rounding and special case handling) for
-calculation. This allows us to directly implement the semantics
-described in IEEE-754 (2008) without having to consider any of the
-difficult normalisation problems.
+format. Arithmetic is performed on the precise value, as an integer
+significand and an exponent (i.e. m * 2^e), which is then rounded
+(see :func:`MPF.from_dyadic`). This allows us to directly implement
+the semantics described in IEEE-754 (2008), and the cost of each
+operation depends on the precision, not the size of the exponent.
 
 The main objective is that the implementation should be simple and
 simple to understand and as close to IEEE-754 and SMTLIB as possible
@@ -38,16 +39,42 @@ IEEE float implementations in SMT solvers (which have to be
 fast). It is also not a replacement for libraries such as MPFR
 (which is fast, but complicated and does not totally map onto IEEE
 floats).
+
+The fp_* functions (and :func:`evaluate`) never modify their
+arguments and always return a new MPF, and all intermediate state is
+local. It is therefore safe to call them from several threads at
+once, also with shared arguments and on free-threaded builds of
+Python. The only methods that modify an MPF are the setters
+(from_rational, from_dyadic, pack, set_zero, etc.), so an MPF
+shared between threads must not be set while in use. Each update of
+the bit pattern is a single assignment, so there is never a partly
+updated value.
 """
 
 # TODO: Implement RNA in intervals
 
+import re
 import random
+import operator
+try:
+    from math import isqrt as _isqrt
+except ImportError:
+    def _isqrt(n):
+        """Integer square root (for python < 3.8)"""
+        if n == 0:
+            return 0
+        x = 1 << ((n.bit_length() + 1) // 2)
+        while True:
+            y = (x + n // x) // 2
+            if y >= x:
+                return x
+            x = y
 
 from .rationals import *
 from .interval_q import Interval
 from .bitvector import BitVector
-from .bisect import Bisect
+from . import instrumentation
+from . import trace
 
 ##############################################################################
 # IEEE Floats
@@ -65,6 +92,60 @@ RM_RTP = "RTP"
 RM_RTN = "RTN"
 RM_RTZ = "RTZ"
 
+# C99 hexadecimal floating-point constants (as accepted by strtod and
+# printed by %a), e.g. -0x1.8p-3. The exponent is optional.
+HEX_FLOAT = re.compile(r"([+-]?)0[xX]"
+                       r"(?=\.?[0-9a-fA-F])([0-9a-fA-F]*)"
+                       r"(?:\.([0-9a-fA-F]*))?"
+                       r"(?:[pP]([+-]?[0-9]+))?")
+
+def int_round_shift(rm, sign, m, shift, sticky=False):
+    """Round m / 2^shift to an integer
+
+    *m* and *shift* are non-negative integers, and *sign* is the sign
+    of the number (i.e. m / 2^shift is its magnitude) which matters
+    for the directed rounding modes. If *sticky* is set the precise
+    value is a bit larger than m (but less than m + 1).
+
+    Returns the rounded magnitude.
+    """
+    if shift == 0:
+        assert not sticky
+        return m
+    elif shift > m.bit_length() + 1:
+        # Everything is below the rounding bit
+        kept      = 0
+        round_bit = 0
+        sticky    = sticky or m != 0
+    else:
+        kept      = m >> shift
+        round_bit = (m >> (shift - 1)) & 1
+        sticky    = sticky or m & ((1 << (shift - 1)) - 1) != 0
+
+    if rm == RM_RNE:
+        round_up = round_bit and (sticky or kept & 1)
+    elif rm == RM_RNA:
+        round_up = round_bit
+    elif rm == RM_RTP:
+        round_up = not sign and (round_bit or sticky)
+    elif rm == RM_RTN:
+        round_up = sign and (round_bit or sticky)
+    else:
+        assert rm == RM_RTZ
+        round_up = False
+
+    if trace.ENABLED:
+        trace.emit("round",
+                   rm=rm, sign=sign, m=m, shift=shift, kept=kept,
+                   round_bit=round_bit, sticky=sticky,
+                   tie=bool(round_bit and not sticky),
+                   round_up=bool(round_up))
+
+    if round_up:
+        return kept + 1
+    else:
+        return kept
+
 class MPF:
     r"""Arbitrary precision IEEE-754 floating point number
 
@@ -88,13 +169,15 @@ class MPF:
     '1.0'
 
     The lowest precision that is supported is MPF(2, 2). The largest
-    *eb* supported is 18 (a practical limitation given we need to
-    compute 2 ** (2 ** eb)) which can get pretty large pretty quickly.
+    *eb* supported is 64. Note that while arithmetic is fine with
+    large exponents, converting extreme values to :class:`.Rational`
+    (e.g. with :func:`to_rational` or :func:`inf_boundary`) needs
+    2 ** (eb - 1) bits.
 
     """
 
     MIN_EB = 2
-    MAX_EB = 18
+    MAX_EB = 64
     MIN_SB = 2
 
     ROUNDING_MODES          = (RM_RNE, RM_RNA, RM_RTP, RM_RTN, RM_RTZ)
@@ -120,6 +203,11 @@ class MPF:
 
         self.bv   = bitvec
 
+        # The value of to_rational, as a tuple (bv, rational). Since
+        # the bit pattern is part of the cache it is never stale, no
+        # matter how bv is changed.
+        self.rational_cache = None
+
     def __repr__(self):
         return "MPF(%u, %u, 0x%x)" % (self.w, self.p, self.bv)
 
@@ -131,7 +219,9 @@ class MPF:
 
         Returns a new MPF with the same precision and value.
         """
-        return MPF(self.w, self.p, self.bv)
+        rv = MPF(self.w, self.p, self.bv)
+        rv.rational_cache = self.rational_cache
+        return rv
 
     ######################################################################
     # Internal utilities
@@ -151,15 +241,10 @@ class MPF:
 
         """
 
-        # TODO: remove ugly hack to convert via strings
-        bits = "{0:b}".format(self.bv)
-        assert len(bits) <= self.k
-        bits = "0" * (self.k - len(bits)) + bits
-        assert len(bits) == self.k
-
-        S = int(bits[0], 2)
-        E = int(bits[1:1 + self.w], 2)
-        T = int(bits[1 + self.w:], 2)
+        bv = self.bv
+        S = bv >> (self.k - 1)
+        E = (bv >> self.t) & ((1 << self.w) - 1)
+        T = bv & ((1 << self.t) - 1)
         return (S, E, T)
 
     def pack(self, S, E, T):
@@ -177,9 +262,7 @@ class MPF:
         assert 0 <= E <= 2 ** self.w - 1
         assert 0 <= T <= 2 ** self.t - 1
 
-        self.bv  = S << (self.w + self.t)
-        self.bv |= E << self.t
-        self.bv |= T
+        self.bv = (S << (self.w + self.t)) | (E << self.t) | T
 
     def partial_order(self):
         # orders all non-NaN floats, with -oo .. {-0, 0} .. +oo
@@ -187,15 +270,51 @@ class MPF:
         #      -oo evaluates to an integer less than any other,
         #      +oo evaluates to one greater than any other.
         assert not self.isNaN()
-        S, E, T = self.unpack()
-
-        rv  = E << self.t
-        rv |= T
-        if S:
+        rv = self.bv & ((1 << (self.k - 1)) - 1)
+        if self.bv >> (self.k - 1):
             return -rv
         else:
             return rv
 
+    ######################################################################
+    # Ordinals
+
+    def ordinal(self):
+        """Rank of the float among all floats of its precision
+
+        Returns a signed integer such that +0 and -0 are 0, the
+        smallest positive subnormal is 1, the largest negative
+        subnormal is -1, and so on up to +oo and down to -oo. The
+        difference of two ordinals is their distance in ulps.
+
+        Raises AssertionError for NaN. This is the inverse of
+        :func:`from_ordinal`.
+        """
+        return self.partial_order()
+
+    def from_ordinal(self, ordinal):
+        """Set value from its rank (see :func:`ordinal`)
+
+        An ordinal of 0 gives +0.
+        """
+        assert abs(ordinal) <= (2 ** self.w - 1) << self.t
+        if ordinal < 0:
+            self.bv = (1 << (self.k - 1)) | -ordinal
+        else:
+            self.bv = ordinal
+
+    def total_order_key(self):
+        """Key for IEEE-754 totalOrder (5.10)
+
+        Returns a non-negative integer that orders all floats
+        (including NaN) as -NaN < -oo < ... < -0 < +0 < ... < +oo <
+        +NaN. Different NaNs are ordered by their payload.
+        """
+        if self.bv >> (self.k - 1):
+            return self.bv ^ ((1 << self.k) - 1)
+        else:
+            return self.bv | (1 << (self.k - 1))
+
     def inf_boundary(self):
         """Compute the point after which we round to infinity
 
@@ -232,145 +351,200 @@ class MPF:
 
         """
         assert rm in MPF.ROUNDING_MODES
+        if instrumentation.ENABLED:
+            instrumentation.count("from_rational.calls")
+
+        if q.isZero():
+            # Converting 0 always gives +0
+            self.set_zero(0)
+            return
+
+        sign = int(q.isNegative())
+        a    = abs(q.a)
+        b    = q.b
+
+        if b & (b - 1) == 0:
+            # The denominator is a power of two, so q is precisely
+            # a * 2^(1 - bits(b))
+            if trace.ENABLED:
+                trace.emit("from_rational",
+                           rm=rm, q=q, sign=sign, m=a,
+                           e=1 - b.bit_length(), sticky=False)
+            self.from_dyadic(rm, sign, a, 1 - b.bit_length())
+        else:
+            # Otherwise we compute enough bits of a / b (at least p +
+            # 2) so that the remainder only matters as a sticky bit.
+            s = max(0, self.p + 3 - (a.bit_length() - b.bit_length()))
+            m, r = divmod(a << s, b)
+            if trace.ENABLED:
+                trace.emit("from_rational",
+                           rm=rm, q=q, sign=sign, m=m, e=-s,
+                           sticky=r != 0)
+            self.from_dyadic(rm, sign, m, -s, r != 0)
+
+    def from_int(self, rm, i):
+        """Convert from Python int to MPF
+
+        Sets the value to the nearest representable floating-point
+        value to the integer *i*, rounded according to *rm*. Zero
+        gives +0.
+
+        """
+        if i == 0:
+            self.set_zero(0)
+        else:
+            self.from_dyadic(rm, int(i < 0), abs(i), 0)
 
-        inf = self.inf_boundary()
+    def from_hex_string(self, rm, s):
+        """Convert from C99 hexadecimal float to MPF
 
-        target = abs(q)
-        sign   = q.isNegative()
+        Sets the value to the nearest representable floating-point
+        value to *s*, rounded according to *rm*. *s* is in the format
+        printed by :func:`to_hex_string` or C's %a (for example
+        '-0x1.8p-3'), with any number of digits. 'inf', 'infinity'
+        and 'nan' (with any case or sign) are also accepted.
+
+        Raises ValueError if *s* is not a hexadecimal float.
+
+        """
+        assert rm in MPF.ROUNDING_MODES
 
-        # TODO: is this >= or > ???
-        #
-        # This is an area in the standard that is not 100% clear to
-        # many people who have read this section. I chose to read it
-        # as >= and so did Martin.
-        if rm in MPF.ROUNDING_MODES_NEAREST and target >= inf:
-            # infinite result (4.3.1)
-            self.set_infinite(sign)
+        text = s.strip()
+        word = text.lstrip("+-").lower()
+        if word in ("inf", "infinity") and len(text) - len(word) <= 1:
+            self.set_infinite(int(text.startswith("-")))
+            return
+        elif word == "nan" and len(text) - len(word) <= 1:
+            self.set_nan()
             return
 
-        low  = 0
-        high = ((2 ** self.w - 2) << self.t) | (2 ** self.t - 1)
+        match = HEX_FLOAT.fullmatch(text)
+        if match is None:
+            raise ValueError("invalid hexadecimal float %r" % s)
+        sign, integer, fraction, exponent = match.groups()
+        fraction = fraction or ""
+
+        sign = int(sign == "-")
+        m    = int(integer + fraction or "0", 16)
+        e    = int(exponent or "0") - 4 * len(fraction)
+        if m == 0:
+            self.set_zero(sign)
+        else:
+            self.from_dyadic(rm, sign, m, e)
 
-        if target.isZero():
-            # Converting 0 always gives +0
-            self.set_zero(False)
+    def from_dyadic(self, rm, sign, m, e, sticky=False):
+        """Convert from significand and exponent to MPF
+
+        Sets the value to the nearest representable floating-point
+        value described by :math:`(-1)^{sign} * m * 2^e`, rounded
+        according to *rm*. *m* is a non-negative integer, and if it is
+        zero we get a zero with the given sign.
+
+        If *sticky* is set then the precise value is a bit larger (in
+        magnitude): it is strictly between :math:`m * 2^e` and
+        :math:`(m + 1) * 2^e`. In this case m must have at least p + 2
+        bits.
+
+        """
+        assert rm in MPF.ROUNDING_MODES
+        assert m >= 0
+        if instrumentation.ENABLED:
+            instrumentation.count("from_dyadic.calls")
+
+        if m == 0:
+            assert not sticky
+            self.set_zero(sign)
             return
 
-        # We need to check for infinity first
-        self.bv = high
-        if self.to_rational() < target:
-            if rm == RM_RTP and not sign:
-                # +oo
-                self.set_infinite(sign)
-            elif rm == RM_RTN and sign:
-                # -oo
+        # The exponent of the last bit we can keep (for subnormals
+        # this is fixed).
+        n   = m.bit_length()
+        lsb = max(e + n - 1, self.emin) - self.t
+
+        shift = lsb - e
+        if shift <= 0:
+            # Precise (we have fewer than p bits)
+            assert not sticky
+            kept = m << -shift
+        else:
+            kept = int_round_shift(rm, sign, m, shift, sticky)
+            if kept >> self.p:
+                # We have carried into a new bit
+                kept >>= 1
+                lsb   += 1
+
+        if trace.ENABLED:
+            trace.emit("bracket",
+                       format=(self.w, self.p), rm=rm, sign=sign, m=m,
+                       e=e, sticky=sticky, kept=kept, lsb=lsb)
+
+        if lsb + self.t > self.emax:
+            # Overflow (7.4): infinity, unless we round towards zero
+            # in which case we get the largest finite value
+            if rm in MPF.ROUNDING_MODES_NEAREST or \
+               (rm == RM_RTP and not sign) or \
+               (rm == RM_RTN and sign):
                 self.set_infinite(sign)
             else:
-                # maximum non-infinite value, with correct sign
-                self.set_sign_bit(sign)
-            return
+                self.pack(sign, 2 ** self.w - 2, 2 ** self.t - 1)
+            if trace.ENABLED:
+                trace.emit("overflow",
+                           format=(self.w, self.p), rm=rm, sign=sign,
+                           infinite=self.isInfinite())
+        elif kept >> self.t:
+            # Normal
+            self.pack(sign, lsb + self.t + self.bias, kept - (1 << self.t))
+        else:
+            # Subnormal or zero
+            assert lsb == self.emin - self.t
+            self.pack(sign, 0, kept)
 
-        # We implement rounding through binary search as bitvectors
-        # views of integers happen to align with the total order. This
-        # is slow but easy to understand. We sign-correct at the end.
-        for guess in Bisect(low, high):
-            self.bv   = guess.value()
-            v         = self.to_rational()
-            low, high = guess.bounds()
-            # print("%08X" % (self.bv, v, v.to_python_float(), low, high))
-
-            if v > target:
-                guess.too_high()
-            elif v < target:
-                guess.too_low()
-            else:
-                # Exact non-zero result, just need to fix up the sign
-                # and we're good to go.
-                self.set_sign_bit(sign)
-                return
-        assert high in (low, low + 1)
-        # print("low : %08X" % low)
-        # print("high: %08X" % high)
-
-        # Binary search has given us a lower and upper bound, now we
-        # select based on rounding mode.
-        self.bv = low
-        v_low = self.to_rational()
-
-        self.bv = high
-        v_high = self.to_rational()
-
-        assert v_low <= target <= v_high
-        halfpoint = (v_low + v_high) * Rational(1, 2)
-        assert v_low <= halfpoint <= v_high
-
-        if rm in MPF.ROUNDING_MODES_NEAREST:
-            # Implement rounding for 4.3.1 (nearest)
-            if target == halfpoint:
-                # exactly between, now we need to follow 4.3.1 or 4.3.2
-                if rm == RM_RNE:
-                    if high % 2 == 0:
-                        self.bv = high
-                    else:
-                        self.bv = low
-                    assert self.bv % 2 == 0
-                else:
-                    assert rm == RM_RNA
-                    self.bv = high
-            elif target < halfpoint:
-                self.bv = low
-            else:
-                assert target > halfpoint
-                self.bv = high
+    def to_rational(self):
+        """Convert from MPF to :class:`.Rational`
+
+        Raises AssertionError for infinities or NaN. The result is
+        cached until the value changes.
+        """
+        if instrumentation.ENABLED:
+            instrumentation.count("to_rational.calls")
+        cache = self.rational_cache
+        if cache is not None and cache[0] == self.bv:
+            return cache[1]
+        if instrumentation.ENABLED:
+            instrumentation.count("to_rational.computed")
+
+        S, m, e = self.to_dyadic()
+        if S == 1:
+            m = -m
+        if e >= 0:
+            rv = Rational(m << e)
         else:
-            assert rm in MPF.ROUNDING_MODES_DIRECTED
-            # Implement rounding for 4.3.2 (directed)
+            rv = Rational(m, 1 << -e)
 
-            if rm == RM_RTP:
-                if sign:
-                    self.bv = low
-                else:
-                    self.bv = high
-            elif rm == RM_RTN:
-                if sign:
-                    self.bv = high
-                else:
-                    self.bv = low
-            else:
-                assert rm == RM_RTZ
-                self.bv = low
+        self.rational_cache = (self.bv, rv)
+        return rv
 
-        # And just need to fix up the sign
-        self.set_sign_bit(sign)
+    def to_dyadic(self):
+        """Convert from MPF to significand and exponent
 
-    def to_rational(self):
-        """Convert from MPF to :class:`.Rational`
+        Returns a tuple of integers (S, m, e) such that the value is
+        :math:`(-1)^S * m * 2^e`, where *m* has at most p bits. Zeros
+        have m = 0.
 
-        Raises AssertionError for infinities or NaN.
+        Raises AssertionError for infinities or NaN. This is the
+        inverse of :func:`from_dyadic`.
         """
         S, E, T = self.unpack()
 
         if E == 2 ** self.w - 1:
             # Infinity (T = 0) or NaN (T != 0)
             assert False
-        elif E >= 1 or T != 0:
-            v = q_pow2(1 - self.p) * Rational(T)
-            if E >= 1:
-                # normal -1^S * S^(E-bias) * (1 + 2^(1-p) * T)
-                assert E <= 2 ** self.w - 2
-                v = q_pow2(E - self.bias) * (Rational(1) + v)
-            else:
-                assert E == 0 and T != 0
-                # subnormal -1^S * 2^emin * (0 + 2^(1-p) * T)
-                v = q_pow2(self.emin) * v
-            if S == 1:
-                v = -v
+        elif E >= 1:
+            # normal -1^S * 2^(E-bias) * (1 + 2^(1-p) * T)
+            return (S, (1 << self.t) | T, E - self.bias - self.t)
         else:
-            assert E == 0 and T == 0
-            # zero
-            v = Rational(0)
-
-        return v
+            # subnormal -1^S * 2^emin * (0 + 2^(1-p) * T), or zero
+            return (S, T, self.emin - self.t)
 
     def to_int(self, rm):
         """Convert from MPF to Python int`
@@ -383,10 +557,17 @@ class MPF:
         assert rm in MPF.ROUNDING_MODES
         assert self.isFinite()
 
-        q = q_round(rm, self.to_rational())
+        S, m, e = self.to_dyadic()
+        if e >= 0:
+            # Already integral
+            i = m << e
+        else:
+            i = int_round_shift(rm, S, m, -e)
 
-        assert q.isIntegral()
-        return q.a
+        if S:
+            return -i
+        else:
+            return i
 
     def to_python_float(self):
         """Convert from MPF to Python float`
@@ -434,6 +615,51 @@ class MPF:
         else:
             return self.to_rational().to_decimal_string()
 
+    def to_hex_string(self):
+        """Convert from MPF to C99 hexadecimal float
+
+        Returns the value in the format of C's %a, for example
+        '-0x1.8p-3' or '0x1p+0'. Normal numbers start with '0x1.' and
+        subnormals with '0x0.' and the exponent emin. The special
+        cases are '0x0p+0', '-0x0p+0', 'inf', '-inf' and 'nan'.
+
+        This is precise, and :func:`from_hex_string` is its inverse.
+
+        """
+        S, E, T = self.unpack()
+        if S:
+            sign = "-"
+        else:
+            sign = ""
+
+        if E == 2 ** self.w - 1:
+            if T:
+                return "nan"
+            else:
+                return sign + "inf"
+        elif E == 0 and T == 0:
+            return sign + "0x0p+0"
+        elif E == 0:
+            lead     = 0
+            exponent = self.emin
+        else:
+            lead     = 1
+            exponent = E - self.bias
+
+        # The significand padded to whole hex digits, without
+        # trailing zeros
+        digits = (self.t + 3) // 4
+        T    <<= 4 * digits - self.t
+        if T:
+            zeros    = ((T & -T).bit_length() - 1) // 4
+            T      >>= 4 * zeros
+            digits  -= zeros
+
+        if T:
+            return "%s0x%u.%0*xp%+d" % (sign, lead, digits, T, exponent)
+        else:
+            return "%s0x%up%+d" % (sign, lead, exponent)
+
     ######################################################################
     # Setters
 
@@ -479,8 +705,8 @@ class MPF:
         elif E >= 1 or T != 0:
             rv += "0x%0*X" % (self.k // 4, self.bv)
             rv += " "
-            rv += "[%s, %f]" % (self.to_rational(),
-                                self.to_rational().to_python_float())
+            q = self.to_rational()
+            rv += "[%s, %f]" % (q, q.to_python_float())
         else:
             if S:
                 rv += "-"
@@ -556,6 +782,29 @@ class MPF:
         else:
             return self.partial_order() == other.partial_order()
 
+    # MPFs are not hashable: they are mutable, and hashing would have
+    # to agree with floating-point equality, which merges +0 and -0
+    # and never finds a NaN. Use key() instead.
+    __hash__ = None
+
+    def key(self, canonical_nan=False):
+        """Identity key (eb, sb, bits)
+
+        Two floats have the same key iff they have the same precision
+        and bit pattern, so unlike == this distinguishes +0 and -0
+        and considers NaN equal to itself. The key is a tuple, and so
+        can be put in sets or used as a dict key. This is the way to
+        deduplicate floats, or to use them in sets and dicts:
+
+        >>> unique = {x.key() : x for x in floats}.values()
+
+        If *canonical_nan* is set all NaNs have the same key (as in
+        SMT-LIB).
+        """
+        if canonical_nan and self.isNaN():
+            return (self.w, self.p, (1 << self.k) - 1)
+        return (self.w, self.p, self.bv)
+
     ######################################################################
     # Queries
 
@@ -618,7 +867,12 @@ class MPF:
         """
 
         if self.isFinite():
-            return self.to_rational().isIntegral()
+            _, m, e = self.to_dyadic()
+            if m == 0 or e >= 0:
+                return True
+            # Check the trailing zeros cover the fractional bits
+            trailing_zeros = (m & -m).bit_length() - 1
+            return e + trailing_zeros >= 0
         else:
             return False
 
@@ -736,21 +990,61 @@ class MPF:
         """
         return self.smtlib_literals()[-1]
 
-    def smtlib_random_literal(self):
+    def smtlib_random_literal(self, rng=None):
         """Return an SMT-LIB literal (randomly chosen)
 
-        Chooses randomly from :func:`smtlib_literals`.
+        Chooses randomly from :func:`smtlib_literals`, using *rng* (a
+        random.Random) if given and the global random module
+        otherwise.
         """
-        return random.choice(self.smtlib_literals())
+        return (rng or random).choice(self.smtlib_literals())
 
-def q_round(rm, number):
-    assert rm in MPF.ROUNDING_MODES
-    rnd = {RM_RNE : q_round_rne,
+Q_ROUND = {RM_RNE : q_round_rne,
            RM_RNA : q_round_rna,
            RM_RTZ : q_round_rtz,
            RM_RTP : q_round_rtp,
-           RM_RTN : q_round_rtn}[rm]
-    return rnd(number)
+           RM_RTN : q_round_rtn}
+
+def q_round(rm, number):
+    assert rm in MPF.ROUNDING_MODES
+    return Q_ROUND[rm](number)
+
+def dyadic_add(p, left, right):
+    """Add two values given as (sign, m, e), see :func:`MPF.to_dyadic`
+
+    Returns (sign, m, e, sticky) suitable for :func:`MPF.from_dyadic`
+    for a float with precision *p*. If the result is an exact zero
+    then m is 0 (and the sign is meaningless).
+
+    If one operand is much smaller than the other it only matters as
+    a sticky bit, so we don't need to align it precisely. This means
+    the cost does not depend on the difference of the exponents.
+    """
+    s1, m1, e1 = left
+    s2, m2, e2 = right
+    if m1 == 0:
+        return (s2, m2, e2, False)
+    elif m2 == 0:
+        return (s1, m1, e1, False)
+
+    if e1 + m1.bit_length() < e2 + m2.bit_length():
+        s1, m1, e1, s2, m2, e2 = s2, m2, e2, s1, m1, e1
+    top = e1 + m1.bit_length() - 1
+
+    # Anything below 2^grid only matters as a sticky bit
+    grid = min(top - p - 2, e1)
+    if e2 + m2.bit_length() - 1 < grid:
+        m = m1 << (e1 - grid)
+        if s1 == s2:
+            return (s1, m, grid, True)
+        else:
+            return (s1, m - 1, grid, True)
+
+    e = min(e1, e2)
+    v1 = m1 << (e1 - e)
+    v2 = m2 << (e2 - e)
+    v = (-v1 if s1 else v1) + (-v2 if s2 else v2)
+    return (int(v < 0), abs(v), e, False)
 
 def fp_add(rm, left, right):
     """Floating-point addition
@@ -768,6 +1062,8 @@ def fp_add(rm, left, right):
       * otherwise, we return +0
 
     """
+    if instrumentation.ACTIVE and instrumentation.outermost(fp_add):
+        return instrumentation.timed_call(fp_add, rm, left, right)
     assert rm in MPF.ROUNDING_MODES
     assert left.compatible(right)
     rv = left.new_mpf() # rv == left
@@ -782,8 +1078,10 @@ def fp_add(rm, left, right):
     elif right.isInfinite():
         rv.bv = right.bv
     else:
-        q = left.to_rational() + right.to_rational()
-        if q.isZero():
+        sign, m, e, sticky = dyadic_add(left.p,
+                                        left.to_dyadic(),
+                                        right.to_dyadic())
+        if m == 0:
             # This is implementing 6.3
             if left.isPositive() == right.isPositive():
                 # result exactly zero, and same sign of operands; preserve sign
@@ -796,7 +1094,7 @@ def fp_add(rm, left, right):
                 rv.set_zero(0)
         else:
             # otherwise just round as normal
-            rv.from_rational(rm, q)
+            rv.from_dyadic(rm, sign, m, e, sticky)
 
     return rv
 
@@ -809,6 +1107,8 @@ def fp_sub(rm, left, right):
     See :func:`fp_add` for special cases.
 
     """
+    if instrumentation.ACTIVE and instrumentation.outermost(fp_sub):
+        return instrumentation.timed_call(fp_sub, rm, left, right)
     assert rm in MPF.ROUNDING_MODES
     assert left.compatible(right)
     rv = left.new_mpf() # rv == left
@@ -823,8 +1123,11 @@ def fp_sub(rm, left, right):
     elif right.isInfinite():
         rv = -(right)
     else:
-        q = left.to_rational() - right.to_rational()
-        if q.isZero():
+        S, m, e = right.to_dyadic()
+        sign, m, e, sticky = dyadic_add(left.p,
+                                        left.to_dyadic(),
+                                        (1 - S, m, e))
+        if m == 0:
             # This is implementing 6.3
             if left.isPositive() != right.isPositive():
                 # result exactly zero with different signs, preserve
@@ -837,7 +1140,7 @@ def fp_sub(rm, left, right):
                 rv.set_zero(0)
         else:
             # otherwise just round as normal
-            rv.from_rational(rm, q)
+            rv.from_dyadic(rm, sign, m, e, sticky)
 
     return rv
 
@@ -855,6 +1158,8 @@ def fp_mul(rm, left, right):
       * 0 of the same sign as the 0 operand
 
     """
+    if instrumentation.ACTIVE and instrumentation.outermost(fp_mul):
+        return instrumentation.timed_call(fp_mul, rm, left, right)
     assert rm in MPF.ROUNDING_MODES
     assert left.compatible(right)
     sign = (1 if left.isNegative() ^ right.isNegative() else 0)
@@ -870,12 +1175,15 @@ def fp_mul(rm, left, right):
     elif left.isZero() or right.isZero():
         rv.set_zero(sign)
     else:
-        q = left.to_rational() * right.to_rational()
-        rv.from_rational(rm, q)
+        _, m1, e1 = left.to_dyadic()
+        _, m2, e2 = right.to_dyadic()
+        rv.from_dyadic(rm, sign, m1 * m2, e1 + e2)
 
     return rv
 
 def fp_div(rm, left, right):
+    if instrumentation.ACTIVE and instrumentation.outermost(fp_div):
+        return instrumentation.timed_call(fp_div, rm, left, right)
     r"""Floating-point division
 
     Performs a correctly rounded :math:`left \div right`. The
@@ -906,14 +1214,16 @@ def fp_div(rm, left, right):
         rv.set_nan()
     elif left.isInfinite() or right.isZero():
         rv.set_infinite(sign)
-    elif right.isInfinite():
+    elif right.isInfinite() or left.isZero():
         rv.set_zero(sign)
     else:
-        q = left.to_rational() / right.to_rational()
-        if q.isZero():
-            rv.set_zero(sign)
-        else:
-            rv.from_rational(rm, q)
+        _, m1, e1 = left.to_dyadic()
+        _, m2, e2 = right.to_dyadic()
+        # Compute at least p + 2 bits of the quotient, the remainder
+        # then only matters as a sticky bit
+        s = max(0, left.p + 3 - (m1.bit_length() - m2.bit_length()))
+        m, r = divmod(m1 << s, m2)
+        rv.from_dyadic(rm, sign, m, e1 - e2 - s, r != 0)
 
     return rv
 
@@ -922,6 +1232,8 @@ def fp_fma(rm, x, y, z): #pylint: disable=invalid-name
 
     Performs a correctly rounded :math:`x * y + z`. The special cases
     of :func:`fp_mul` and :func:`fp_add` apply, and in addition:
+    if instrumentation.ACTIVE and instrumentation.outermost(fp_fma):
+        return instrumentation.timed_call(fp_fma, rm, x, y, z)
 
     * On a precise 0 result the sign of zero is:
 
@@ -949,8 +1261,12 @@ def fp_fma(rm, x, y, z): #pylint: disable=invalid-name
     elif z.isInfinite():
         rv.set_infinite(z.isNegative())
     else:
-        q = (x.to_rational() * y.to_rational()) + z.to_rational()
-        if q.isZero():
+        _, m1, e1 = x.to_dyadic()
+        _, m2, e2 = y.to_dyadic()
+        sign, m, e, sticky = dyadic_add(x.p,
+                                        (sign_xy, m1 * m2, e1 + e2),
+                                        z.to_dyadic())
+        if m == 0:
             # This is implementing 6.3
             if sign_xy == sign_z:
                 # result exactly zero, and same sign of operands; preserve sign
@@ -963,12 +1279,14 @@ def fp_fma(rm, x, y, z): #pylint: disable=invalid-name
                 rv.set_zero(0)
         else:
             # otherwise just round as normal
-            rv.from_rational(rm, q)
+            rv.from_dyadic(rm, sign, m, e, sticky)
 
     return rv
 
 def fp_sqrt(rm, op):
     """Floating-point square root"""
+    if instrumentation.ACTIVE and instrumentation.outermost(fp_sqrt):
+        return instrumentation.timed_call(fp_sqrt, rm, op)
     assert rm in MPF.ROUNDING_MODES
     # We can get away with approximating the square root to sufficient
     # precision because of Theorem 19 (p168) of the Handbook of
@@ -982,68 +1300,73 @@ def fp_sqrt(rm, op):
     elif op.isInfinite() or op.isZero():
         pass # OK as is, preserve sign of zero
     else:
-        # We now do a binary search to find the closest binary float. This is
-        # much faster than trying to approximate in rationals as the numbers
-        # can very quickly get very big.
-        low  = op.new_mpf()
-        high = op.new_mpf()
-
-        low.bv  = 0
-        high.bv = ((2 ** op.w - 2) << op.t) | (2 ** op.t - 1)
-
-        target = op.to_rational()
-
-        for guess in Bisect(low.bv, high.bv):
-            root.bv         = guess.value()
-            low.bv, high.bv = guess.bounds()
-            q               = root.to_rational()
-            q_squared       = q * q
-
-            if q_squared > target:
-                guess.too_high()
-            elif q_squared < target:
-                guess.too_low()
-            else:
-                # We've found an exact match, we should return that.
-                return root
-
-        if rm in MPF.ROUNDING_MODES_NEAREST:
-            low_error = target - (low.to_rational() * low.to_rational())
-            high_error = (high.to_rational() * high.to_rational()) - target
-            if low_error < high_error:
-                root.bv = low.bv
-            else:
-                assert high_error < low_error
-                root.bv = high.bv
-        elif rm in (RM_RTN, RM_RTZ):
-            root.bv = low.bv
-        else:
-            root.bv = high.bv
+        # We compute the integer square root with at least p + 2
+        # bits; the remainder then only matters as a sticky bit.
+        _, m, e = op.to_dyadic()
+        if e % 2 != 0:
+            m <<= 1
+            e  -= 1
+        s = max(0, op.p + 3 - (m.bit_length() + 1) // 2)
+        m <<= 2 * s
+        e  -= 2 * s
+        r = _isqrt(m)
+        if trace.ENABLED:
+            trace.emit("sqrt",
+                       rm=rm, m=m, e=e, root=r, exact=r * r == m)
+        root.from_dyadic(rm, 0, r, e // 2, r * r != m)
 
     return root
 
 def fp_rem(left, right):
     """Floating-point remainder"""
+    if instrumentation.ACTIVE and instrumentation.outermost(fp_rem):
+        return instrumentation.timed_call(fp_rem, left, right)
     assert left.compatible(right)
 
     rv = left.new_mpf()
     if left.isNaN() or right.isNaN() or left.isInfinite() or right.isZero():
         rv.set_nan()
-    elif right.isInfinite():
+    elif right.isInfinite() or left.isZero():
         # Result is left
         pass
     else:
-        n = q_round_rne(left.to_rational() / right.to_rational())
-        r = left.to_rational() - (right.to_rational() * n)
+        # We have left / right = 2k + R / Y (where k is an integer and
+        # 0 <= R < 2Y). We do not need k, only whether R / Y rounds
+        # (to even) to 0, 1 or 2.
+        S, m1, e1 = left.to_dyadic()
+        _, m2, e2 = right.to_dyadic()
+        if e1 >= e2:
+            e = e2
+            Y = m2
+            R = (m1 * pow(2, e1 - e2, 2 * Y)) % (2 * Y)
+        elif e1 + m1.bit_length() < e2 + m2.bit_length() - 1:
+            # |left| < |right| / 2, so the result is left
+            return rv
+        else:
+            e = e1
+            Y = m2 << (e2 - e1)
+            R = m1 % (2 * Y)
+
+        if 2 * R <= Y:
+            r = R
+        elif 2 * R < 3 * Y:
+            r = R - Y
+        else:
+            r = R - 2 * Y
+
         # Rounding mode is irrelevant here, r will be exact
-        rv.from_rational(RM_RNE, r)
-        if r.isZero():
-            rv.set_sign_bit(left.isNegative())
+        if r == 0:
+            rv.set_zero(S)
+        else:
+            rv.from_dyadic(RM_RNE, S ^ int(r < 0), abs(r), e)
 
     return rv
 
 def fp_roundToIntegral(rm, op):
     """Floating-point round to integer"""
+    if instrumentation.ACTIVE and \
+       instrumentation.outermost(fp_roundToIntegral):
+        return instrumentation.timed_call(fp_roundToIntegral, rm, op)
     assert rm in MPF.ROUNDING_MODES
 
     rv = op.new_mpf()
@@ -1051,16 +1374,18 @@ def fp_roundToIntegral(rm, op):
         # Nothing to do here
         pass
     else:
-        i = op.to_int(rm)
-        rv.from_rational(rm, Rational(i))
-
-        if i == 0 and op.isNegative():
-            rv.set_sign_bit(True)
+        # We round the significand directly, the result is exact
+        # (and keeps the sign if it is zero).
+        S, m, e = op.to_dyadic()
+        assert e < 0
+        rv.from_dyadic(rm, S, int_round_shift(rm, S, m, -e), 0)
 
     return rv
 
 def fp_min(left, right):
     """Floating-point minimum"""
+    if instrumentation.ACTIVE and instrumentation.outermost(fp_min):
+        return instrumentation.timed_call(fp_min, left, right)
     assert left.compatible(right)
     if left.isZero() and right.isZero() and \
        left.isPositive() != right.isPositive():
@@ -1075,6 +1400,8 @@ def fp_min(left, right):
 
 def fp_max(left, right):
     """Floating-point maximum"""
+    if instrumentation.ACTIVE and instrumentation.outermost(fp_max):
+        return instrumentation.timed_call(fp_max, left, right)
     assert left.compatible(right)
     if left.isZero() and right.isZero() and \
        left.isPositive() != right.isPositive():
@@ -1100,6 +1427,8 @@ def smtlib_eq(left, right):
 
 def fp_nextUp(op):
     """Floating-point successor"""
+    if instrumentation.ACTIVE and instrumentation.outermost(fp_nextUp):
+        return instrumentation.timed_call(fp_nextUp, op)
     rv = op.new_mpf()
 
     if op.isNaN():
@@ -1135,20 +1464,53 @@ def fp_nextUp(op):
 
 def fp_nextDown(op):
     """Floating-point predecessor"""
+    if instrumentation.ACTIVE and instrumentation.outermost(fp_nextDown):
+        return instrumentation.timed_call(fp_nextDown, op)
     # This is how it is defined in 5.3.1
     return -fp_nextUp(-op)
 
+def fp_totalOrder(left, right):
+    """IEEE-754 totalOrder (5.10)
+
+    Returns true if left is ordered before or is the same as right,
+    where -0 < +0 and NaNs are ordered by sign and payload.
+    """
+    assert left.compatible(right)
+    return left.total_order_key() <= right.total_order_key()
+
+def ulp_distance(left, right):
+    """Number of floats between left and right
+
+    For example the distance between x and fp_nextUp(x) is 1, and the
+    distance between -0 and +0 is 0. Raises AssertionError for NaN.
+    """
+    assert left.compatible(right)
+    return abs(left.ordinal() - right.ordinal())
+
 def fp_from_ubv(eb, sb, rm, op):
-    """Conversion from unsigned bitvector to MPF"""
+    """Conversion from unsigned bitvector (or non-negative int) to MPF"""
+    if instrumentation.ACTIVE and instrumentation.outermost(fp_from_ubv):
+        return instrumentation.timed_call(fp_from_ubv, eb, sb, rm, op)
+    if isinstance(op, BitVector):
+        op = op.to_unsigned_int()
+    assert op >= 0
     rv = MPF(eb, sb)
-    rv.from_rational(rm, op.to_unsigned_int())
+    rv.from_int(rm, op)
     return rv
 
 def fp_to_ubv(op, rm, width):
     """Conversion from MPF to unsigned bitvector"""
+    if instrumentation.ACTIVE and instrumentation.outermost(fp_to_ubv):
+        return instrumentation.timed_call(fp_to_ubv, op, rm, width)
     if op.isInfinite() or op.isNaN():
         raise Unspecified
 
+    # Avoid building huge integers for values that are obviously out
+    # of range
+    _, m, e = op.to_dyadic()
+    if e + m.bit_length() > width + 1:
+        raise Unspecified
+
     bv = BitVector(width)
 
     i = op.to_int(rm)
@@ -1159,16 +1521,28 @@ def fp_to_ubv(op, rm, width):
         raise Unspecified
 
 def fp_from_sbv(eb, sb, rm, op):
-    """Conversion from signed bitvector to MPF"""
+    """Conversion from signed bitvector (or int) to MPF"""
+    if instrumentation.ACTIVE and instrumentation.outermost(fp_from_sbv):
+        return instrumentation.timed_call(fp_from_sbv, eb, sb, rm, op)
+    if isinstance(op, BitVector):
+        op = op.to_signed_int()
     rv = MPF(eb, sb)
-    rv.from_rational(rm, op.to_signed_int())
+    rv.from_int(rm, op)
     return rv
 
 def fp_to_sbv(op, rm, width):
     """Conversion from MPF to signed bitvector"""
+    if instrumentation.ACTIVE and instrumentation.outermost(fp_to_sbv):
+        return instrumentation.timed_call(fp_to_sbv, op, rm, width)
     if op.isInfinite() or op.isNaN():
         raise Unspecified
 
+    # Avoid building huge integers for values that are obviously out
+    # of range
+    _, m, e = op.to_dyadic()
+    if e + m.bit_length() > width + 1:
+        raise Unspecified
+
     bv = BitVector(width)
 
     i = op.to_int(rm)
@@ -1178,22 +1552,47 @@ def fp_to_sbv(op, rm, width):
     else:
         raise Unspecified
 
+# ((_ to_fp eb sb) bv)
+def fp_from_binary(eb, sb, op):
+    """Conversion from bitvector (binary interchange format) to MPF"""
+    assert op.width == eb + sb
+    return MPF(eb, sb, op.to_unsigned_int())
+
+# ((_ to_fp eb sb) rm op)
+def fp_from_real(eb, sb, rm, op):
+    """Conversion from :class:`.Rational` to MPF"""
+    if instrumentation.ACTIVE and instrumentation.outermost(fp_from_real):
+        return instrumentation.timed_call(fp_from_real, eb, sb, rm, op)
+    rv = MPF(eb, sb)
+    rv.from_rational(rm, op)
+    return rv
+
+# (fp.to_real op)
+def fp_to_real(op):
+    """Conversion from MPF to :class:`.Rational`"""
+    if op.isInfinite() or op.isNaN():
+        raise Unspecified
+
+    return op.to_rational()
+
 # ((_ to_fp eb sb) rm op)
 def fp_from_int(eb, sb, rm, op):
     """Conversion from Python integer to MPF"""
+    if instrumentation.ACTIVE and instrumentation.outermost(fp_from_int):
+        return instrumentation.timed_call(fp_from_int, eb, sb, rm, op)
     rv = MPF(eb, sb)
-    rv.from_rational(rm, Rational(op))
+    rv.from_int(rm, op)
     return rv
 
 # (fp.to_int rm op)
 def fp_to_int(rm, op):
     """Conversion from MPF to Python integer"""
+    if instrumentation.ACTIVE and instrumentation.outermost(fp_to_int):
+        return instrumentation.timed_call(fp_to_int, rm, op)
     if op.isInfinite() or op.isNaN():
         raise Unspecified
 
-    q = op.to_rational()
-    q = q_round(rm, q)
-    return q.to_python_int()
+    return op.to_int(rm)
 
 # Convert op to (_ FloatingPoint eb sb) under rounding mode rm.
 #
@@ -1202,6 +1601,8 @@ def fp_to_int(rm, op):
 # doesn't change.
 def fp_from_float(eb, sb, rm, op):
     """Conversion from MPF to MPF (of a different precision)"""
+    if instrumentation.ACTIVE and instrumentation.outermost(fp_from_float):
+        return instrumentation.timed_call(fp_from_float, eb, sb, rm, op)
     rv = MPF(eb, sb)
     if op.isNaN():
         rv.set_nan()
@@ -1209,8 +1610,14 @@ def fp_from_float(eb, sb, rm, op):
         rv.set_infinite(int(op.isNegative()))
     elif op.isZero():
         rv.set_zero(int(op.isNegative()))
+    elif op.isNormal() and rv.w >= op.w and rv.p >= op.p:
+        # Widening a normal number is exact: we just need to re-bias
+        # the exponent and extend the significand.
+        S, E, T = op.unpack()
+        rv.pack(S, E - op.bias + rv.bias, T << (rv.t - op.t))
     else:
-        rv.from_rational(rm, op.to_rational())
+        S, m, e = op.to_dyadic()
+        rv.from_dyadic(rm, S, m, e)
     return rv
 
 ##############################################################################
@@ -1221,23 +1628,12 @@ def interval_nearest(rm, op):
     assert rm in MPF.ROUNDING_MODES_NEAREST
     assert not op.isNaN()
 
-    DEBUG_INTERVAL = False
-
-    if DEBUG_INTERVAL:
-        print("Interval query: %s [%s]" % (op, rm))
-
     interval = Interval()
 
     op_is_even = (op.bv % 2) == 0
-    if DEBUG_INTERVAL:
-        if rm == RM_RNE:
-            print("> even? : %s" % op_is_even)
 
     low  = fp_nextDown(op)
     high = fp_nextUp(op)
-    if DEBUG_INTERVAL:
-        print("> low  : %s" % low)
-        print("> high : %s" % high)
 
     # Boundary for infinity, as described in IEEE 754 (Section 4.3.1)
     #
@@ -1246,9 +1642,11 @@ def interval_nearest(rm, op):
     # least [...]"; now what does "at least" mean?
     #
     # I have chosen to interpret this as >=, instead of >.
-    inf = Rational(op.inf_boundary())
-    if DEBUG_INTERVAL:
-        print("> inf  : %s" % inf)
+    inf = op.inf_boundary()
+    if trace.ENABLED:
+        trace.emit("interval_query",
+                   rm=rm, op=repr(op), even=op_is_even,
+                   low=repr(low), high=repr(high), inf=inf)
 
     # Lets establish some basic bounds relevant to round-to-nearest
     #
@@ -1299,11 +1697,9 @@ def interval_nearest(rm, op):
         q_high = -inf
         high_inclusive = True
 
-    if DEBUG_INTERVAL:
-        print("> established high bound : %s %s" % (q_high,
-                                                    "inclusive"
-                                                    if high_inclusive
-                                                    else ""))
+    if trace.ENABLED:
+        trace.emit("interval_bound",
+                   side="high", q=q_high, inclusive=high_inclusive)
 
     # Sanity check that the interval does or does not convert back
     if q_high is not None:
@@ -1334,11 +1730,9 @@ def interval_nearest(rm, op):
         q_low = inf
         low_inclusive = True
 
-    if DEBUG_INTERVAL:
-        print("> established low bound  : %s %s" % (q_low,
-                                                    "inclusive"
-                                                    if low_inclusive
-                                                    else ""))
+    if trace.ENABLED:
+        trace.emit("interval_bound",
+                   side="low", q=q_low, inclusive=low_inclusive)
 
     # Sanity check that the interval does or does not convert back
     if q_low is not None:
@@ -1346,35 +1740,10 @@ def interval_nearest(rm, op):
         tmp.from_rational(rm, q_low)
         assert smtlib_eq(tmp, op) == low_inclusive
 
-    if DEBUG_INTERVAL:
-        tmp = ""
-        if low_inclusive:
-            tmp += "["
-        else:
-            tmp += "]"
-        tmp += " "
-        if q_low is None:
-            tmp += "-oo"
-        else:
-            tmp += str(q_low)
-        tmp += " .. "
-        if q_high is None:
-            tmp += "+oo"
-        else:
-            tmp += str(q_high)
-        tmp += " "
-        if high_inclusive:
-            tmp += "]"
-        else:
-            tmp += "["
-        print("> interval : %s" % tmp)
-
     if q_low is not None:
         interval.set_low(q_low, low_inclusive)
     if q_high is not None:
         interval.set_high(q_high, high_inclusive)
-    if DEBUG_INTERVAL:
-        print("> interval : %s" % interval)
 
     return interval
 
@@ -1440,17 +1809,39 @@ def interval_down(rm, op):
 
     return interval
 
+# RTZ is missing here, as it depends on the sign of op
+FP_INTERVAL = {
+    RM_RNE: interval_nearest,
+    RM_RNA: interval_nearest,
+    RM_RTP: interval_up,
+    RM_RTN: interval_down,
+}
+
 def fp_interval(rm, op):
+    if instrumentation.ACTIVE and instrumentation.outermost(fp_interval):
+        return instrumentation.timed_call(fp_interval, rm, op)
     assert rm in MPF.ROUNDING_MODES
     assert not op.isNaN()
 
-    return {
-        RM_RNE: interval_nearest,
-        RM_RNA: interval_nearest,
-        RM_RTP: interval_up,
-        RM_RTN: interval_down,
-        RM_RTZ: (interval_up if op.isNegative() else interval_down),
-    }[rm](rm, op)
+    if rm == RM_RTZ:
+        if op.isNegative():
+            rv = interval_up(rm, op)
+        else:
+            rv = interval_down(rm, op)
+    else:
+        rv = FP_INTERVAL[rm](rm, op)
+
+    if trace.ENABLED:
+        if rv is None:
+            trace.emit("interval", rm=rm, op=repr(op), empty=True)
+        else:
+            trace.emit("interval",
+                       rm=rm, op=repr(op), empty=False,
+                       low=rv.low.value,
+                       low_inclusive=rv.low.is_inclusive(),
+                       high=rv.high.value,
+                       high_inclusive=rv.high.is_inclusive())
+    return rv
 
 ##############################################################################
 # SMTLIB Operations
@@ -1463,19 +1854,39 @@ TYP_REAL  = "real"
 TYP_BV    = "bitvector"
 
 class Floating_Point_Operation:
+    """SMT-LIB floating-point operation
+
+    The *evaluator* computes the operation. It is called with the
+    rounding mode first (if *rm_arg*), then *eb* and *sb* (if
+    *precision_arg*), and then the arguments.
+    """
     def __init__(self,
                  name,
                  arity,
                  result_type=TYP_FLOAT,
                  args_type=TYP_FLOAT,
                  rm_arg=True,
-                 precision_arg=False):
+                 precision_arg=False,
+                 evaluator=None):
         self.name          = name
         self.arity         = arity
         self.result_type   = result_type
         self.args_type     = args_type
         self.rm_arg        = rm_arg
         self.precision_arg = precision_arg
+        self.evaluator     = evaluator
+
+    def evaluate(self, rm, *args):
+        """Evaluate the operation
+
+        *rm* must be None for operations without a rounding mode.
+        """
+        if self.rm_arg:
+            assert rm in MPF.ROUNDING_MODES
+            return self.evaluator(rm, *args)
+        else:
+            assert rm is None
+            return self.evaluator(*args)
 
 class Floating_Point_Predicate(Floating_Point_Operation):
     def __init__(self,
@@ -1484,95 +1895,161 @@ class Floating_Point_Predicate(Floating_Point_Operation):
                  result_type=TYP_BOOL,
                  args_type=TYP_FLOAT,
                  rm_arg=False,
-                 precision_arg=False):
+                 precision_arg=False,
+                 evaluator=None):
         super(Floating_Point_Predicate, self).__init__(name,
                                                        arity,
                                                        result_type,
                                                        args_type,
                                                        rm_arg,
-                                                       precision_arg)
+                                                       precision_arg,
+                                                       evaluator)
+
+# The conversions to float take the precision before the rounding
+# mode, so we need to shuffle the arguments a bit.
+def _to_fp(fn):
+    return lambda rm, eb, sb, op: fn(eb, sb, rm, op)
+
+def _to_bv(fn):
+    return lambda rm, op, width: fn(op, rm, width)
+
+# fp.to_int has no rounding mode, it rounds like to_int in SMT-LIB
+# (i.e. towards negative).
+def _to_int(op):
+    return fp_to_int(RM_RTN, op)
 
 FP_OPS = {
     # Basic operations
     "fp.abs"             : Floating_Point_Operation("fp.abs",
-                                                    1, rm_arg=False),
+                                                    1, rm_arg=False,
+                                                    evaluator=abs),
     "fp.neg"             : Floating_Point_Operation("fp.neg",
-                                                    1, rm_arg=False),
-    "fp.sqrt"            : Floating_Point_Operation("fp.sqrt", 1),
-    "fp.roundToIntegral" : Floating_Point_Operation("fp.roundToIntegral", 1),
-    "fp.add"             : Floating_Point_Operation("fp.add", 2),
-    "fp.sub"             : Floating_Point_Operation("fp.sub", 2),
-    "fp.mul"             : Floating_Point_Operation("fp.mul", 2),
-    "fp.div"             : Floating_Point_Operation("fp.div", 2),
-    "fp.rem"             : Floating_Point_Operation("fp.rem", 2, rm_arg=False),
-    "fp.min"             : Floating_Point_Operation("fp.min", 2, rm_arg=False),
-    "fp.max"             : Floating_Point_Operation("fp.max", 2, rm_arg=False),
-    "fp.fma"             : Floating_Point_Operation("fp.fma", 3),
+                                                    1, rm_arg=False,
+                                                    evaluator=operator.neg),
+    "fp.sqrt"            : Floating_Point_Operation("fp.sqrt", 1,
+                                                    evaluator=fp_sqrt),
+    "fp.roundToIntegral" : Floating_Point_Operation("fp.roundToIntegral", 1,
+                                                    evaluator=fp_roundToIntegral),
+    "fp.add"             : Floating_Point_Operation("fp.add", 2,
+                                                    evaluator=fp_add),
+    "fp.sub"             : Floating_Point_Operation("fp.sub", 2,
+                                                    evaluator=fp_sub),
+    "fp.mul"             : Floating_Point_Operation("fp.mul", 2,
+                                                    evaluator=fp_mul),
+    "fp.div"             : Floating_Point_Operation("fp.div", 2,
+                                                    evaluator=fp_div),
+    "fp.rem"             : Floating_Point_Operation("fp.rem", 2, rm_arg=False,
+                                                    evaluator=fp_rem),
+    "fp.min"             : Floating_Point_Operation("fp.min", 2, rm_arg=False,
+                                                    evaluator=fp_min),
+    "fp.max"             : Floating_Point_Operation("fp.max", 2, rm_arg=False,
+                                                    evaluator=fp_max),
+    "fp.fma"             : Floating_Point_Operation("fp.fma", 3,
+                                                    evaluator=fp_fma),
 
     # Predicates
-    "fp.isNormal"        : Floating_Point_Predicate("fp.isNormal", 1),
-    "fp.isSubnormal"     : Floating_Point_Predicate("fp.isSubnormal", 1),
-    "fp.isZero"          : Floating_Point_Predicate("fp.isZero", 1),
-    "fp.isInfinite"      : Floating_Point_Predicate("fp.isInfinite", 1),
-    "fp.isNaN"           : Floating_Point_Predicate("fp.isNaN", 1),
-    "fp.isPositive"      : Floating_Point_Predicate("fp.isPositive", 1),
-    "fp.isNegative"      : Floating_Point_Predicate("fp.isNegative", 1),
-    "fp.eq"              : Floating_Point_Predicate("fp.eq", 2),
-    "fp.lt"              : Floating_Point_Predicate("fp.lt", 2),
-    "fp.gt"              : Floating_Point_Predicate("fp.gt", 2),
-    "fp.leq"             : Floating_Point_Predicate("fp.leq", 2),
-    "fp.geq"             : Floating_Point_Predicate("fp.geq", 2),
-    "smtlib.eq"          : Floating_Point_Predicate("=", 2),
+    "fp.isNormal"        : Floating_Point_Predicate("fp.isNormal", 1,
+                                                    evaluator=MPF.isNormal),
+    "fp.isSubnormal"     : Floating_Point_Predicate("fp.isSubnormal", 1,
+                                                    evaluator=MPF.isSubnormal),
+    "fp.isZero"          : Floating_Point_Predicate("fp.isZero", 1,
+                                                    evaluator=MPF.isZero),
+    "fp.isInfinite"      : Floating_Point_Predicate("fp.isInfinite", 1,
+                                                    evaluator=MPF.isInfinite),
+    "fp.isNaN"           : Floating_Point_Predicate("fp.isNaN", 1,
+                                                    evaluator=MPF.isNaN),
+    "fp.isPositive"      : Floating_Point_Predicate("fp.isPositive", 1,
+                                                    evaluator=MPF.isPositive),
+    "fp.isNegative"      : Floating_Point_Predicate("fp.isNegative", 1,
+                                                    evaluator=MPF.isNegative),
+    "fp.eq"              : Floating_Point_Predicate("fp.eq", 2,
+                                                    evaluator=operator.eq),
+    "fp.lt"              : Floating_Point_Predicate("fp.lt", 2,
+                                                    evaluator=operator.lt),
+    "fp.gt"              : Floating_Point_Predicate("fp.gt", 2,
+                                                    evaluator=operator.gt),
+    "fp.leq"             : Floating_Point_Predicate("fp.leq", 2,
+                                                    evaluator=operator.le),
+    "fp.geq"             : Floating_Point_Predicate("fp.geq", 2,
+                                                    evaluator=operator.ge),
+    "smtlib.eq"          : Floating_Point_Predicate("=", 2,
+                                                    evaluator=smtlib_eq),
 
     # Conversion to float
     "fp.from.real"       : Floating_Point_Operation("to_fp",
                                                     1,
                                                     args_type=TYP_REAL,
-                                                    precision_arg=True),
+                                                    precision_arg=True,
+                                                    evaluator=_to_fp(fp_from_real)),
     "fp.from.int"        : Floating_Point_Operation("to_fp",
                                                     1,
                                                     args_type=TYP_INT,
-                                                    precision_arg=True),
+                                                    precision_arg=True,
+                                                    evaluator=_to_fp(fp_from_int)),
     "fp.from.ubv"        : Floating_Point_Operation("to_fp_unsigned",
                                                     1,
                                                     args_type=TYP_BV,
-                                                    precision_arg=True),
+                                                    precision_arg=True,
+                                                    evaluator=_to_fp(fp_from_ubv)),
     "fp.from.sbv"        : Floating_Point_Operation("to_fp",
                                                     1,
                                                     args_type=TYP_BV,
-                                                    precision_arg=True),
+                                                    precision_arg=True,
+                                                    evaluator=_to_fp(fp_from_sbv)),
     "fp.from.binary"     : Floating_Point_Operation("to_fp",
                                                     1,
                                                     args_type=TYP_BV,
                                                     rm_arg=False,
-                                                    precision_arg=True),
+                                                    precision_arg=True,
+                                                    evaluator=fp_from_binary),
 
     # Conversion from float to float
     "fp.cast"            : Floating_Point_Operation("to_fp",
                                                     1,
-                                                    precision_arg=True),
+                                                    precision_arg=True,
+                                                    evaluator=_to_fp(fp_from_float)),
 
     # Conversion to other types
     "fp.to.real"         : Floating_Point_Operation("fp.to_real",
                                                     1,
                                                     result_type=TYP_REAL,
-                                                    rm_arg=False),
+                                                    rm_arg=False,
+                                                    evaluator=fp_to_real),
     "fp.to.int"          : Floating_Point_Operation("fp.to_int",
                                                     1,
                                                     result_type=TYP_INT,
-                                                    rm_arg=False),
+                                                    rm_arg=False,
+                                                    evaluator=_to_int),
     "fp.to.ubv"          : Floating_Point_Operation("fp.to_ubv",
                                                     1,
-                                                    result_type=TYP_BV),
+                                                    result_type=TYP_BV,
+                                                    evaluator=_to_bv(fp_to_ubv)),
     "fp.to.sbv"          : Floating_Point_Operation("fp.to_sbv",
                                                     1,
-                                                    result_type=TYP_BV),
+                                                    result_type=TYP_BV,
+                                                    evaluator=_to_bv(fp_to_sbv)),
 
     # Proposed extensions
-    "fp.isFinite"        : Floating_Point_Predicate("fp.isFinite", 1),
-    "fp.isIntegral"      : Floating_Point_Predicate("fp.isIntegral", 1),
+    "fp.isFinite"        : Floating_Point_Predicate("fp.isFinite", 1,
+                                                    evaluator=MPF.isFinite),
+    "fp.isIntegral"      : Floating_Point_Predicate("fp.isIntegral", 1,
+                                                    evaluator=MPF.isIntegral),
     "fp.nextUp"          : Floating_Point_Operation("fp.nextUp",
-                                                    1, rm_arg=False),
+                                                    1, rm_arg=False,
+                                                    evaluator=fp_nextUp),
     "fp.nextDown"        : Floating_Point_Operation("fp.nextDown",
-                                                    1, rm_arg=False),
+                                                    1, rm_arg=False,
+                                                    evaluator=fp_nextDown),
 }
+
+def evaluate(op_name, rm, *args):
+    """Evaluate the operation *op_name* (a key of :data:`FP_OPS`)
+
+    See :func:`Floating_Point_Operation.evaluate`. For example:
+
+    >>> evaluate("fp.add", RM_RNE, x, y)
+    >>> evaluate("fp.isNormal", None, x)
+    >>> evaluate("fp.cast", RM_RTZ, 11, 53, x)
+    >>> evaluate("fp.to.ubv", RM_RTZ, x, 32)
+    """
+    return FP_OPS[op_name].evaluate(rm, *args)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                                PYMPF                                     ##
+##                                                                          ##
+##              Copyright (C) 2020,      Florian Schanda                    ##
+##                                                                          ##
+##  This file is part of PyMPF.                                             ##
+##                                                                          ##
+##  PyMPF is free software: you can redistribute it and/or modify           ##
+##  it under the terms of the GNU General Public License as published by    ##
+##  the Free Software Foundation, either version 3 of the License, or       ##
+##  (at your option) any later version.                                     ##
+##                                                                          ##
+##  PyMPF is distributed in the hope that it will be useful,                ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with PyMPF. If not, see <http://www.gnu.org/licenses/>.           ##
+##                                                                          ##
+##############################################################################
+
+"""
+This module generates random floats of any precision. Uniformly
+random bit patterns almost never hit zeros, subnormals or
+infinities in wide formats, so instead we first pick a class of
+value and then a value in that class:
+
+* zero: +0 or -0
+* subnormal: any subnormal
+* normal: a normal number, where each binade is equally likely
+* near_pow2: a normal number within a few ulps of a power of two
+* max_normal: a normal number within a few ulps of the largest one
+* infinity: +oo or -oo
+* nan: any NaN
+
+All classes are equally likely by default. Each generator has its
+own random state derived from a seed and a stream number, so that
+parallel workers can use the same seed and different streams to get
+reproducible and independent values:
+
+>>> g = Generator(8, 24, seed=42, stream=worker_id)
+>>> x = g.value()                   # an MPF
+>>> a = g.bulk(100000)              # an MPF_Array
+>>> b = g.bulk(1000, ["subnormal", "near_pow2"])
+"""
+
+import random
+import bisect
+import itertools
+
+from .floats import MPF
+from .arrays import MPF_Array
+
+CLASSES = ("zero",
+           "subnormal",
+           "normal",
+           "near_pow2",
+           "max_normal",
+           "infinity",
+           "nan")
+
+# How many ulps away from a power of two (or the largest normal) we
+# go for near_pow2 and max_normal
+NEAR_ULPS = 4
+
+class Generator:
+    """Random generator for floats with *eb* and *sb* bits
+
+    The random state is derived from *seed* and *stream*.
+    """
+    def __init__(self, eb, sb, seed=0, stream=0):
+        assert MPF.MIN_EB <= eb <= MPF.MAX_EB
+        assert sb >= MPF.MIN_SB
+        self.eb  = eb
+        self.sb  = sb
+        self.k   = eb + sb
+        self.t   = sb - 1
+        self.rng = random.Random("%s:%u" % (seed, stream))
+
+        self.max_e  = 2 ** eb - 2
+        self.max_t  = 2 ** self.t - 1
+        self.sign   = 1 << (self.k - 1)
+        self.inf    = (2 ** eb - 1) << self.t
+        self.near_t = min(NEAR_ULPS, self.max_t)
+
+        self.draw_fn = {
+            "zero"       : self._zero,
+            "subnormal"  : self._subnormal,
+            "normal"     : self._normal,
+            "near_pow2"  : self._near_pow2,
+            "max_normal" : self._max_normal,
+            "infinity"   : self._infinity,
+            "nan"        : self._nan,
+        }
+
+    def _sign(self):
+        return self.rng.getrandbits(1) * self.sign
+
+    def _zero(self):
+        return self._sign()
+
+    def _subnormal(self):
+        return self._sign() | self.rng.randint(1, self.max_t)
+
+    def _normal(self):
+        return (self._sign() |
+                (self.rng.randint(1, self.max_e) << self.t) |
+                self.rng.getrandbits(self.t))
+
+    def _near_pow2(self):
+        # Either just above a power of two (small T) or just below
+        # (large T, one binade down).
+        E = self.rng.randint(1, self.max_e)
+        d = self.rng.randint(0, self.near_t)
+        if self.rng.getrandbits(1):
+            T = d
+        else:
+            T = self.max_t - d
+        return self._sign() | (E << self.t) | T
+
+    def _max_normal(self):
+        d = self.rng.randint(0, self.near_t)
+        return self._sign() | (self.max_e << self.t) | (self.max_t - d)
+
+    def _infinity(self):
+        return self._sign() | self.inf
+
+    def _nan(self):
+        return self._sign() | self.inf | self.rng.randint(1, self.max_t)
+
+    def draw(self, cls=None):
+        """Return the bit pattern of a random float
+
+        If *cls* (one of :data:`CLASSES`) is not given a class is
+        picked at random.
+        """
+        if cls is None:
+            cls = self.rng.choice(CLASSES)
+        return self.draw_fn[cls]()
+
+    def value(self, cls=None):
+        """Return a random MPF, see :func:`draw`"""
+        return MPF(self.eb, self.sb, self.draw(cls))
+
+    def bulk(self, count, classes=None, weights=None):
+        """Return an :class:`.MPF_Array` of *count* random floats
+
+        Classes are picked from *classes* (by default all of
+        :data:`CLASSES`), with the relative *weights* if given.
+        """
+        if classes is None:
+            classes = CLASSES
+        for cls in classes:
+            assert cls in self.draw_fn
+        fns = [self.draw_fn[cls] for cls in classes]
+
+        # We pick the class and draw the value for one element at a
+        # time, so that bulk(n) gives a prefix of bulk(n + 1).
+        rv = MPF_Array(self.eb, self.sb)
+        if weights is None:
+            choice = self.rng.choice
+            rv.patterns.extend(choice(fns)() for _ in range(count))
+        else:
+            assert len(weights) == len(classes)
+            cumulative = list(itertools.accumulate(weights))
+            total      = cumulative[-1]
+            pick       = self.rng.random
+            rv.patterns.extend(
+                fns[bisect.bisect_right(cumulative, pick() * total)]()
+                for _ in range(count))
+        return rv
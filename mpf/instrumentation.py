@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                                PYMPF                                     ##
+##                                                                          ##
+##              Copyright (C) 2020,      Florian Schanda                    ##
+##                                                                          ##
+##  This file is part of PyMPF.                                             ##
+##                                                                          ##
+##  PyMPF is free software: you can redistribute it and/or modify           ##
+##  it under the terms of the GNU General Public License as published by    ##
+##  the Free Software Foundation, either version 3 of the License, or       ##
+##  (at your option) any later version.                                     ##
+##                                                                          ##
+##  PyMPF is distributed in the hope that it will be useful,                ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with PyMPF. If not, see <http://www.gnu.org/licenses/>.           ##
+##                                                                          ##
+##############################################################################
+
+"""
+This module provides optional counters and timers for the hot paths
+of PyMPF. It is off by default, and can be enabled either by setting
+the environment variable PYMPF_STATS to a non-empty value other than
+"0" before importing mpf, or temporarily using :func:`collecting`:
+
+>>> with collecting() as stats:
+...     x = fp_add(RM_RNE, a, b)
+>>> stats.snapshot()["counters"]["from_dyadic.calls"]
+1
+
+When disabled, each instrumentation point costs a single test of
+:data:`ENABLED` (or :data:`ACTIVE` at the start of the timed fp_*
+functions, which covers tracing as well). When enabled, updates are serialised with a lock so
+that statistics can be collected from several threads.
+
+The following is collected:
+
+* counters: number of from_rational, from_dyadic (i.e. rounding)
+  and to_rational calls, Rational allocations and gcd calls, etc.
+
+* bits: the largest bit size (and a histogram of bit sizes, bucketed
+  by powers of two) of the integers making up intermediate rationals
+
+* latency: for each fp_* function, by format and rounding mode, the
+  number of calls, total and maximum time, and a histogram of call
+  times (in nanoseconds, bucketed by powers of two)
+"""
+
+import os
+import json
+import time
+import threading
+
+from . import trace
+
+ENABLED = os.environ.get("PYMPF_STATS", "") not in ("", "0")
+
+class Statistics:
+    """Collected counters, bit sizes and latencies"""
+    def __init__(self):
+        self.lock     = threading.Lock()
+        self.counters = {}
+        self.bits     = {}
+        self.latency  = {}
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.bits     = {}
+            self.latency  = {}
+
+    def snapshot(self):
+        """Return a copy of all statistics as a dict"""
+        with self.lock:
+            return self._snapshot()
+
+    def _snapshot(self):
+        return {
+            "counters" : dict(self.counters),
+            "bits"     : {name : {"max"       : info["max"],
+                                  "histogram" : dict(info["histogram"])}
+                          for name, info in self.bits.items()},
+            "latency"  : {key : {"count"     : info["count"],
+                                 "total_ns"  : info["total_ns"],
+                                 "max_ns"    : info["max_ns"],
+                                 "histogram" : dict(info["histogram"])}
+                          for key, info in self.latency.items()},
+        }
+
+    def to_json(self, **kwargs):
+        """Return a snapshot as a JSON string"""
+        return json.dumps(self.snapshot(), sort_keys=True, **kwargs)
+
+STATISTICS = Statistics()
+
+def count(name, amount=1):
+    """Increment a counter"""
+    with STATISTICS.lock:
+        STATISTICS.counters[name] = STATISTICS.counters.get(name, 0) + amount
+
+def record_bits(name, value):
+    """Record the bit size of the integer *value*"""
+    bits = abs(value).bit_length()
+    with STATISTICS.lock:
+        _record_bits(name, bits)
+
+def _record_bits(name, bits):
+    info = STATISTICS.bits.get(name, None)
+    if info is None:
+        info = {"max" : 0, "histogram" : {}}
+        STATISTICS.bits[name] = info
+    if bits > info["max"]:
+        info["max"] = bits
+    bucket = 1 << (bits.bit_length())
+    info["histogram"][bucket] = info["histogram"].get(bucket, 0) + 1
+
+def record_latency(key, elapsed_ns):
+    with STATISTICS.lock:
+        _record_latency(key, elapsed_ns)
+
+def _record_latency(key, elapsed_ns):
+    info = STATISTICS.latency.get(key, None)
+    if info is None:
+        info = {"count"     : 0,
+                "total_ns"  : 0,
+                "max_ns"    : 0,
+                "histogram" : {}}
+        STATISTICS.latency[key] = info
+    info["count"]    += 1
+    info["total_ns"] += elapsed_ns
+    if elapsed_ns > info["max_ns"]:
+        info["max_ns"] = elapsed_ns
+    bucket = 1 << (elapsed_ns.bit_length())
+    info["histogram"][bucket] = info["histogram"].get(bucket, 0) + 1
+
+def _latency_key(name, args):
+    # The format is taken from the precision arguments (for
+    # conversions to float) or the first float argument. The rounding
+    # mode is the first string argument.
+    fmt = "-"
+    rm  = "-"
+    if len(args) >= 2 and isinstance(args[0], int) and \
+       isinstance(args[1], int):
+        fmt = "%u,%u" % (args[0], args[1])
+    for arg in args:
+        if isinstance(arg, str):
+            if rm == "-":
+                rm = arg
+        elif fmt == "-" and hasattr(arg, "w") and hasattr(arg, "p"):
+            fmt = "%u,%u" % (arg.w, arg.p)
+    return "%s %s %s" % (name, fmt, rm)
+
+# The fp_* functions do not use a decorator, as a wrapper would cost
+# an extra call even when nothing is collected. Instead each of them
+# starts with
+#
+#     if instrumentation.ACTIVE and instrumentation.outermost(fp_add):
+#         return instrumentation.timed_call(fp_add, rm, left, right)
+#
+# timed_call then calls the function again, and outermost tells the
+# inner call to get on with the actual work.
+
+ACTIVE = ENABLED or trace.ENABLED
+
+_CALLING = threading.local()
+
+def _update():
+    global ACTIVE
+    ACTIVE = ENABLED or trace.ENABLED
+
+trace.LISTENERS.append(_update)
+
+def outermost(fn):
+    """Test if this call of *fn* is not the one made by :func:`timed_call`"""
+    if getattr(_CALLING, "fn", None) is fn:
+        _CALLING.fn = None
+        return False
+    return True
+
+def _measure(fn, args):
+    if not ENABLED:
+        _CALLING.fn = fn
+        return fn(*args)
+    start = time.perf_counter()
+    try:
+        _CALLING.fn = fn
+        return fn(*args)
+    finally:
+        elapsed_ns = int((time.perf_counter() - start) * 1e9)
+        record_latency(_latency_key(fn.__name__, args), elapsed_ns)
+
+def timed_call(fn, *args):
+    """Call *fn*, recording its latency
+
+    If tracing is enabled (see :mod:`mpf.trace`) the call is also
+    traced as an operation.
+    """
+    if trace.ENABLED:
+        with trace.operation(fn.__name__, args) as traced:
+            traced.result = _measure(fn, args)
+            return traced.result
+    return _measure(fn, args)
+
+def enable():
+    global ENABLED
+    ENABLED = True
+    _update()
+
+def disable():
+    global ENABLED
+    ENABLED = False
+    _update()
+
+def reset():
+    STATISTICS.reset()
+
+def snapshot():
+    """Return a copy of all statistics as a dict"""
+    return STATISTICS.snapshot()
+
+def to_json(**kwargs):
+    """Return a snapshot as a JSON string"""
+    return STATISTICS.to_json(**kwargs)
+
+class collecting:
+    """Context manager enabling instrumentation
+
+    Statistics are reset on entry (unless *reset* is False); the
+    previous enabled state is restored on exit.
+    """
+    # pylint: disable=invalid-name
+    def __init__(self, reset=True):
+        self.reset   = reset
+        self.enabled = None
+
+    def __enter__(self):
+        self.enabled = ENABLED
+        if self.reset:
+            STATISTICS.reset()
+        enable()
+        return STATISTICS
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not self.enabled:
+            disable()
+        return False
@@ -0,0 +1,741 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                                PYMPF                                     ##
+##                                                                          ##
+##              Copyright (C) 2020,      Florian Schanda                    ##
+##                                                                          ##
+##  This file is part of PyMPF.                                             ##
+##                                                                          ##
+##  PyMPF is free software: you can redistribute it and/or modify           ##
+##  it under the terms of the GNU General Public License as published by    ##
+##  the Free Software Foundation, either version 3 of the License, or       ##
+##  (at your option) any later version.                                     ##
+##                                                                          ##
+##  PyMPF is distributed in the hope that it will be useful,                ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with PyMPF. If not, see <http://www.gnu.org/licenses/>.           ##
+##                                                                          ##
+##############################################################################
+
+"""
+This module implements an abstract domain for floats: a range of
+finite floats plus flags for -oo, +oo and NaN. It can be used to bound
+the result of a chain of operations without evaluating them on
+concrete values.
+
+The finite range is ordered such that -0 < +0, so the range [-0 .. +0]
+contains both zeros but [+0 .. +0] only contains +0.
+
+All transfer functions (see :func:`transfer`) are sound: the abstract
+result contains every concrete result, for each concrete choice of
+the operands. They are not always precise, for example for
+:func:`mpf.floats.fp_rem` we only bound the magnitude of the result.
+
+Most operations are monotonic in each operand once we split the
+operands into pieces of a fixed sign (and the special values). For
+these we evaluate the operation on the corners of each piece and take
+the hull of the results; rounding is monotonic too, so every result
+in between is covered.
+
+The transfer functions of the unary operations can be checked
+against concrete evaluation on all intervals of a small format (see
+:func:`check`):
+
+    $ python3 -m mpf.interval_f --eb 3 --sb 3
+"""
+
+import sys
+import argparse
+import itertools
+
+from .rationals import Rational
+from .interval_q import Interval
+from .floats import *
+
+def _order(op):
+    # Total order on non-NaN floats, such that -oo < ... < -0 < +0
+    # < ... < +oo
+    assert not op.isNaN()
+    S, E, T = op.unpack()
+    magnitude = (E << op.t) | T
+    if S:
+        return -magnitude - 1
+    else:
+        return magnitude
+
+def _is_negative_nonzero(op):
+    return op.isNegative() and not op.isZero()
+
+def _is_positive_nonzero(op):
+    return op.isPositive() and not op.isZero()
+
+class Float_Interval:
+    """Abstract set of floats of precision *eb*, *sb*
+
+    By default the set is empty.
+    """
+    def __init__(self, eb, sb):
+        self.eb   = eb
+        self.sb   = sb
+        self.low  = None
+        self.high = None
+        self.ninf = False
+        self.pinf = False
+        self.nan  = False
+
+    def __str__(self):
+        parts = []
+        if self.ninf:
+            parts.append("-oo")
+        if self.low is not None:
+            parts.append("[%s .. %s]" % (self.low.to_python_string(),
+                                         self.high.to_python_string()))
+        if self.pinf:
+            parts.append("+oo")
+        if self.nan:
+            parts.append("NaN")
+        return "Float_Interval(%s)" % (" | ".join(parts)
+                                       if parts
+                                       else "empty")
+
+    def copy(self):
+        rv = Float_Interval(self.eb, self.sb)
+        rv.join(self)
+        return rv
+
+    ######################################################################
+    # Setters
+
+    def set_top(self):
+        """Set to all floats (including NaN)"""
+        self.set_range(self.largest(1, infinite=True),
+                       self.largest(0, infinite=True))
+        self.nan = True
+
+    def set_range(self, low, high):
+        """Add all floats between low and high (inclusive)
+
+        Both bounds must be non-NaN, and low must not be larger than
+        high (in the order where -0 < +0).
+        """
+        assert not low.isNaN() and not high.isNaN()
+        assert _order(low) <= _order(high)
+
+        if low.isInfinite() and low.isNegative():
+            self.ninf = True
+        if high.isInfinite() and high.isPositive():
+            self.pinf = True
+
+        if low.isInfinite() and high.isInfinite() and \
+           low.isNegative() == high.isNegative():
+            # Only one of the infinities
+            return
+
+        if low.isInfinite():
+            low = self.largest(1)
+        if high.isInfinite():
+            high = self.largest(0)
+        self.join_finite(low, high)
+
+    def include(self, op):
+        """Add a single float"""
+        assert op.w == self.eb and op.p == self.sb
+        if op.isNaN():
+            self.nan = True
+        else:
+            self.set_range(op, op)
+
+    def join_finite(self, low, high):
+        assert low.isFinite() and high.isFinite()
+        if self.low is None or _order(low) < _order(self.low):
+            self.low = low.new_mpf()
+        if self.high is None or _order(high) > _order(self.high):
+            self.high = high.new_mpf()
+
+    def join(self, other):
+        """Add all floats from another Float_Interval"""
+        assert self.eb == other.eb and self.sb == other.sb
+        self.ninf |= other.ninf
+        self.pinf |= other.pinf
+        self.nan  |= other.nan
+        if other.low is not None:
+            self.join_finite(other.low, other.high)
+
+    ######################################################################
+    # Queries
+
+    def largest(self, sign, infinite=False):
+        """Largest float (by magnitude) with the given sign"""
+        rv = MPF(self.eb, self.sb)
+        if infinite:
+            rv.set_infinite(sign)
+        else:
+            rv.pack(sign, 2 ** rv.w - 2, 2 ** rv.t - 1)
+        return rv
+
+    def is_empty(self):
+        return not (self.ninf or self.pinf or self.nan or
+                    self.low is not None)
+
+    def is_singleton(self):
+        """Test if the set contains precisely one float
+
+        All NaNs are considered to be the same float.
+        """
+        count = int(self.ninf) + int(self.pinf) + int(self.nan)
+        if self.low is not None:
+            if self.low.bv == self.high.bv:
+                count += 1
+            else:
+                count += 2
+        return count == 1
+
+    def contains(self, op):
+        if op.isNaN():
+            return self.nan
+        elif op.isInfinite():
+            return self.ninf if op.isNegative() else self.pinf
+        elif self.low is None:
+            return False
+        else:
+            return _order(self.low) <= _order(op) <= _order(self.high)
+
+    def may_be_zero(self):
+        return (self.low is not None and
+                _order(self.low) <= 0 and _order(self.high) >= -1)
+
+    def may_be_infinite(self):
+        return self.ninf or self.pinf
+
+    def may_be_nan(self):
+        return self.nan
+
+    def extremes(self):
+        """Smallest and largest non-NaN float, or None if there are none"""
+        if self.ninf:
+            low = self.largest(1, infinite=True)
+        elif self.low is not None:
+            low = self.low
+        elif self.pinf:
+            low = self.largest(0, infinite=True)
+        else:
+            return None
+
+        if self.pinf:
+            high = self.largest(0, infinite=True)
+        elif self.low is not None:
+            high = self.high
+        else:
+            high = self.largest(1, infinite=True)
+
+        return (low, high)
+
+    def pieces(self):
+        """Split into a list of points and ranges of a fixed sign
+
+        Each element is a tuple of one float (a point) or two floats
+        (a range of non-zero finite floats of the same sign).
+        """
+        rv = []
+        if self.nan:
+            nan = MPF(self.eb, self.sb)
+            nan.set_nan()
+            rv.append((nan,))
+        if self.ninf:
+            rv.append((self.largest(1, infinite=True),))
+
+        if self.low is not None:
+            low  = self.low
+            high = self.high
+            smallest = MPF(self.eb, self.sb, 1)
+
+            if _is_negative_nonzero(low):
+                if _is_negative_nonzero(high):
+                    rv.append((low, high))
+                else:
+                    rv.append((low, -smallest))
+            for sign in (1, 0):
+                zero = MPF(self.eb, self.sb)
+                zero.set_zero(sign)
+                if _order(low) <= _order(zero) <= _order(high):
+                    rv.append((zero,))
+            if _is_positive_nonzero(high):
+                if _is_positive_nonzero(low):
+                    rv.append((low, high))
+                else:
+                    rv.append((smallest, high))
+
+        if self.pinf:
+            rv.append((self.largest(0, infinite=True),))
+
+        return rv
+
+    def to_rational_interval(self):
+        """Interval of rationals covering the finite part
+
+        Returns None if there is no finite part.
+        """
+        if self.low is None:
+            return None
+        rv = Interval()
+        rv.set_low(self.low.to_rational(), True)
+        rv.set_high(self.high.to_rational(), True)
+        return rv
+
+def float_interval(op):
+    """Float_Interval containing precisely *op*"""
+    rv = Float_Interval(op.w, op.p)
+    rv.include(op)
+    return rv
+
+def hull(eb, sb, values):
+    """Float_Interval containing all floats between the given floats
+
+    NaN values just add NaN; all other values contribute to one
+    contiguous range.
+    """
+    rv = Float_Interval(eb, sb)
+    ordered = []
+    for value in values:
+        if value.isNaN():
+            rv.nan = True
+        else:
+            ordered.append(value)
+    if ordered:
+        rv.set_range(min(ordered, key=_order),
+                     max(ordered, key=_order))
+    return rv
+
+##############################################################################
+# Transfer functions
+##############################################################################
+
+def _monotonic(eb, sb, fn, *args):
+    # Precise for points, and sound for functions that are monotonic
+    # in each argument for each piece.
+    #
+    # If fn raises Unspecified we assume the result could be any of
+    # the arguments (this is what fp.min and fp.max do).
+    rv = Float_Interval(eb, sb)
+    for combination in itertools.product(*[arg.pieces() for arg in args]):
+        results = []
+        for corner in itertools.product(*combination):
+            try:
+                results.append(fn(*corner))
+            except Unspecified:
+                results += corner
+        rv.join(hull(eb, sb, results))
+    return rv
+
+def _float_op(fn, with_rm):
+    def transfer_fn(rm, *args):
+        assert len(args) >= 1
+        assert all(arg.eb == args[0].eb and arg.sb == args[0].sb
+                   for arg in args)
+        if with_rm:
+            assert rm in MPF.ROUNDING_MODES
+            concrete = lambda *ops: fn(rm, *ops)
+        else:
+            concrete = fn
+        return _monotonic(args[0].eb, args[0].sb, concrete, *args)
+    return transfer_fn
+
+def transfer_rem(rm, left, right):
+    """Transfer function for fp.rem
+
+    The result r = x - y * n satisfies abs(r) <= abs(x) and
+    abs(r) <= abs(y) / 2; we only use this to bound the result.
+    """
+    assert rm is None
+    rv = Float_Interval(left.eb, left.sb)
+
+    if left.nan or right.nan or left.ninf or left.pinf or \
+       right.may_be_zero():
+        rv.nan = True
+
+    if left.low is None:
+        return rv
+
+    if right.ninf or right.pinf:
+        # x rem oo is x
+        rv.join_finite(left.low, left.high)
+
+    nonzero = [piece for piece in right.pieces()
+               if len(piece) == 2]
+    if nonzero:
+        bound_x = max(abs(left.low), abs(left.high), key=_order)
+        bound_y = max((abs(op) for piece in nonzero for op in piece),
+                      key=_order)
+        bound = min(bound_x, bound_y, key=_order)
+        rv.join_finite(-bound, bound)
+
+    return rv
+
+def _from_rational_interval(eb, sb, rm, interval):
+    # Rounding is monotonic, so we just round the bounds
+    assert rm in MPF.ROUNDING_MODES
+    bounds = []
+    for bound, sign in ((interval.low, 1), (interval.high, 0)):
+        tmp = MPF(eb, sb)
+        if bound.is_infinite():
+            if rm in MPF.ROUNDING_MODES_NEAREST or \
+               (rm == RM_RTN and sign) or (rm == RM_RTP and not sign):
+                tmp.set_infinite(sign)
+            else:
+                tmp.pack(sign, 2 ** tmp.w - 2, 2 ** tmp.t - 1)
+        else:
+            tmp.from_rational(rm, bound.value)
+        bounds.append(tmp)
+    return hull(eb, sb, bounds)
+
+def transfer_from_rational(rm, eb, sb, interval):
+    """Transfer function for fp.from.real, fp.from.int, etc.
+
+    The argument is an :class:`mpf.interval_q.Interval`.
+    """
+    if interval.is_empty():
+        return Float_Interval(eb, sb)
+    return _from_rational_interval(eb, sb, rm, interval)
+
+def transfer_from_binary(rm, eb, sb, _):
+    """Transfer function for fp.from.binary
+
+    We do not track bit-patterns, so this can be anything.
+    """
+    assert rm is None
+    rv = Float_Interval(eb, sb)
+    rv.set_top()
+    return rv
+
+def transfer_cast(rm, eb, sb, op):
+    """Transfer function for fp.cast"""
+    assert rm in MPF.ROUNDING_MODES
+    return _monotonic(eb, sb,
+                      lambda x: fp_from_float(eb, sb, rm, x),
+                      op)
+
+def _integer_interval(rm, op, minimum=None, maximum=None):
+    # Rounding to an integer is monotonic as well. Infinities and NaN
+    # (or anything out of range) are unspecified, and so could be any
+    # value.
+    rv = Interval()
+    unspecified = op.nan or op.ninf or op.pinf
+    if op.low is None and not unspecified:
+        rv.set_low(Rational(1), False)
+        rv.set_high(Rational(0), False)
+        return rv
+
+    if op.low is not None:
+        low  = q_round(rm, op.low.to_rational())
+        high = q_round(rm, op.high.to_rational())
+        if minimum is not None:
+            unspecified |= low < minimum or high > maximum
+
+    if unspecified:
+        if minimum is not None:
+            rv.set_low(minimum, True)
+            rv.set_high(maximum, True)
+    else:
+        rv.set_low(low, True)
+        rv.set_high(high, True)
+    return rv
+
+def transfer_to_real(rm, op):
+    """Transfer function for fp.to.real
+
+    Returns an :class:`mpf.interval_q.Interval`.
+    """
+    assert rm is None
+    if op.nan or op.ninf or op.pinf:
+        # Unspecified, so any real is possible
+        return Interval()
+    elif op.low is None:
+        rv = Interval()
+        rv.set_low(Rational(1), False)
+        rv.set_high(Rational(0), False)
+        return rv
+    else:
+        return op.to_rational_interval()
+
+def transfer_to_int(rm, op):
+    """Transfer function for fp.to.int
+
+    Returns an :class:`mpf.interval_q.Interval`. Like the evaluator
+    of fp.to.int this has no rounding mode, and rounds towards
+    negative.
+    """
+    assert rm is None
+    return _integer_interval(RM_RTN, op)
+
+def transfer_to_ubv(rm, op, width):
+    """Transfer function for fp.to.ubv
+
+    Returns an :class:`mpf.interval_q.Interval` of integers.
+    """
+    return _integer_interval(rm, op,
+                             Rational(0),
+                             Rational(2 ** width - 1))
+
+def transfer_to_sbv(rm, op, width):
+    """Transfer function for fp.to.sbv
+
+    Returns an :class:`mpf.interval_q.Interval` of integers.
+    """
+    return _integer_interval(rm, op,
+                             Rational(-(2 ** (width - 1))),
+                             Rational(2 ** (width - 1) - 1))
+
+##############################################################################
+# Predicates
+##############################################################################
+
+def _classify(fn):
+    # Along a piece of fixed sign the classes (subnormal, normal) are
+    # contiguous, so the corners give us all possible answers.
+    def transfer_fn(rm, op):
+        assert rm is None
+        return frozenset(fn(corner)
+                         for piece in op.pieces()
+                         for corner in piece)
+    return transfer_fn
+
+def transfer_is_integral(rm, op):
+    """Transfer function for fp.isIntegral"""
+    assert rm is None
+    rv = set()
+    for piece in op.pieces():
+        if len(piece) == 1:
+            rv.add(piece[0].isIntegral())
+            continue
+
+        # If an integral float and its neighbour (away from zero) are
+        # integral then so is everything beyond, since the gap between
+        # floats only grows.
+        low, high  = piece
+        candidates = [low, high, fp_nextUp(low), fp_nextDown(high)]
+        if q_round_rtp(low.to_rational()) <= high.to_rational():
+            rv.add(True)
+        for candidate in candidates:
+            if _order(low) <= _order(candidate) <= _order(high):
+                rv.add(candidate.isIntegral())
+    return frozenset(rv)
+
+def _compare(fn):
+    # Concrete comparisons are monotonic in each argument, so as for
+    # the float operations we check the corners of all pieces. In
+    # addition, if the pieces overlap they could be equal.
+    def transfer_fn(rm, left, right):
+        assert rm is None
+        rv = set()
+        for combination in itertools.product(left.pieces(), right.pieces()):
+            for corner in itertools.product(*combination):
+                rv.add(fn(*corner))
+            if combination[0][0].isNaN() or combination[1][0].isNaN():
+                continue
+            low  = max(combination[0][0], combination[1][0], key=_order)
+            high = min(combination[0][-1], combination[1][-1], key=_order)
+            if _order(low) <= _order(high):
+                rv.add(fn(low, low))
+        return frozenset(rv)
+    return transfer_fn
+
+def transfer(op_name, rm, *args):
+    """Evaluate the operation *op_name* (a key of
+    :data:`mpf.floats.FP_OPS`) on abstract arguments.
+
+    Float arguments are given as :class:`Float_Interval`. For
+    operations with a precision argument the first two arguments
+    are *eb* and *sb*; conversions from reals, integers and
+    bitvectors take an :class:`mpf.interval_q.Interval`; and
+    fp.to.ubv and fp.to.sbv take the width as an additional (last)
+    argument.
+
+    Returns a :class:`Float_Interval` for float results, an
+    :class:`mpf.interval_q.Interval` for real, integer and bitvector
+    results, and a frozenset of possible values for predicates.
+
+    *rm* should be None for operations that do not take a rounding
+    mode.
+    """
+    assert op_name in TRANSFER_FUNCTIONS
+    return TRANSFER_FUNCTIONS[op_name](rm, *args)
+
+TRANSFER_FUNCTIONS = {
+    "fp.abs"             : _float_op(abs, False),
+    "fp.neg"             : _float_op(lambda x: -x, False),
+    "fp.sqrt"            : _float_op(fp_sqrt, True),
+    "fp.roundToIntegral" : _float_op(fp_roundToIntegral, True),
+    "fp.add"             : _float_op(fp_add, True),
+    "fp.sub"             : _float_op(fp_sub, True),
+    "fp.mul"             : _float_op(fp_mul, True),
+    "fp.div"             : _float_op(fp_div, True),
+    "fp.rem"             : transfer_rem,
+    "fp.min"             : _float_op(fp_min, False),
+    "fp.max"             : _float_op(fp_max, False),
+    "fp.fma"             : _float_op(fp_fma, True),
+
+    "fp.isNormal"        : _classify(lambda x: x.isNormal()),
+    "fp.isSubnormal"     : _classify(lambda x: x.isSubnormal()),
+    "fp.isZero"          : _classify(lambda x: x.isZero()),
+    "fp.isInfinite"      : _classify(lambda x: x.isInfinite()),
+    "fp.isNaN"           : _classify(lambda x: x.isNaN()),
+    "fp.isPositive"      : _classify(lambda x: x.isPositive()),
+    "fp.isNegative"      : _classify(lambda x: x.isNegative()),
+    "fp.eq"              : _compare(lambda x, y: x == y),
+    "fp.lt"              : _compare(lambda x, y: x < y),
+    "fp.gt"              : _compare(lambda x, y: x > y),
+    "fp.leq"             : _compare(lambda x, y: x <= y),
+    "fp.geq"             : _compare(lambda x, y: x >= y),
+    "smtlib.eq"          : _compare(smtlib_eq),
+
+    "fp.from.real"       : transfer_from_rational,
+    "fp.from.int"        : transfer_from_rational,
+    "fp.from.ubv"        : transfer_from_rational,
+    "fp.from.sbv"        : transfer_from_rational,
+    "fp.from.binary"     : transfer_from_binary,
+
+    "fp.cast"            : transfer_cast,
+
+    "fp.to.real"         : transfer_to_real,
+    "fp.to.int"          : transfer_to_int,
+    "fp.to.ubv"          : transfer_to_ubv,
+    "fp.to.sbv"          : transfer_to_sbv,
+
+    "fp.isFinite"        : _classify(lambda x: x.isFinite()),
+    "fp.isIntegral"      : transfer_is_integral,
+    "fp.nextUp"          : _float_op(fp_nextUp, False),
+    "fp.nextDown"        : _float_op(fp_nextDown, False),
+}
+
+##############################################################################
+# Soundness check
+##############################################################################
+
+def _abstract_contains(op, result, value):
+    # Test if the abstract *result* of op contains the concrete
+    # *value*
+    if op.result_type == TYP_FLOAT:
+        return result.contains(value)
+    elif op.result_type == TYP_BOOL:
+        return value in result
+    elif op.result_type == TYP_BV:
+        if op.name == "fp.to_sbv":
+            return result.contains(Rational(value.to_signed_int()))
+        else:
+            return result.contains(Rational(value.to_unsigned_int()))
+    elif op.result_type == TYP_INT:
+        return result.contains(Rational(value))
+    else:
+        assert op.result_type == TYP_REAL
+        return result.contains(value)
+
+def _abstract_unbounded(op, result, width):
+    # Test if an abstract integer or real *result* contains everything
+    # an unspecified concrete result could be
+    if op.result_type == TYP_BV:
+        if op.name == "fp.to_sbv":
+            low, high = -(2 ** (width - 1)), 2 ** (width - 1) - 1
+        else:
+            low, high = 0, 2 ** width - 1
+        return (result.contains(Rational(low)) and
+                result.contains(Rational(high)))
+    else:
+        return result.low.is_infinite() and result.high.is_infinite()
+
+def check(op_name, eb=2, sb=3, width=3):
+    """Check the transfer function of a unary float operation
+
+    Evaluates the operation on every float of precision *eb*, *sb*
+    in every range of floats (with and without NaN), for all
+    rounding modes, and tests that the abstract result contains each
+    concrete result. Where the concrete result is unspecified the
+    abstract result must contain every possible value. *width* is
+    the width for fp.to.ubv and fp.to.sbv.
+
+    Returns a list of failures, tuples (rm, interval, float).
+    """
+    op = FP_OPS[op_name]
+    assert op.arity == 1 and op.args_type == TYP_FLOAT
+
+    values = sorted((MPF(eb, sb, bits) for bits in range(2 ** (eb + sb))
+                     if not MPF(eb, sb, bits).isNaN()),
+                    key=_order)
+    nan = MPF(eb, sb)
+    nan.set_nan()
+
+    if op.rm_arg:
+        rms = MPF.ROUNDING_MODES
+    else:
+        rms = (None,)
+    prefix = (eb, sb) if op.precision_arg else ()
+    suffix = (width,) if op.result_type == TYP_BV else ()
+
+    failures = []
+    for rm in rms:
+        for i, j in itertools.combinations_with_replacement(
+                range(len(values)), 2):
+            for with_nan in (False, True):
+                interval = Float_Interval(eb, sb)
+                interval.set_range(values[i], values[j])
+                interval.nan = with_nan
+                members = values[i:j + 1] + ([nan] if with_nan else [])
+                result = transfer(op_name, rm, *(prefix + (interval,) +
+                                                  suffix))
+                for x in members:
+                    try:
+                        value = op.evaluate(rm, *(prefix + (x,) + suffix))
+                    except Unspecified:
+                        ok = _abstract_unbounded(op, result, width)
+                    else:
+                        ok = _abstract_contains(op, result, value)
+                    if not ok:
+                        failures.append((rm, str(interval), repr(x)))
+
+        # Only NaN
+        interval = Float_Interval(eb, sb)
+        interval.nan = True
+        result = transfer(op_name, rm, *(prefix + (interval,) + suffix))
+        try:
+            value = op.evaluate(rm, *(prefix + (nan,) + suffix))
+        except Unspecified:
+            ok = _abstract_unbounded(op, result, width)
+        else:
+            ok = _abstract_contains(op, result, value)
+        if not ok:
+            failures.append((rm, str(interval), repr(nan)))
+
+    return failures
+
+def main():
+    unary = sorted(op_name for op_name, op in FP_OPS.items()
+                   if op.arity == 1 and op.args_type == TYP_FLOAT)
+    ap = argparse.ArgumentParser(
+        description="Check transfer functions against concrete evaluation")
+    ap.add_argument("--ops",
+                    nargs="+",
+                    choices=unary,
+                    default=unary)
+    ap.add_argument("--eb",
+                    type=int,
+                    default=2)
+    ap.add_argument("--sb",
+                    type=int,
+                    default=3)
+    options = ap.parse_args()
+
+    failed = False
+    for op_name in options.ops:
+        failures = check(op_name, options.eb, options.sb)
+        print("%s: %u failures" % (op_name, len(failures)))
+        for failure in failures[:10]:
+            print("  %s %s %s" % failure)
+        failed |= bool(failures)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
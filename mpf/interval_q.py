@@ -25,13 +25,15 @@
 ##############################################################################
 
 # Basic intervals for rationals (including infinity). This is good for
-# the basic intervals for int/float conversions, however in the future
-# we need more. For example float intervals should have special flags
-# for including zero, infinity, nan in addition to a specific range.
+# the basic intervals for int/float conversions. Float intervals (with
+# special flags for including infinity and nan in addition to a
+# specific range) are implemented in interval_f.
 #
 # Representation uses the "German" method, i.e. "]2 3]" is the
 # interval between 2 and 3, excluding 2 but including 3.
 
+from .rationals import Rational
+
 KIND_INFINITE  = "infinite"
 KIND_INCLUSIVE = "inclusive"
 KIND_EXCLUSIVE = "exclusive"
@@ -46,6 +48,12 @@ class Interval_Bound:
         self.kind  = kind
         self.value = q
 
+    def is_infinite(self):
+        return self.kind == KIND_INFINITE
+
+    def is_inclusive(self):
+        return self.kind == KIND_INCLUSIVE
+
 class Interval:
     def __init__(self):
         self.low  = Interval_Bound(KIND_INFINITE)
@@ -87,3 +95,134 @@ class Interval:
         else:
             self.high.kind = KIND_EXCLUSIVE
         self.high.value = q
+
+    def copy(self):
+        rv = Interval()
+        rv.low  = Interval_Bound(self.low.kind, self.low.value)
+        rv.high = Interval_Bound(self.high.kind, self.high.value)
+        return rv
+
+    def is_empty(self):
+        """Test if no rational is contained in the interval"""
+        if self.low.is_infinite() or self.high.is_infinite():
+            return False
+        elif self.low.value < self.high.value:
+            return False
+        elif self.low.value == self.high.value:
+            return not (self.low.is_inclusive() and
+                        self.high.is_inclusive())
+        else:
+            return True
+
+    def contains(self, q):
+        """Test if the rational *q* is contained in the interval"""
+        if not self.low.is_infinite():
+            if q < self.low.value:
+                return False
+            elif q == self.low.value and not self.low.is_inclusive():
+                return False
+        if not self.high.is_infinite():
+            if q > self.high.value:
+                return False
+            elif q == self.high.value and not self.high.is_inclusive():
+                return False
+        return True
+
+    ######################################################################
+    # Interval arithmetic
+    #
+    # All of these return a new interval and leave self unchanged.
+
+    def intersect(self, other):
+        """Intersection of two intervals"""
+        rv = self.copy()
+
+        if other.low.is_infinite():
+            pass
+        elif (rv.low.is_infinite() or
+              other.low.value > rv.low.value or
+              (other.low.value == rv.low.value and
+               not other.low.is_inclusive())):
+            rv.set_low(other.low.value, other.low.is_inclusive())
+
+        if other.high.is_infinite():
+            pass
+        elif (rv.high.is_infinite() or
+              other.high.value < rv.high.value or
+              (other.high.value == rv.high.value and
+               not other.high.is_inclusive())):
+            rv.set_high(other.high.value, other.high.is_inclusive())
+
+        return rv
+
+    def translate(self, q):
+        """Compute { v + q | v in self }"""
+        rv = self.copy()
+        if not rv.low.is_infinite():
+            rv.low.value = rv.low.value + q
+        if not rv.high.is_infinite():
+            rv.high.value = rv.high.value + q
+        return rv
+
+    def negate(self):
+        """Compute { -v | v in self }"""
+        rv = Interval()
+        if not self.high.is_infinite():
+            rv.set_low(-self.high.value, self.high.is_inclusive())
+        if not self.low.is_infinite():
+            rv.set_high(-self.low.value, self.low.is_inclusive())
+        return rv
+
+    def scale(self, q):
+        """Compute { v * q | v in self } for non-zero *q*"""
+        assert not q.isZero()
+        if q.isNegative():
+            return self.negate().scale(-q)
+        rv = self.copy()
+        if not rv.low.is_infinite():
+            rv.low.value = rv.low.value * q
+        if not rv.high.is_infinite():
+            rv.high.value = rv.high.value * q
+        return rv
+
+    def reciprocal(self):
+        """Compute { 1 / v | v in self, v != 0 }
+
+        The interval must not contain values of both signs, but it may
+        have 0 as one of its bounds.
+        """
+        if self.is_empty() or \
+           (not self.low.is_infinite() and self.low.value.isZero() and
+            not self.high.is_infinite() and self.high.value.isZero()):
+            # Nothing (or just 0) so the result is empty
+            rv = Interval()
+            rv.set_low(Rational(1), False)
+            rv.set_high(Rational(0), False)
+            return rv
+        elif not self.high.is_infinite() and \
+           (self.high.value.isNegative() or self.high.value.isZero()):
+            return self.negate().reciprocal().negate()
+        assert not self.low.is_infinite()
+        assert not self.low.value.isNegative()
+
+        rv = Interval()
+        if self.high.is_infinite():
+            rv.set_low(Rational(0), False)
+        else:
+            assert not self.high.value.isZero()
+            rv.set_low(Rational(1) / self.high.value,
+                       self.high.is_inclusive())
+        if not self.low.value.isZero():
+            rv.set_high(Rational(1) / self.low.value,
+                        self.low.is_inclusive())
+        return rv
+
+    def square(self):
+        """Compute { v * v | v in self } for non-negative intervals"""
+        assert not self.low.is_infinite()
+        assert not self.low.value.isNegative()
+        rv = self.copy()
+        rv.low.value = rv.low.value * rv.low.value
+        if not rv.high.is_infinite():
+            rv.high.value = rv.high.value * rv.high.value
+        return rv
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                                PYMPF                                     ##
+##                                                                          ##
+##              Copyright (C) 2020,      Florian Schanda                    ##
+##                                                                          ##
+##  This file is part of PyMPF.                                             ##
+##                                                                          ##
+##  PyMPF is free software: you can redistribute it and/or modify           ##
+##  it under the terms of the GNU General Public License as published by    ##
+##  the Free Software Foundation, either version 3 of the License, or       ##
+##  (at your option) any later version.                                     ##
+##                                                                          ##
+##  PyMPF is distributed in the hope that it will be useful,                ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with PyMPF. If not, see <http://www.gnu.org/licenses/>.           ##
+##                                                                          ##
+##############################################################################
+
+"""
+This module computes preimages of the arithmetic operations, i.e. it
+answers questions such as "given a result *r*, a rounding mode *rm*
+and an operand *x*, which *y* satisfy fp_add(rm, x, y) == r?".
+
+All of these are built on :func:`mpf.floats.fp_interval`: we take the
+interval of rationals that round to the result, and then solve the
+(exact) operation for the missing operand using interval
+arithmetic. The answer is an :class:`mpf.interval_q.Interval` of
+rationals; :func:`float_bounds` turns that into the smallest and
+largest float of a given precision inside that interval.
+
+Some caveats:
+
+* Only finite, non-NaN operands are considered. Infinite operands
+  (e.g. +oo + y) are trivial to deal with by hand.
+
+* Rationals do not distinguish -0 and +0. If the interval contains 0
+  then only one of the two zeros may actually produce the result, so
+  you should evaluate the operation once more if you care about the
+  sign of zero.
+"""
+
+from .rationals import Rational
+from .interval_q import Interval
+from .floats import *
+
+def result_interval(rm, result):
+    """Interval of rationals that round to *result*
+
+    This is :func:`mpf.floats.fp_interval`, except that we return an
+    empty interval instead of None.
+    """
+    assert rm in MPF.ROUNDING_MODES
+    assert not result.isNaN()
+
+    interval = fp_interval(rm, result)
+    if interval is None:
+        interval = _empty()
+    return interval
+
+def sum_interval(rm, result):
+    """Interval of exact sums that fp_add or fp_sub round to *result*
+
+    This differs from :func:`result_interval` only for an exact sum
+    of zero (for non-zero operands): following Section 6.3 of IEEE-754
+    that is -0 for RTN and +0 otherwise.
+    """
+    interval = result_interval(rm, result)
+    if rm == RM_RTN and result.isZero():
+        if result.isNegative():
+            interval = Interval()
+            interval.set_low(Rational(0), True)
+            interval.set_high(Rational(0), True)
+        else:
+            interval.set_low(Rational(0), False)
+    return interval
+
+def preimage_add(rm, result, left):
+    """Values y for which fp_add(rm, left, y) == result
+
+    Since addition is commutative this is also the preimage for the
+    left operand.
+    """
+    assert left.isFinite()
+    return sum_interval(rm, result).translate(-left.to_rational())
+
+def preimage_sub_right(rm, result, left):
+    """Values y for which fp_sub(rm, left, y) == result"""
+    assert left.isFinite()
+    return sum_interval(rm, result).negate().translate(left.to_rational())
+
+def preimage_sub_left(rm, result, right):
+    """Values y for which fp_sub(rm, y, right) == result"""
+    assert right.isFinite()
+    return sum_interval(rm, result).translate(right.to_rational())
+
+def preimage_mul(rm, result, left):
+    """Values y for which fp_mul(rm, left, y) == result
+
+    Since multiplication is commutative this is also the preimage for
+    the left operand.
+    """
+    assert left.isFinite()
+    if left.isZero():
+        # Any finite y gives a zero, the sign is the only question
+        if result.isZero():
+            return Interval()
+        else:
+            return _empty()
+    return result_interval(rm, result).scale(Rational(1) /
+                                             left.to_rational())
+
+def preimage_div_left(rm, result, right):
+    """Values y for which fp_div(rm, y, right) == result"""
+    assert right.isFinite() and not right.isZero()
+    return result_interval(rm, result).scale(right.to_rational())
+
+def preimage_div_right(rm, result, left):
+    """Values y for which fp_div(rm, left, y) == result
+
+    The zero bound of a zero result corresponds to division by
+    infinity, and so is never attained by a finite y.
+    """
+    assert left.isFinite()
+    if left.isZero():
+        # Any finite non-zero y gives a zero
+        if result.isZero():
+            return Interval()
+        else:
+            return _empty()
+    interval = result_interval(rm, result)
+    if interval.is_empty():
+        return interval
+    return interval.reciprocal().scale(left.to_rational())
+
+def preimage_sqrt(rm, result):
+    """Values y for which fp_sqrt(rm, y) == result"""
+    if result.isZero():
+        # Only sqrt(0) is zero
+        rv = Interval()
+        rv.set_low(Rational(0), True)
+        rv.set_high(Rational(0), True)
+        return rv
+    elif result.isNegative():
+        return _empty()
+    interval = result_interval(rm, result)
+    if interval.is_empty():
+        return interval
+    non_negative = Interval()
+    non_negative.set_low(Rational(0), True)
+    return interval.intersect(non_negative).square()
+
+def float_bounds(eb, sb, interval):
+    """Smallest and largest finite float inside an interval
+
+    Returns a tuple (low, high) of MPF values of the given precision
+    such that every finite float x with low <= x <= high has a value
+    contained in *interval*. Returns None if no finite float is
+    contained in the interval.
+    """
+    if interval.is_empty():
+        return None
+
+    low = MPF(eb, sb)
+    if interval.low.is_infinite():
+        low.pack(1, 2 ** low.w - 2, 2 ** low.t - 1)
+    else:
+        low.from_rational(RM_RTP, interval.low.value)
+        if low.isInfinite():
+            return None
+        elif not interval.contains(low.to_rational()):
+            low = fp_nextUp(low)
+
+    high = MPF(eb, sb)
+    if interval.high.is_infinite():
+        high.pack(0, 2 ** high.w - 2, 2 ** high.t - 1)
+    else:
+        high.from_rational(RM_RTN, interval.high.value)
+        if high.isInfinite():
+            return None
+        elif not interval.contains(high.to_rational()):
+            high = fp_nextDown(high)
+
+    if (low.isInfinite() or high.isInfinite() or
+        not interval.contains(low.to_rational()) or
+        not interval.contains(high.to_rational()) or
+        low.to_rational() > high.to_rational()):
+        return None
+
+    return (low, high)
+
+def _empty():
+    rv = Interval()
+    rv.set_low(Rational(1), False)
+    rv.set_high(Rational(0), False)
+    return rv
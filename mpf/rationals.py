@@ -36,6 +36,8 @@ try:
 except ImportError:
     from fractions import gcd
 
+from . import instrumentation
+
 class Rational:
     """Rational number
 
@@ -48,12 +50,21 @@ class Rational:
         assert isinstance(b, int)
 
         assert b != 0
+        if instrumentation.ENABLED:
+            instrumentation.count("rational.allocations")
+            instrumentation.record_bits("rational.numerator", a)
+            instrumentation.record_bits("rational.denominator", b)
         self.a = (a if b > 0 else -a)
         self.b = abs(b)
-        denominator = gcd(self.a, self.b)
-        assert denominator > 0
-        self.a = self.a // denominator
-        self.b = self.b // denominator
+        # Integers are already normalised, so we only count (and
+        # compute) a gcd when there is a denominator
+        if self.b != 1:
+            if instrumentation.ENABLED:
+                instrumentation.count("rational.gcd")
+            denominator = gcd(self.a, self.b)
+            assert denominator > 0
+            self.a = self.a // denominator
+            self.b = self.b // denominator
 
         assert isinstance(self.a, int)
         assert isinstance(self.b, int)
@@ -117,6 +128,10 @@ class Rational:
         """Equality"""
         return self.a*other.b == other.a*self.b
 
+    def __hash__(self):
+        # Consistent with equality since we're always normalised
+        return hash((self.a, self.b))
+
     def __ne__(self, other):
         """Inequality"""
         return self.a*other.b != other.a*self.b
@@ -209,7 +224,7 @@ def q_pow2(number):
 
     *n* can be negative
     """
-    assert isinstance(number, int) and abs(number) <= 2 ** 18
+    assert isinstance(number, int)
     if number >= 0:
         return Rational(2 ** number)
     else:
@@ -225,13 +240,13 @@ def q_round_to_nearest(n, tiebreak):
 
     """
     assert isinstance(n, Rational)
-    lower = (n.a - (n.a % n.b)) //  n.b
+    # n = lower + r / b, with 0 <= r < b
+    lower, r = divmod(n.a, n.b)
     upper = lower + 1
-    assert Rational(lower) <= n <= Rational(upper)
 
-    if n - Rational(lower) < Rational(upper) - n:
+    if 2 * r < n.b:
         return Rational(lower)
-    elif n - Rational(lower) > Rational(upper) - n:
+    elif 2 * r > n.b:
         return Rational(upper)
     else:
         return Rational(tiebreak(lower, upper))
@@ -257,11 +272,11 @@ def q_round_rna(n):
 
 def q_round_rtz(n):
     """Round to nearest integer, towards zero"""
-    i = Rational(abs(n.a) // n.b)
+    i = abs(n.a) // n.b
     if n.isNegative():
-        return -i
+        return Rational(-i)
     else:
-        return i
+        return Rational(i)
 
 def q_round_rtp(n):
     """Round to nearest integer, towards positive"""
@@ -306,11 +321,8 @@ def q_from_decimal_fragments(sign, integer_part, fraction_part, exp_part):
     if fraction_part:
         if fraction_part.startswith("."):
             fraction_part = fraction_part[1:]
-        f = Rational(0)
-        for digit in reversed(fraction_part):
-            f += Rational(int(digit))
-            f *= Rational(1, 10)
-        q += f
+        if fraction_part:
+            q += Rational(int(fraction_part, 10), 10 ** len(fraction_part))
 
     if exp_part:
         if exp_part.startswith("+"):
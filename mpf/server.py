@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                                PYMPF                                     ##
+##                                                                          ##
+##              Copyright (C) 2020,      Florian Schanda                    ##
+##                                                                          ##
+##  This file is part of PyMPF.                                             ##
+##                                                                          ##
+##  PyMPF is free software: you can redistribute it and/or modify           ##
+##  it under the terms of the GNU General Public License as published by    ##
+##  the Free Software Foundation, either version 3 of the License, or       ##
+##  (at your option) any later version.                                     ##
+##                                                                          ##
+##  PyMPF is distributed in the hope that it will be useful,                ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with PyMPF. If not, see <http://www.gnu.org/licenses/>.           ##
+##                                                                          ##
+##############################################################################
+
+
+"""
+This module is a long-running oracle server, for tools that need the
+answer to single queries with low latency and cannot afford to start
+Python for each one. It listens on a Unix domain socket (or a TCP
+port on the loopback interface):
+
+    $ python3 -m mpf.server --socket /tmp/mpf.sock --workers 4
+
+The protocol is the JSON lines format of :mod:`mpf.batch`: each
+request is one line with a record, and the response is the record
+with its "result" (or "error") added. A connection may send any
+number of requests without waiting; responses come back in the same
+order. There are also two commands:
+
+* {"command": "ping"} answers {"pong": true}
+* {"command": "stats"} answers with the server metrics: the number
+  of requests, errors, the number of requests currently queued or
+  being evaluated, and a latency histogram (in nanoseconds, bucketed
+  by powers of two)
+
+Requests are evaluated by a pool of worker processes (or in a thread
+of the server if there are no workers), which stay alive and so keep
+their caches warm (e.g. the constants of :mod:`mpf.elementary`). If
+a worker process dies (e.g. killed when out of memory) the requests
+in flight fail with an internal error, and a new pool is started for
+the requests that follow. The front end is asyncio, so a slow request
+does not hold up other connections.
+
+:class:`Client` is a small blocking client:
+
+>>> with Client(socket_path="/tmp/mpf.sock") as client:
+...     client.query({"op": "fp.add", "rm": "RNE", "eb": 8, "sb": 24,
+...                   "args": ["#x3f800000", "0x1p-3"]})["result"]
+'#x3F900000'
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import asyncio
+import argparse
+import functools
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+
+from .batch import LITERALS, process_json, allow_long_integers
+
+# Requests of one connection that may be in flight before we stop
+# reading from it
+MAX_PENDING = 256
+
+# The longest request line we accept
+MAX_LINE = 2 ** 20
+
+# Evaluated by each worker on start-up, so that the first real
+# request does not pay for starting the process and importing mpf
+WARM_UP = json.dumps({"op"   : "fp.add",
+                      "rm"   : "RNE",
+                      "eb"   : 8,
+                      "sb"   : 24,
+                      "args" : ["0x1p+0", "0x1p-3"]})
+
+class Metrics:
+    """Request counters and latencies of a server"""
+    def __init__(self):
+        self.started    = time.time()
+        self.requests   = 0
+        self.errors     = 0
+        self.queued     = 0
+        self.max_queued = 0
+        self.total_ns   = 0
+        self.max_ns     = 0
+        self.histogram  = {}
+
+    def submitted(self):
+        self.requests += 1
+        self.queued   += 1
+        if self.queued > self.max_queued:
+            self.max_queued = self.queued
+
+    def completed(self, elapsed_ns, ok):
+        self.queued -= 1
+        if not ok:
+            self.errors += 1
+        self.total_ns += elapsed_ns
+        if elapsed_ns > self.max_ns:
+            self.max_ns = elapsed_ns
+        bucket = 1 << (elapsed_ns.bit_length())
+        self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+
+    def snapshot(self):
+        """Return the metrics as a dict"""
+        return {
+            "uptime_s"   : time.time() - self.started,
+            "requests"   : self.requests,
+            "errors"     : self.errors,
+            "queued"     : self.queued,
+            "max_queued" : self.max_queued,
+            "latency"    : {"total_ns"  : self.total_ns,
+                            "max_ns"    : self.max_ns,
+                            "histogram" : dict(self.histogram)},
+        }
+
+class Oracle_Server:
+    """Oracle server evaluating requests with *workers* processes
+
+    If *workers* is 0 requests are evaluated in a thread of the
+    server process. *literals* selects how float results are written,
+    see :func:`mpf.batch.format_result`.
+    """
+    def __init__(self, workers=1, literals="bits"):
+        assert workers >= 0
+        assert literals in LITERALS
+        self.processes   = workers
+        self.workers     = max(1, workers)
+        self.evaluate    = functools.partial(process_json,
+                                             literals=literals)
+        self.executor    = self._new_executor()
+        self.metrics     = Metrics()
+        self.loop        = None
+        self.connections = set()
+
+    def _new_executor(self):
+        if self.processes:
+            return concurrent.futures.ProcessPoolExecutor(
+                self.processes,
+                initializer=allow_long_integers)
+        else:
+            return concurrent.futures.ThreadPoolExecutor(1)
+
+    def _restart(self, broken):
+        # Replace the executor *broken* (e.g. after a worker process
+        # was killed), unless another request has already done so
+        if self.executor is not broken:
+            return
+        broken.shutdown(wait=False)
+        self.executor = self._new_executor()
+        for _ in range(self.workers):
+            self.executor.submit(self.evaluate, WARM_UP)
+
+    def close(self):
+        """Stop the workers, abandoning requests being evaluated
+
+        Worker processes are killed. With no workers we can only
+        wait for the request being evaluated (if any) to finish.
+        """
+        # Workers started after serve installed its signal handlers
+        # inherit them (and so ignore SIGTERM), hence SIGKILL. Once
+        # they are gone we can wait for the executor, which then only
+        # has to notice.
+        # pylint: disable=protected-access
+        for process in list((getattr(self.executor, "_processes", None)
+                             or {}).values()):
+            process.kill()
+        if sys.version_info >= (3, 9):
+            self.executor.shutdown(wait=bool(self.processes),
+                                   cancel_futures=True)
+        else:
+            self.executor.shutdown(wait=bool(self.processes))
+
+    def command(self, line):
+        """Answer a command, or return None for normal requests"""
+        # Only lines mentioning "command" are parsed here, so that
+        # requests are parsed once (by the worker).
+        if '"command"' not in line:
+            return None
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(record, dict) or "command" not in record:
+            return None
+        elif record["command"] == "ping":
+            return json.dumps({"pong" : True})
+        elif record["command"] == "stats":
+            return json.dumps(self.metrics.snapshot(), sort_keys=True)
+        else:
+            return json.dumps({"error" : "unknown command %s" %
+                               record["command"]})
+
+    async def request(self, line):
+        """Evaluate one request line, returning the response line"""
+        response = self.command(line)
+        if response is not None:
+            return response
+
+        self.metrics.submitted()
+        start = time.perf_counter()
+        try:
+            executor = self.executor
+            try:
+                future = self.loop.run_in_executor(executor,
+                                                   self.evaluate,
+                                                   line)
+            except BrokenProcessPool:
+                # Broken before we got to it, so we try the new one
+                self._restart(executor)
+                executor = self.executor
+                future   = self.loop.run_in_executor(executor,
+                                                     self.evaluate,
+                                                     line)
+            try:
+                response, ok = await future
+            except BrokenProcessPool:
+                # A worker process has died while this request was in
+                # flight. It fails, but later requests go to a new
+                # pool.
+                self._restart(executor)
+                raise
+        except Exception as err: # pylint: disable=broad-except
+            response = json.dumps({"input" : line.rstrip("\n"),
+                                   "error" : "internal error: %s: %s" %
+                                   (type(err).__name__, err)})
+            ok = False
+        self.metrics.completed(int((time.perf_counter() - start) * 1e9),
+                               ok)
+        return response
+
+    async def connection(self, reader, writer):
+        """Serve one connection
+
+        A request line longer than :data:`MAX_LINE` is answered with
+        an error, and the connection is closed since we cannot tell
+        where the next request starts.
+        """
+        # Responses are written in request order by a separate task,
+        # so that a client can send requests without waiting. If
+        # writing fails we stop reading as well.
+        pending = asyncio.Queue(MAX_PENDING)
+        broken  = []
+
+        async def respond():
+            while True:
+                task = await pending.get()
+                if task is None:
+                    break
+                response = await task
+                if broken:
+                    continue
+                try:
+                    writer.write(response.encode("utf-8") + b"\n")
+                    await writer.drain()
+                except ConnectionError:
+                    broken.append(True)
+
+        # The request we are trying to queue
+        incoming  = None
+        responder = asyncio.ensure_future(respond())
+        try:
+            while not broken:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    error = json.dumps({"error" : "request longer than"
+                                        " %u bytes" % MAX_LINE})
+                    incoming = asyncio.ensure_future(self._constant(error))
+                    await pending.put(incoming)
+                    incoming = None
+                    break
+                if not line:
+                    break
+                line = line.decode("utf-8", "replace")
+                if line.strip():
+                    incoming = asyncio.ensure_future(self.request(line))
+                    await pending.put(incoming)
+                    incoming = None
+            await pending.put(None)
+            await responder
+        except ConnectionError:
+            pass
+        finally:
+            # When cancelled (or on errors) we also cancel the
+            # responses still to be written.
+            responder.cancel()
+            tasks = [responder]
+            if incoming is not None:
+                incoming.cancel()
+                tasks.append(incoming)
+            while not pending.empty():
+                task = pending.get_nowait()
+                if task is not None:
+                    task.cancel()
+                    tasks.append(task)
+            await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+
+    @staticmethod
+    async def _constant(response):
+        return response
+
+    def _accept(self, reader, writer):
+        # Connections are tasks of our own, so that we can cancel the
+        # ones still open when shutting down
+        task = self.loop.create_task(self.connection(reader, writer))
+        self.connections.add(task)
+        task.add_done_callback(self.connections.discard)
+
+    def serve(self, socket_path=None, host="127.0.0.1", port=None):
+        """Serve until interrupted (SIGINT or SIGTERM)
+
+        Listens on the Unix socket *socket_path* if given (replacing
+        a stale socket file), and otherwise on *host* and *port*.
+        Open connections are closed on shutdown, and requests still
+        being evaluated are dropped once :func:`close` is called.
+        """
+        assert (socket_path is None) != (port is None)
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+        concurrent.futures.wait([self.executor.submit(self.evaluate, WARM_UP)
+                                 for _ in range(self.workers)])
+
+        if socket_path is not None:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            starting = asyncio.start_unix_server(self._accept,
+                                                 path=socket_path,
+                                                 limit=MAX_LINE)
+        else:
+            starting = asyncio.start_server(self._accept,
+                                            host=host,
+                                            port=port,
+                                            limit=MAX_LINE)
+        server = self.loop.run_until_complete(starting)
+
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self.loop.add_signal_handler(signum, self.loop.stop)
+        try:
+            self.loop.run_forever()
+        finally:
+            server.close()
+            # A connection accepted just before closing may only now
+            # get its task, so we repeat until none are left.
+            while self.connections:
+                connections = list(self.connections)
+                for task in connections:
+                    task.cancel()
+                self.loop.run_until_complete(
+                    asyncio.gather(*connections, return_exceptions=True))
+            self.loop.run_until_complete(server.wait_closed())
+            self.loop.close()
+            if socket_path is not None and os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+class Client:
+    """Blocking client for an :class:`Oracle_Server`
+
+    Connects to the Unix socket *socket_path*, or to *host* and
+    *port*.
+    """
+    def __init__(self, socket_path=None, host="127.0.0.1", port=None):
+        assert (socket_path is None) != (port is None)
+        if socket_path is not None:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(socket_path)
+        else:
+            self.sock = socket.create_connection((host, port))
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.fd = self.sock.makefile("rwb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        self.fd.close()
+        self.sock.close()
+
+    def send(self, record):
+        """Send a request without waiting for the response"""
+        self.fd.write(json.dumps(record).encode("utf-8") + b"\n")
+
+    def receive(self):
+        """Return the next response"""
+        self.fd.flush()
+        line = self.fd.readline()
+        if not line:
+            raise ConnectionError("server closed the connection")
+        return json.loads(line.decode("utf-8"))
+
+    def query(self, record):
+        """Send a request (a dict) and return the response"""
+        self.send(record)
+        return self.receive()
+
+    def stats(self):
+        """Return the server metrics"""
+        return self.query({"command" : "stats"})
+
+def main():
+    ap = argparse.ArgumentParser(
+        description="Serve floating-point queries over a local socket")
+    ap.add_argument("--socket",
+                    default=None,
+                    help="Unix socket to listen on")
+    ap.add_argument("--port",
+                    type=int,
+                    default=None,
+                    help="TCP port to listen on (on the loopback interface)")
+    ap.add_argument("--workers",
+                    type=int,
+                    default=os.cpu_count() or 1,
+                    help="Worker processes (0 to evaluate in the server)")
+    ap.add_argument("--literals",
+                    choices=LITERALS,
+                    default="bits",
+                    help="How to write float results (default bits)")
+    options = ap.parse_args()
+
+    if (options.socket is None) == (options.port is None):
+        ap.error("give exactly one of --socket and --port")
+    if options.workers < 0:
+        ap.error("--workers must not be negative")
+    allow_long_integers()
+
+    server = Oracle_Server(options.workers, options.literals)
+    try:
+        server.serve(socket_path=options.socket, port=options.port)
+    finally:
+        server.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,633 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                                PYMPF                                     ##
+##                                                                          ##
+##              Copyright (C) 2020,      Florian Schanda                    ##
+##                                                                          ##
+##  This file is part of PyMPF.                                             ##
+##                                                                          ##
+##  PyMPF is free software: you can redistribute it and/or modify           ##
+##  it under the terms of the GNU General Public License as published by    ##
+##  the Free Software Foundation, either version 3 of the License, or       ##
+##  (at your option) any later version.                                     ##
+##                                                                          ##
+##  PyMPF is distributed in the hope that it will be useful,                ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with PyMPF. If not, see <http://www.gnu.org/licenses/>.           ##
+##                                                                          ##
+##############################################################################
+
+"""
+This module evaluates ground SMT-LIB terms (QF_FP, plus the Core,
+QF_BV and the bits of Int/Real arithmetic needed to write literals)
+with the functions of :mod:`mpf.floats` and :mod:`mpf.bitvector`.
+
+Terms are parsed into a DAG: identical subterms (and let-bound
+names) become the same node, so each is evaluated only once. Free
+symbols are looked up in a *model*, a dict mapping names to values
+(:class:`.MPF`, :class:`.Rational`, :class:`.BitVector`, int, bool,
+or a rounding mode such as RM_RNE). Each node remembers its value,
+and evaluating again with a different model only recomputes the nodes
+that depend on a symbol whose value has changed:
+
+>>> ev = Evaluator()
+>>> t = ev.parse("(fp.add RNE (fp.mul RNE x y) (fp.sqrt RTZ x))")
+>>> ev.evaluate(t, {"x" : a, "y" : b})
+>>> ev.evaluate(t, {"x" : a, "y" : c})  # fp.sqrt is not recomputed
+
+Values returned by :func:`Evaluator.evaluate` are shared with the
+cache, and so must not be modified. An Evaluator must not be used by
+several threads at once; use one Evaluator per thread instead.
+
+Values of the form (define-fun x () Float32 ...) as printed by
+solvers for (get-model) can be read with :func:`parse_model`.
+"""
+
+import re
+
+from . import instrumentation
+from .floats import *
+from .rationals import Rational, q_from_decimal_fragments
+from .bitvector import *
+
+class Parse_Error(Exception):
+    pass
+
+##############################################################################
+# Terms
+##############################################################################
+
+# A node in the term DAG. For constants *value* is fixed; for symbols
+# *name* is looked up in the model; otherwise *fn* is applied to the
+# values of *args*.
+#
+# *changed* is the generation (i.e. call to evaluate) in which the
+# value last changed, and *computed* the last generation in which it
+# was known to be up to date.
+
+TERM_CONSTANT = "constant"
+TERM_SYMBOL   = "symbol"
+TERM_APPLY    = "apply"
+
+class Term:
+    # pylint: disable=too-few-public-methods
+    def __init__(self, uid, kind, name, args=(), fn=None, value=None):
+        self.uid      = uid
+        self.kind     = kind
+        self.name     = name
+        self.args     = args
+        self.fn       = fn
+        self.value    = value
+        self.changed  = 0
+        self.computed = 0
+        self.valid    = kind == TERM_CONSTANT
+
+    def __repr__(self):
+        if self.kind == TERM_APPLY:
+            return "(%s %s)" % (self.name,
+                                " ".join("#%u" % arg.uid
+                                         for arg in self.args))
+        else:
+            return self.name
+
+# Marker for the value of terms raising Unspecified (for example
+# fp.to_real of infinity). Terms that depend on such a term are also
+# unspecified.
+UNSPECIFIED = object()
+
+def value_key(value):
+    """Key such that two values are the same iff their keys are equal
+
+    Unlike ==, this distinguishes +0 and -0 for floats, and the sort
+    (or width) of values. Like SMT-LIB equality, all NaNs are the same.
+    """
+    if isinstance(value, MPF):
+        return ("fp",) + value.key(canonical_nan=True)
+    elif isinstance(value, Rational):
+        return ("real", value.a, value.b)
+    elif isinstance(value, BitVector):
+        return ("bv", value.width, value.bv)
+    else:
+        return (type(value).__name__, value)
+
+##############################################################################
+# Function table
+##############################################################################
+
+RM_NAMES = {
+    "RNE"                     : RM_RNE,
+    "roundNearestTiesToEven"  : RM_RNE,
+    "RNA"                     : RM_RNA,
+    "roundNearestTiesToAway"  : RM_RNA,
+    "RTP"                     : RM_RTP,
+    "roundTowardPositive"     : RM_RTP,
+    "RTN"                     : RM_RTN,
+    "roundTowardNegative"     : RM_RTN,
+    "RTZ"                     : RM_RTZ,
+    "roundTowardZero"         : RM_RTZ,
+}
+
+def _fp_op(op):
+    if op.rm_arg:
+        return lambda args: op.evaluate(args[0], *args[1:])
+    else:
+        return lambda args: op.evaluate(None, *args)
+
+# Operations of FP_OPS that are not indexed, by SMT-LIB name, with
+# the number of arguments (including the rounding mode)
+FP_FUNCTIONS = {op.name : (_fp_op(op), op.arity + int(op.rm_arg))
+                for name, op in FP_OPS.items()
+                if not op.precision_arg and
+                op.result_type != TYP_BV and
+                name != "smtlib.eq"}
+
+# The float comparisons are chainable: (fp.lt a b c) is
+# (and (fp.lt a b) (fp.lt b c))
+CHAINABLE = ("fp.eq", "fp.lt", "fp.leq", "fp.gt", "fp.geq")
+
+def _chainable(fn):
+    return lambda args: all(fn(args[i:i + 2]) for i in range(len(args) - 1))
+
+for _name in CHAINABLE:
+    FP_FUNCTIONS[_name] = (_chainable(FP_FUNCTIONS[_name][0]), None)
+
+def _rational(value):
+    if isinstance(value, int):
+        return Rational(value)
+    return value
+
+def _arith(fn, args):
+    if all(isinstance(arg, int) for arg in args):
+        rv = args[0]
+        for arg in args[1:]:
+            rv = fn(rv, arg)
+        return rv
+    rv = _rational(args[0])
+    for arg in args[1:]:
+        rv = fn(rv, _rational(arg))
+    return rv
+
+def _minus(args):
+    if len(args) == 1:
+        return -args[0]
+    return _arith(lambda a, b: a - b, args)
+
+def _implies(args):
+    rv = args[-1]
+    for arg in reversed(args[:-1]):
+        rv = (not arg) or rv
+    return rv
+
+def _xor(args):
+    rv = False
+    for arg in args:
+        rv = rv != arg
+    return rv
+
+def _equal(args):
+    keys = [value_key(arg) for arg in args]
+    return all(keys[i] == keys[i + 1] for i in range(len(keys) - 1))
+
+def _distinct(args):
+    keys = [value_key(arg) for arg in args]
+    return len(set(keys)) == len(keys)
+
+def _fp_literal(args):
+    sign, exponent, significand = args
+    assert sign.width == 1
+    return MPF(exponent.width,
+               significand.width + 1,
+               bv_concat(bv_concat(sign, exponent),
+                         significand).to_unsigned_int())
+
+# name : (fn, number of arguments or None for variadic functions)
+FUNCTIONS = {
+    "not"      : (lambda args: not args[0], 1),
+    "and"      : (all, None),
+    "or"       : (any, None),
+    "xor"      : (_xor, None),
+    "=>"       : (_implies, None),
+    "="        : (_equal, None),
+    "distinct" : (_distinct, None),
+    "ite"      : (lambda args: args[1] if args[0] else args[2], 3),
+
+    "+"        : (lambda args: _arith(lambda a, b: a + b, args), None),
+    "-"        : (_minus, None),
+    "*"        : (lambda args: _arith(lambda a, b: a * b, args), None),
+    "/"        : (lambda args: _arith(lambda a, b: a / b,
+                                      [_rational(arg) for arg in args]),
+                  None),
+    "to_real"  : (lambda args: _rational(args[0]), 1),
+
+    "fp"       : (_fp_literal, 3),
+
+    "concat"   : (lambda args: bv_concat(*args), 2),
+    "bvnot"    : (lambda args: bv_not(*args), 1),
+    "bvneg"    : (lambda args: bv_neg(*args), 1),
+}
+FUNCTIONS.update(FP_FUNCTIONS)
+
+def _bv_binary(fn):
+    return (lambda args: fn(*args), 2)
+
+for _name, _fn in (("bvand", bv_and), ("bvor", bv_or), ("bvxor", bv_xor),
+                   ("bvnand", bv_nand), ("bvnor", bv_nor),
+                   ("bvxnor", bv_xnor), ("bvcomp", bv_comp),
+                   ("bvadd", bv_add), ("bvsub", bv_sub), ("bvmul", bv_mul),
+                   ("bvudiv", bv_udiv), ("bvurem", bv_urem),
+                   ("bvsdiv", bv_sdiv), ("bvsrem", bv_srem),
+                   ("bvsmod", bv_smod), ("bvshl", bv_shl),
+                   ("bvlshr", bv_lshr), ("bvashr", bv_ashr),
+                   ("bvult", bv_ult), ("bvule", bv_ule), ("bvugt", bv_ugt),
+                   ("bvuge", bv_uge), ("bvslt", bv_slt), ("bvsle", bv_sle),
+                   ("bvsgt", bv_sgt), ("bvsge", bv_sge)):
+    FUNCTIONS[_name] = _bv_binary(_fn)
+
+def _to_fp(eb, sb):
+    def fn(args):
+        if len(args) == 1:
+            return evaluate("fp.from.binary", None, eb, sb, args[0])
+        rm, op = args
+        if isinstance(op, MPF):
+            return evaluate("fp.cast", rm, eb, sb, op)
+        elif isinstance(op, BitVector):
+            return evaluate("fp.from.sbv", rm, eb, sb, op)
+        elif isinstance(op, Rational):
+            return evaluate("fp.from.real", rm, eb, sb, op)
+        else:
+            return evaluate("fp.from.int", rm, eb, sb, op)
+    return fn
+
+# name : (fn(indices) returning fn, number of indices, number of
+#         arguments or None if it can be one or two)
+INDEXED_FUNCTIONS = {
+    "to_fp"          : (lambda i: _to_fp(*i), 2, None),
+    "to_fp_unsigned" : (lambda i: (lambda args: evaluate(
+        "fp.from.ubv", args[0], i[0], i[1], args[1])), 2, 2),
+    "fp.to_ubv"      : (lambda i: (lambda args: evaluate(
+        "fp.to.ubv", args[0], args[1], i[0])), 1, 2),
+    "fp.to_sbv"      : (lambda i: (lambda args: evaluate(
+        "fp.to.sbv", args[0], args[1], i[0])), 1, 2),
+    "extract"        : (lambda i: (lambda args: bv_extract(
+        i[0], i[1], args[0])), 2, 1),
+    "repeat"         : (lambda i: (lambda args: bv_repeat(
+        i[0], args[0])), 1, 1),
+    "zero_extend"    : (lambda i: (lambda args: bv_zero_extend(
+        i[0], args[0])), 1, 1),
+    "sign_extend"    : (lambda i: (lambda args: bv_sign_extend(
+        i[0], args[0])), 1, 1),
+    "rotate_left"    : (lambda i: (lambda args: bv_rotate_left(
+        i[0], args[0])), 1, 1),
+    "rotate_right"   : (lambda i: (lambda args: bv_rotate_right(
+        i[0], args[0])), 1, 1),
+}
+
+def _special(eb, sb, name):
+    rv = MPF(eb, sb)
+    if name == "+zero":
+        rv.set_zero(0)
+    elif name == "-zero":
+        rv.set_zero(1)
+    elif name == "+oo":
+        rv.set_infinite(0)
+    elif name == "-oo":
+        rv.set_infinite(1)
+    else:
+        assert name == "NaN"
+        rv.set_nan()
+    return rv
+
+##############################################################################
+# Parsing
+##############################################################################
+
+TOKEN = re.compile(r"\s+|;[^\n]*|(\()|(\))|(\|[^|]*\|)|"
+                   r"(\"(?:[^\"]|\"\")*\")|([^\s()|\";]+)")
+
+def tokenize(text):
+    """Split SMT-LIB text into tokens ("(", ")" and atoms)"""
+    pos = 0
+    while pos < len(text):
+        match = TOKEN.match(text, pos)
+        if match is None:
+            raise Parse_Error("unexpected %s at offset %u" %
+                              (text[pos], pos))
+        pos = match.end()
+        if match.lastindex is not None:
+            yield match.group(match.lastindex)
+
+def read_sexprs(text):
+    """Parse SMT-LIB text into nested lists of atoms (strings)"""
+    stack = [[]]
+    for token in tokenize(text):
+        if token == "(":
+            stack.append([])
+        elif token == ")":
+            if len(stack) == 1:
+                raise Parse_Error("unbalanced )")
+            sexpr = stack.pop()
+            stack[-1].append(sexpr)
+        else:
+            stack[-1].append(token)
+    if len(stack) != 1:
+        raise Parse_Error("unbalanced (")
+    return stack[0]
+
+def _index(atom):
+    if not isinstance(atom, str) or not atom.isdigit():
+        raise Parse_Error("expected numeral, got %s" % (atom,))
+    return int(atom)
+
+def _atom_value(atom):
+    """Value of a literal atom, or None for symbols"""
+    if atom in ("true", "false"):
+        return atom == "true"
+    elif atom in RM_NAMES:
+        return RM_NAMES[atom]
+    elif atom.isdigit():
+        return int(atom)
+    elif re.match(r"^[0-9]+\.[0-9]+$", atom):
+        return q_from_decimal_fragments(None, *atom.split(".", 1), None)
+    elif atom.startswith("#b") and len(atom) > 2:
+        return BitVector(len(atom) - 2, int(atom[2:], 2))
+    elif atom.startswith("#x") and len(atom) > 2:
+        return BitVector(4 * (len(atom) - 2), int(atom[2:], 16))
+    else:
+        return None
+
+class Evaluator:
+    """Evaluator for ground SMT-LIB terms
+
+    All terms parsed by the same evaluator share one DAG and one
+    cache.
+    """
+    def __init__(self):
+        self.terms      = {}
+        self.generation = 0
+        self.order      = {}
+
+    def _intern(self, key, kind, name, args=(), fn=None, value=None):
+        term = self.terms.get(key, None)
+        if term is None:
+            term = Term(len(self.terms) + 1, kind, name, args, fn, value)
+            self.terms[key] = term
+        return term
+
+    def constant(self, value, name=None):
+        """Term for the given value"""
+        if name is None:
+            name = str(value)
+        return self._intern((TERM_CONSTANT, value_key(value)),
+                            TERM_CONSTANT, name, value=value)
+
+    def symbol(self, name):
+        """Term for a free symbol, whose value is taken from the model"""
+        return self._intern((TERM_SYMBOL, name), TERM_SYMBOL, name)
+
+    def apply(self, name, args, indices=()):
+        """Term applying the SMT-LIB function *name* to *args*"""
+        if indices:
+            if name not in INDEXED_FUNCTIONS:
+                raise Parse_Error("unknown indexed function %s" % name)
+            builder, n_indices, arity = INDEXED_FUNCTIONS[name]
+            if len(indices) != n_indices:
+                raise Parse_Error("%s takes %u indices" % (name, n_indices))
+            if arity is None and len(args) not in (1, 2):
+                raise Parse_Error("%s takes 1 or 2 arguments" % name)
+            fn = None
+            label = "(_ %s %s)" % (name, " ".join(map(str, indices)))
+        else:
+            if name not in FUNCTIONS:
+                raise Parse_Error("unknown function %s" % name)
+            fn, arity = FUNCTIONS[name]
+            if name in CHAINABLE and len(args) < 2:
+                raise Parse_Error("%s takes at least 2 arguments" % name)
+            elif arity is None and len(args) == 0:
+                raise Parse_Error("%s needs arguments" % name)
+            label = name
+        if arity is not None and len(args) != arity:
+            raise Parse_Error("%s takes %u arguments" % (label, arity))
+
+        key = (TERM_APPLY, label, tuple(arg.uid for arg in args))
+        term = self.terms.get(key, None)
+        if term is None:
+            if fn is None:
+                fn = builder(indices)
+            term = self._intern(key, TERM_APPLY, label, tuple(args), fn)
+        return term
+
+    def parse(self, text):
+        """Parse a single term"""
+        sexprs = read_sexprs(text)
+        if len(sexprs) != 1:
+            raise Parse_Error("expected one term, got %u" % len(sexprs))
+        return self.parse_sexpr(sexprs[0])
+
+    def parse_sexpr(self, sexpr, env=None):
+        """Build the term for an s-expression (see :func:`read_sexprs`)
+
+        *env* maps let-bound names to terms.
+        """
+        # We use an explicit stack since fuzzers produce terms deep
+        # enough to hit the recursion limit.
+        results = []
+        work = [("term", sexpr, env or {})]
+        while work:
+            action, sexpr, env = work.pop()
+            if action == "term":
+                if isinstance(sexpr, str):
+                    results.append(self._parse_atom(sexpr, env))
+                elif len(sexpr) == 0:
+                    raise Parse_Error("empty application")
+                elif sexpr[0] == "_":
+                    results.append(self._parse_indexed_constant(sexpr))
+                elif sexpr[0] == "let":
+                    if len(sexpr) != 3 or not isinstance(sexpr[1], list):
+                        raise Parse_Error("malformed let")
+                    work.append(("let", sexpr, env))
+                    for binding in reversed(sexpr[1]):
+                        if not isinstance(binding, list) or \
+                           len(binding) != 2 or \
+                           not isinstance(binding[0], str):
+                            raise Parse_Error("malformed let binding")
+                        work.append(("term", binding[1], env))
+                elif sexpr[0] == "!":
+                    work.append(("term", sexpr[1], env))
+                else:
+                    work.append(("apply", sexpr, env))
+                    for arg in reversed(sexpr[1:]):
+                        work.append(("term", arg, env))
+
+            elif action == "let":
+                bindings = sexpr[1]
+                values = results[len(results) - len(bindings):]
+                del results[len(results) - len(bindings):]
+                env = dict(env)
+                for binding, value in zip(bindings, values):
+                    env[binding[0]] = value
+                work.append(("term", sexpr[2], env))
+
+            else:
+                assert action == "apply"
+                n_args = len(sexpr) - 1
+                args = results[len(results) - n_args:]
+                del results[len(results) - n_args:]
+                results.append(self._parse_application(sexpr[0], args))
+
+        assert len(results) == 1
+        return results[0]
+
+    def _parse_atom(self, atom, env):
+        if atom in env:
+            return env[atom]
+        value = _atom_value(atom)
+        if value is None:
+            if atom.startswith("|"):
+                atom = atom[1:-1]
+            return self.symbol(atom)
+        return self.constant(value, atom)
+
+    def _parse_indexed_constant(self, sexpr):
+        if len(sexpr) == 4 and \
+           sexpr[1] in ("+zero", "-zero", "+oo", "-oo", "NaN"):
+            eb = _index(sexpr[2])
+            sb = _index(sexpr[3])
+            return self.constant(_special(eb, sb, sexpr[1]),
+                                 "(_ %s %u %u)" % (sexpr[1], eb, sb))
+        elif len(sexpr) == 3 and isinstance(sexpr[1], str) and \
+             sexpr[1].startswith("bv") and sexpr[1][2:].isdigit():
+            width = _index(sexpr[2])
+            value = int(sexpr[1][2:])
+            if width < 1 or value >= 2 ** width:
+                raise Parse_Error("invalid bitvector literal")
+            return self.constant(BitVector(width, value),
+                                 "(_ %s %u)" % (sexpr[1], width))
+        else:
+            raise Parse_Error("unknown indexed constant")
+
+    def _parse_application(self, head, args):
+        if isinstance(head, str):
+            return self.apply(head, args)
+        elif len(head) >= 3 and head[0] == "_" and isinstance(head[1], str):
+            return self.apply(head[1], args,
+                              tuple(_index(i) for i in head[2:]))
+        else:
+            raise Parse_Error("malformed function application")
+
+    ######################################################################
+    # Evaluation
+
+    def _topological_order(self, term):
+        """All terms that *term* depends on (including itself)
+
+        Terms are created after their arguments, so sorting by uid
+        gives a topological order.
+        """
+        order = self.order.get(term.uid, None)
+        if order is None:
+            seen = {term.uid : term}
+            todo = [term]
+            while todo:
+                for arg in todo.pop().args:
+                    if arg.uid not in seen:
+                        seen[arg.uid] = arg
+                        todo.append(arg)
+            order = [seen[uid] for uid in sorted(seen)]
+            self.order[term.uid] = order
+        return order
+
+    def evaluate(self, term, model=None):
+        """Evaluate *term* (a :class:`Term` or a string)
+
+        *model* maps the names of free symbols to values. Raises
+        KeyError for symbols not in the model, and Unspecified if the
+        value is not specified by SMT-LIB (e.g. fp.to_real of an
+        infinity).
+        """
+        if isinstance(term, str):
+            term = self.parse(term)
+        if model is None:
+            model = {}
+
+        self.generation += 1
+        for node in self._topological_order(term):
+            if node.kind == TERM_CONSTANT:
+                continue
+
+            elif node.kind == TERM_SYMBOL:
+                if node.name not in model:
+                    raise KeyError(node.name)
+                value = model[node.name]
+                if not node.valid or \
+                   value_key(value) != value_key(node.value):
+                    node.value   = value
+                    node.valid   = True
+                    node.changed = self.generation
+
+            elif node.valid and \
+                 all(arg.changed <= node.computed for arg in node.args):
+                node.computed = self.generation
+                if instrumentation.ENABLED:
+                    instrumentation.count("smtlib.cache_hits")
+
+            else:
+                if instrumentation.ENABLED:
+                    instrumentation.count("smtlib.evaluations")
+                args = [arg.value for arg in node.args]
+                if node.name == "ite" and args[0] is not UNSPECIFIED:
+                    # Only the branch taken matters
+                    relevant = (args[0], args[1] if args[0] else args[2])
+                else:
+                    relevant = args
+                if any(arg is UNSPECIFIED for arg in relevant):
+                    value = UNSPECIFIED
+                else:
+                    try:
+                        value = node.fn(args)
+                    except Unspecified:
+                        value = UNSPECIFIED
+                if not node.valid or \
+                   (value is UNSPECIFIED) != (node.value is UNSPECIFIED) or \
+                   (value is not UNSPECIFIED and
+                    value_key(value) != value_key(node.value)):
+                    node.value   = value
+                    node.valid   = True
+                    node.changed = self.generation
+                node.computed = self.generation
+
+        if term.value is UNSPECIFIED:
+            raise Unspecified
+        return term.value
+
+def evaluate_term(text, model=None):
+    """Parse and evaluate a single ground term"""
+    return Evaluator().evaluate(text, model)
+
+def parse_model(text):
+    """Read a model as printed by solvers for (get-model)
+
+    Returns a dict mapping the names of constants to their values.
+    Only nullary define-fun are considered.
+    """
+    ev = Evaluator()
+    rv = {}
+    sexprs = read_sexprs(text)
+    if len(sexprs) == 1 and isinstance(sexprs[0], list):
+        # Either (model (define-fun ...) ...) or ((define-fun ...) ...)
+        if sexprs[0][:1] == ["model"]:
+            sexprs = sexprs[0][1:]
+        elif all(isinstance(item, list) for item in sexprs[0]):
+            sexprs = sexprs[0]
+    for sexpr in sexprs:
+        if isinstance(sexpr, list) and len(sexpr) == 5 and \
+           sexpr[0] == "define-fun" and sexpr[2] == []:
+            name = sexpr[1]
+            if name.startswith("|"):
+                name = name[1:-1]
+            rv[name] = ev.evaluate(ev.parse_sexpr(sexpr[4]), rv)
+    return rv
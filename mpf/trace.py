@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                                PYMPF                                     ##
+##                                                                          ##
+##              Copyright (C) 2020,      Florian Schanda                    ##
+##                                                                          ##
+##  This file is part of PyMPF.                                             ##
+##                                                                          ##
+##  PyMPF is free software: you can redistribute it and/or modify           ##
+##  it under the terms of the GNU General Public License as published by    ##
+##  the Free Software Foundation, either version 3 of the License, or       ##
+##  (at your option) any later version.                                     ##
+##                                                                          ##
+##  PyMPF is distributed in the hope that it will be useful,                ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with PyMPF. If not, see <http://www.gnu.org/licenses/>.           ##
+##                                                                          ##
+##############################################################################
+
+
+"""
+This module provides a trace of the rounding decisions made by
+PyMPF, for when we need to know exactly why a value was rounded the
+way it was (e.g. when a solver disagrees with us). Each decision is
+an event, a dict with the key "event" and further fields:
+
+* operation: an fp_* function was called (name, args)
+* end: the fp_* function returned (name, result)
+* from_rational: the rational q was approximated by a dyadic
+  m * 2^e (sticky means q is strictly between m and m + 1)
+* sqrt: the square root of m * 2^e was approximated by root * 2^(e / 2)
+* round: m / 2^shift was rounded to the integer kept, with the bit
+  below it (round_bit), the bits below that (sticky), whether it was
+  a tie, and if we rounded up
+* bracket: the dyadic value m * 2^e was rounded to kept * 2^lsb
+* overflow: the rounded value is too large, and we get either
+  infinity or the largest finite value
+* interval_query, interval_bound and interval: the steps of
+  :func:`mpf.floats.interval_nearest` (and the result of
+  interval_up and interval_down)
+
+Events are passed to sinks, which are any callables taking the
+event. Two sinks are provided: :class:`Ring_Buffer` keeps the events
+of the last N operations, and :class:`Logging_Sink` forwards events
+to the logging module.
+
+>>> with tracing(size=10) as ring:
+...     x = fp_add(RM_RNE, a, b)
+>>> for event in ring.events():
+...     print(event)
+
+Tracing is off unless a sink is installed. When off, each trace
+point costs a single test of :data:`ENABLED`. If the environment
+variable PYMPF_TRACE is set to a non-empty value other than "0" a
+Logging_Sink is installed on import.
+"""
+
+import os
+import json
+import logging
+import threading
+import collections
+
+ENABLED = False
+
+SINKS = []
+
+# Functions called whenever ENABLED changes
+LISTENERS = []
+
+def emit(event, **fields):
+    """Pass an event to all sinks
+
+    Only call this if :data:`ENABLED` is set.
+    """
+    fields["event"] = event
+    for sink in SINKS:
+        sink(fields)
+
+# SINKS is never modified in place, so that emit can iterate over it
+# while another thread adds or removes a sink.
+
+def add_sink(sink):
+    """Install *sink* and enable tracing"""
+    global ENABLED, SINKS
+    SINKS   = SINKS + [sink]
+    ENABLED = True
+    for listener in LISTENERS:
+        listener()
+
+def remove_sink(sink):
+    """Remove *sink*, and disable tracing if it was the last one"""
+    global ENABLED, SINKS
+    SINKS   = [other for other in SINKS if other is not sink]
+    ENABLED = len(SINKS) > 0
+    for listener in LISTENERS:
+        listener()
+
+def describe(value):
+    """Make an argument of an operation safe to keep in an event
+
+    MPFs are mutable, so we keep their repr instead.
+    """
+    if hasattr(value, "bv") and hasattr(value, "unpack"):
+        return repr(value)
+    else:
+        return value
+
+# The nesting depth of operations in each thread
+_LOCAL = threading.local()
+
+class operation:
+    """Context manager for one call of an fp_* function
+
+    Emits an operation event with *name* and *args* on entry and an
+    end event with :attr:`result` on exit, unless we are already
+    inside an operation (e.g. fp_interval calls fp_nextUp), so that
+    the events of nested calls belong to the outermost one.
+    """
+    # pylint: disable=invalid-name
+    def __init__(self, name, args):
+        self.name   = name
+        self.args   = args
+        self.result = None
+
+    def __enter__(self):
+        depth = getattr(_LOCAL, "depth", 0)
+        if depth == 0:
+            emit("operation",
+                 name=self.name,
+                 args=[describe(arg) for arg in self.args])
+        _LOCAL.depth = depth + 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _LOCAL.depth -= 1
+        if _LOCAL.depth == 0:
+            emit("end",
+                 name=self.name,
+                 result=describe(self.result))
+        return False
+
+def _json_default(value):
+    return str(value)
+
+def to_json(event):
+    """Return an event as a JSON string
+
+    Rationals and other values that are not JSON types are written as
+    strings.
+    """
+    return json.dumps(event, sort_keys=True, default=_json_default)
+
+class Ring_Buffer:
+    """Sink keeping the events of the last *size* operations
+
+    Events from outside any operation (e.g. from calling
+    MPF.from_rational directly) are kept as an operation of their
+    own. The events of an operation are collected separately in each
+    thread and only added when the operation ends, so operations of
+    several threads are not mixed up, and are kept in the order they
+    ended.
+    """
+    def __init__(self, size=1000):
+        assert size >= 1
+        self.buffer = collections.deque(maxlen=size)
+        # The events of the current operation in each thread
+        self.local  = threading.local()
+
+    def __call__(self, event):
+        kind    = event["event"]
+        current = getattr(self.local, "current", None)
+        if kind == "operation":
+            self.local.current = [event]
+        elif current is None:
+            # Outside of any operation
+            self.local.current = [event]
+            self.buffer.append(self.local.current)
+        else:
+            current.append(event)
+            if kind == "end":
+                self.buffer.append(current)
+                self.local.current = None
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def clear(self):
+        self.buffer.clear()
+        self.local = threading.local()
+
+    def operations(self):
+        """Return the captured operations, oldest first
+
+        Each operation is a list of events, starting with its
+        operation event and ending with its end event.
+        """
+        return [list(events) for events in self.buffer]
+
+    def events(self):
+        """Return all captured events, oldest first"""
+        return [event for events in self.buffer for event in events]
+
+    def dump(self, fd):
+        """Write all captured events to *fd*, one JSON object per line"""
+        for event in self.events():
+            fd.write(to_json(event) + "\n")
+
+class Logging_Sink:
+    """Sink forwarding events to a logger (by default mpf.trace)
+
+    Events are logged at *level*, with the event in the "trace"
+    attribute of the log record.
+    """
+    def __init__(self, logger=None, level=logging.DEBUG):
+        if logger is None:
+            logger = logging.getLogger("mpf.trace")
+        self.logger = logger
+        self.level  = level
+
+    def __call__(self, event):
+        if self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, "%s", to_json(event),
+                            extra={"trace" : event})
+
+class tracing:
+    """Context manager installing a sink
+
+    If *sink* is not given a new :class:`Ring_Buffer` of *size*
+    operations is used. The sink is returned on entry and removed on
+    exit.
+    """
+    # pylint: disable=invalid-name
+    def __init__(self, sink=None, size=1000):
+        if sink is None:
+            sink = Ring_Buffer(size)
+        self.sink = sink
+
+    def __enter__(self):
+        add_sink(self.sink)
+        return self.sink
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        remove_sink(self.sink)
+        return False
+
+if os.environ.get("PYMPF_TRACE", "") not in ("", "0"):
+    add_sink(Logging_Sink())